@@ -5,7 +5,9 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy import text
 from .db import engine, Base
-from .routers import books, chapters, artifacts, jobs, generate, providers, flashcards
+from .redis_pool import aclose_redis
+from .services.llm.http import aclose_clients
+from .routers import books, chapters, artifacts, jobs, generate, providers, flashcards, usage
 
 IMAGES_ROOT = "/data/images"
 
@@ -19,10 +21,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _add_missing_columns(sync_conn) -> None:
+    """create_all() never alters existing tables; add columns/indexes introduced since the DB was created."""
+    if sync_conn.dialect.name != "sqlite":
+        return
+    for table in Base.metadata.sorted_tables:
+        rows = sync_conn.execute(text(f'PRAGMA table_info("{table.name}")')).fetchall()
+        existing = {r[1] for r in rows}
+        if not existing:
+            continue
+        for col in table.columns:
+            if col.name in existing:
+                continue
+            col_type = col.type.compile(dialect=sync_conn.dialect)
+            sync_conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{col.name}" {col_type}'))
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
 @app.on_event("startup")
 async def startup():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await aclose_clients()
+    await aclose_redis()
 
 @app.get("/health")
 async def health():
@@ -35,6 +60,7 @@ app.include_router(jobs.router)
 app.include_router(generate.router)
 app.include_router(providers.router)
 app.include_router(flashcards.router)
+app.include_router(usage.router)
 
 # Serve extracted images as static files
 os.makedirs(IMAGES_ROOT, exist_ok=True)
@@ -1,5 +1,5 @@
 import datetime as dt
-from sqlalchemy import String, Integer, Float, DateTime, ForeignKey, Text, JSON, UniqueConstraint
+from sqlalchemy import String, Integer, Float, DateTime, ForeignKey, Text, JSON, UniqueConstraint, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from .db import Base
 
@@ -9,6 +9,8 @@ class Book(Base):
     title: Mapped[str] = mapped_column(String(512), default="Untitled")
     author: Mapped[str | None] = mapped_column(String(256), nullable=True)
     source_type: Mapped[str] = mapped_column(String(32), default="unknown")  # pdf|epub|txt|md
+    content_hash: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)  # sha256 of the uploaded file
+    ingest_report: Mapped[dict | None] = mapped_column(JSON, nullable=True)  # extraction/chapterize timings
     created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=dt.datetime.utcnow)
 
     chapters: Mapped[list["Chapter"]] = relationship(back_populates="book", cascade="all, delete-orphan")
@@ -35,6 +37,7 @@ class Chunk(Base):
     chapter_id: Mapped[int] = mapped_column(ForeignKey("chapters.id", ondelete="CASCADE"), index=True)
     chunk_index: Mapped[int] = mapped_column(Integer)
     text: Mapped[str] = mapped_column(Text)
+    token_count: Mapped[int] = mapped_column(Integer, default=0)  # estimated for the default model at ingest
 
     chapter: Mapped["Chapter"] = relationship(back_populates="chunks")
     __table_args__ = (UniqueConstraint("chapter_id", "chunk_index", name="uq_chunk_chapter_index"),)
@@ -49,10 +52,23 @@ class Artifact(Base):
     provider: Mapped[str] = mapped_column(String(64))
     model: Mapped[str] = mapped_column(String(128))
     params_hash: Mapped[str] = mapped_column(String(64))
+    source_hash: Mapped[str | None] = mapped_column(String(64), nullable=True)  # chapter fingerprint the artifact was generated from
     version: Mapped[int] = mapped_column(Integer, default=1)
+    usage: Mapped[dict | None] = mapped_column(JSON, nullable=True)  # see services.llm.usage; "shared" is the chapter's map/merge calls
     created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=dt.datetime.utcnow)
 
     chapter: Mapped["Chapter"] = relationship(back_populates="artifacts")
+    __table_args__ = (Index("ix_artifact_chapter_type_params", "chapter_id", "type", "params_hash"),)
+
+class MapNote(Base):
+    """Cached map-phase notes for one chunk text under one provider/model/temperature/prompt version."""
+    __tablename__ = "map_notes"
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)  # see services.generate.map_cache.notes_key
+    provider: Mapped[str] = mapped_column(String(64))
+    model: Mapped[str] = mapped_column(String(128))
+    notes: Mapped[dict] = mapped_column(JSON)
+    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=dt.datetime.utcnow)
+    last_used_at: Mapped[dt.datetime] = mapped_column(DateTime, default=dt.datetime.utcnow, index=True)
 
 class Image(Base):
     __tablename__ = "images"
@@ -88,8 +104,12 @@ class Job(Base):
     __tablename__ = "jobs"
     id: Mapped[str] = mapped_column(String(64), primary_key=True)  # rq job id
     status: Mapped[str] = mapped_column(String(32), default="queued")  # queued|started|finished|failed
+    task: Mapped[str | None] = mapped_column(String(128), nullable=True)  # RQ function, for resume
     progress: Mapped[int] = mapped_column(Integer, default=0)
     message: Mapped[str | None] = mapped_column(String(512), nullable=True)
     payload: Mapped[dict] = mapped_column(JSON, default=dict)
+    usage: Mapped[dict | None] = mapped_column(JSON, nullable=True)  # provider calls made by the job, by phase
     created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=dt.datetime.utcnow)
+    started_at: Mapped[dt.datetime | None] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[dt.datetime | None] = mapped_column(DateTime, nullable=True)
     updated_at: Mapped[dt.datetime] = mapped_column(DateTime, default=dt.datetime.utcnow)
@@ -0,0 +1,24 @@
+from __future__ import annotations
+import asyncio
+import weakref
+from redis.asyncio import Redis
+from .settings import settings
+
+# redis.asyncio connections, like httpx ones, belong to the loop that opened them.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Redis]" = weakref.WeakKeyDictionary()
+
+
+def get_redis() -> Redis:
+    """Shared async Redis client for the running loop (rate limiter, job events)."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = Redis.from_url(settings.redis_url)
+    return client
+
+
+async def aclose_redis() -> None:
+    """Close the client opened on the running loop (app shutdown, end of a worker job)."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
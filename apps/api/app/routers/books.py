@@ -1,38 +1,130 @@
 from __future__ import annotations
-import os, shutil, uuid
+import hashlib, os, uuid
 from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from ..db import get_db
 from ..models import Book
-from ..schemas import BookOut
-from ..services.ingest.ingest import ingest_book
+from ..schemas import BookOut, RechapterizeRequest
+from ..services.ingest.extract_cache import has_extract
+from ..services.ingest.ingest import SUPPORTED, active_generation_jobs, count_artifacts
+from ..workers.queue import enqueue_coalesced, enqueue_tracked
 
 router = APIRouter(prefix="/books", tags=["books"])
 
 UPLOAD_DIR = "/data/uploads"
+UPLOAD_CHUNK = 1024 * 1024
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+async def _save_upload(file: UploadFile, ext: str) -> tuple[str, str]:
+    """Stream the upload to disk while hashing it. Returns (path, sha256 hex)."""
+    h = hashlib.sha256()
+    tmp_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.part")
+    try:
+        with open(tmp_path, "wb") as f:
+            while True:
+                block = await file.read(UPLOAD_CHUNK)
+                if not block:
+                    break
+                h.update(block)
+                f.write(block)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    digest = h.hexdigest()
+    # Content-addressed name: identical uploads land on the same file.
+    path = os.path.join(UPLOAD_DIR, f"{digest}{ext}")
+    os.replace(tmp_path, path)
+    return path, digest
+
 @router.get("", response_model=list[BookOut])
 async def list_books(db: AsyncSession = Depends(get_db)):
     res = await db.execute(select(Book).order_by(Book.created_at.desc()))
     return res.scalars().all()
 
-@router.post("/ingest", response_model=BookOut)
+@router.get("/ingest-reports")
+async def list_ingest_reports(winner: str | None = None, db: AsyncSession = Depends(get_db)):
+    """Chapterize summaries across the library, slowest first; filter by winning strategy."""
+    books = (await db.execute(select(Book).where(Book.ingest_report.is_not(None)))).scalars().all()
+    out = []
+    for b in books:
+        report = b.ingest_report or {}
+        ch = report.get("chapterize") or {}
+        if winner and ch.get("winner") != winner:
+            continue
+        out.append({
+            "book_id": b.id,
+            "title": b.title,
+            "extract_ms": report.get("extract_ms"),
+            "chapterize_ms": ch.get("total_ms"),
+            "winner": ch.get("winner"),
+            "chapters": ch.get("chapters"),
+        })
+    out.sort(key=lambda r: r["chapterize_ms"] or 0, reverse=True)
+    return out
+
+@router.get("/{book_id}/ingest-report")
+async def get_ingest_report(book_id: int, db: AsyncSession = Depends(get_db)):
+    book = (await db.execute(select(Book).where(Book.id==book_id))).scalar_one_or_none()
+    if not book:
+        raise HTTPException(404, "Book not found")
+    if not book.ingest_report:
+        raise HTTPException(404, "No ingest report for this book")
+    return {"book_id": book.id, **book.ingest_report}
+
+@router.post("/{book_id}/rechapterize")
+async def rechapterize(book_id: int, req: RechapterizeRequest, db: AsyncSession = Depends(get_db)):
+    """Re-detect chapters from the cached extraction; the source file is not re-parsed."""
+    book = (await db.execute(select(Book).where(Book.id==book_id))).scalar_one_or_none()
+    if not book:
+        raise HTTPException(404, "Book not found")
+    if not has_extract(book.content_hash):
+        raise HTTPException(409, "No extraction cache for this book; re-upload it with force to rebuild")
+    running = await active_generation_jobs(db, book_id)
+    if running:
+        raise HTTPException(409, f"Generation job {running[0]} is queued or running for this book; wait for it to finish")
+    if not req.discard_artifacts:
+        artifacts = await count_artifacts(db, book_id)
+        if artifacts:
+            raise HTTPException(409, f"Book has {artifacts} generated artifacts; set discard_artifacts to replace its chapters")
+
+    # The job checks both again when it runs.
+    payload = {"kind": "rechapterize", "book_id": book_id, **req.model_dump()}
+    job_id = await enqueue_tracked(db, "app.workers.tasks.rechapterize_job", payload)
+    return {"job_id": job_id}
+
+@router.post("/ingest")
 async def ingest(
     file: UploadFile = File(...),
     title: str | None = Form(None),
     author: str | None = Form(None),
+    force: bool = Form(False),
     db: AsyncSession = Depends(get_db),
 ):
     ext = os.path.splitext(file.filename or "")[1].lower()
-    if ext not in {".pdf",".epub",".txt",".md"}:
+    if ext not in SUPPORTED:
         raise HTTPException(status_code=400, detail="Unsupported file type. Use PDF/EPUB/TXT/MD.")
 
-    uid = uuid.uuid4().hex
-    path = os.path.join(UPLOAD_DIR, f"{uid}{ext}")
-    with open(path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+    path, content_hash = await _save_upload(file, ext)
+
+    if not force:
+        existing = (await db.execute(
+            select(Book).where(Book.content_hash==content_hash).order_by(Book.created_at.desc()).limit(1)
+        )).scalar_one_or_none()
+        if existing:
+            return {"job_id": None, "book_id": existing.id, "deduplicated": True}
 
-    book = await ingest_book(db, path, title=title, author=author)
-    return book
+    # Parsing/chapterizing is CPU-heavy; run it on the worker, not the event loop.
+    payload = {
+        "kind": "ingest",
+        "path": path,
+        "filename": file.filename,
+        "title": title,
+        "author": author,
+        "content_hash": content_hash,
+    }
+    # Keyed on the content alone: an identical upload while this one is queued or running follows its job.
+    job_id, deduplicated = await enqueue_coalesced(
+        db, "app.workers.tasks.ingest_job", payload, key={"content_hash": content_hash}
+    )
+    return {"job_id": job_id, "book_id": None, "deduplicated": deduplicated}
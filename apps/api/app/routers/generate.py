@@ -1,20 +1,17 @@
 from __future__ import annotations
-import datetime as dt
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from rq import Queue
-from redis import Redis
 from ..db import get_db
-from ..models import Book, Job
-from ..schemas import GenerateRequest
+from ..models import Book
+from ..schemas import GenerateBookRequest, GenerateRequest
 from ..settings import settings
+from ..workers.queue import enqueue_coalesced
 
 router = APIRouter(prefix="/generate", tags=["generate"])
 
-def _queue() -> Queue:
-    redis = Redis.from_url(settings.redis_url)
-    return Queue("coursegen", connection=redis, default_timeout=3600)
+# A batch job re-enqueues itself until the batch completes (24h window), so its claim must outlive that.
+BATCH_CLAIM_TTL = 26 * 3600
 
 @router.post("")
 async def enqueue(req: GenerateRequest, db: AsyncSession = Depends(get_db)):
@@ -23,24 +20,38 @@ async def enqueue(req: GenerateRequest, db: AsyncSession = Depends(get_db)):
     if not book:
         raise HTTPException(404, "Book not found")
 
-    q = _queue()
-    job = q.enqueue(
-        "app.workers.tasks.generate_job",
-        req.model_dump(),
-        job_timeout=3600,
-        result_ttl=3600,
-    )
+    # An identical request that is still queued or running gets that job's id back.
+    job_id, deduplicated = await enqueue_coalesced(db, "app.workers.tasks.generate_job", req.model_dump())
+    return {"job_id": job_id, "deduplicated": deduplicated}
 
-    row = Job(
-        id=job.id,
-        status="queued",
-        progress=0,
-        message="Queued",
-        payload=req.model_dump(),
-        created_at=dt.datetime.utcnow(),
-        updated_at=dt.datetime.utcnow(),
-    )
-    db.add(row)
-    await db.commit()
+@router.post("/book")
+async def enqueue_book(req: GenerateBookRequest, db: AsyncSession = Depends(get_db)):
+    """One job for many chapters; per-chapter progress lands in the job payload under "chapters"."""
+    book = (await db.execute(select(Book).where(Book.id==req.book_id))).scalar_one_or_none()
+    if not book:
+        raise HTTPException(404, "Book not found")
+
+    job_id, deduplicated = await enqueue_coalesced(db, "app.workers.tasks.generate_book_job", req.model_dump())
+    return {"job_id": job_id, "deduplicated": deduplicated}
 
-    return {"job_id": job.id}
+@router.post("/batch")
+async def enqueue_batch(req: GenerateBookRequest, db: AsyncSession = Depends(get_db)):
+    """Like /generate/book, but the map phase goes through the OpenAI Batch API (cheaper, slower).
+
+    Batch results are handed to the reduce phase through the map-notes cache, so
+    both are required.
+    """
+    book = (await db.execute(select(Book).where(Book.id==req.book_id))).scalar_one_or_none()
+    if not book:
+        raise HTTPException(404, "Book not found")
+    if (req.provider_name or settings.llm_provider) != "openai":
+        raise HTTPException(400, "Batch generation requires the openai provider")
+    if not settings.map_cache_enabled:
+        raise HTTPException(400, "Batch generation requires the map cache (COURSEGEN_MAP_CACHE_ENABLED)")
+
+    payload = req.model_dump()
+    payload["provider_name"] = "openai"
+    job_id, deduplicated = await enqueue_coalesced(
+        db, "app.workers.tasks.batch_generate_job", payload, claim_ttl=BATCH_CLAIM_TTL,
+    )
+    return {"job_id": job_id, "deduplicated": deduplicated}
@@ -1,17 +1,110 @@
 from __future__ import annotations
 import datetime as dt
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update
 from ..db import get_db
 from ..models import Job
-from ..schemas import JobOut
+from ..schemas import GenerateBookRequest, GenerateRequest, JobOut
+from ..workers import events, job_state
+from ..workers.queue import JOB_TIMEOUT, resume_tracked
 
 router = APIRouter(prefix="/jobs", tags=["jobs"])
 
-@router.get("/{job_id}", response_model=JobOut)
-async def get_job(job_id: str, db: AsyncSession = Depends(get_db)):
+# Comment line sent when nothing happened for this long, so proxies keep the connection open.
+KEEPALIVE_MS = 15_000
+
+async def _load_job(job_id: str, db: AsyncSession) -> JobOut:
+    """Live state from Redis when it has the whole job, else the (written-behind) Job row."""
+    state = await job_state.load(job_id)
+    if state and "created_at" in state and "status" in state:
+        return JobOut.model_validate({"progress": 0, "message": None, **state})
     job = (await db.execute(select(Job).where(Job.id==job_id))).scalar_one_or_none()
     if not job:
         raise HTTPException(404, "Job not found")
-    return job
+    return JobOut.model_validate(job, from_attributes=True)
+
+@router.get("/{job_id}", response_model=JobOut)
+async def get_job(job_id: str, db: AsyncSession = Depends(get_db)):
+    return await _load_job(job_id, db)
+
+def _sse(event_id: str, data: dict) -> str:
+    return f"id: {event_id}\nevent: job\ndata: {json.dumps(data)}\n\n"
+
+@router.get("/{job_id}/events")
+async def job_events(
+    job_id: str,
+    request: Request,
+    last_event_id: str | None = Header(None),
+    after: str | None = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """Server-sent events for a job: status, progress, message and payload changes as the worker makes them.
+
+    Events are replayed from the start, or after the id in the Last-Event-ID
+    header (``?after=`` for clients that cannot set it). The stream ends after a
+    finished/failed event. Jobs with no events (expired or older) get one
+    snapshot of the job instead.
+    """
+    cursor = last_event_id or after or "0"
+    latest = await events.last(job_id)
+    if latest is None:
+        snapshot = (await _load_job(job_id, db)).model_dump(mode="json")
+        return StreamingResponse(iter([_sse("0", snapshot)]), media_type="text/event-stream")
+    if latest[1].get("status") in events.TERMINAL_STATUSES and latest[0] == cursor:
+        # Client already saw the end; 204 tells EventSource to stop reconnecting.
+        return Response(status_code=204)
+    await db.close()  # the stream below never touches the DB
+
+    async def _stream():
+        nonlocal cursor
+        yield "retry: 2000\n\n"
+        while not await request.is_disconnected():
+            batch = await events.read(job_id, cursor, block_ms=KEEPALIVE_MS)
+            if not batch:
+                yield ": keep-alive\n\n"
+                continue
+            for event_id, data in batch:
+                cursor = event_id
+                yield _sse(event_id, data)
+                if data.get("status") in events.TERMINAL_STATUSES:
+                    return
+
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Tasks that checkpoint their work, and the request model their payload was built from
+# (the rest of a Job's payload is progress written by the worker).
+RESUMABLE = {
+    "app.workers.tasks.generate_job": GenerateRequest,
+    "app.workers.tasks.generate_book_job": GenerateBookRequest,
+    "app.workers.tasks.batch_generate_job": GenerateBookRequest,
+}
+
+@router.post("/{job_id}/resume")
+async def resume_job(job_id: str, db: AsyncSession = Depends(get_db)):
+    """Run a failed generation job again from its checkpoint; finished map calls and artifacts are not redone.
+
+    Also accepts whole-book jobs that finished with failed chapters, and jobs
+    whose worker died (no update for longer than the job timeout).
+    """
+    row = (await db.execute(select(Job).where(Job.id==job_id))).scalar_one_or_none()
+    if not row:
+        raise HTTPException(404, "Job not found")
+    if row.task not in RESUMABLE:
+        raise HTTPException(400, "Only generation jobs can be resumed")
+    job = await _load_job(job_id, db)
+    failed_chapters = any(c.get("status") == "failed" for c in (job.payload.get("chapters") or {}).values())
+    abandoned = job.status == "started" and dt.datetime.utcnow() - job.updated_at > dt.timedelta(seconds=JOB_TIMEOUT)
+    if not (job.status == "failed" or (job.status == "finished" and failed_chapters) or abandoned):
+        raise HTTPException(409, f"Job is {job.status}; nothing to resume")
+
+    fields = RESUMABLE[row.task].model_fields
+    payload = {k: v for k, v in (row.payload or {}).items() if k in fields}
+    resumed_id, deduplicated = await resume_tracked(db, row, payload)
+    return {"job_id": resumed_id, "deduplicated": deduplicated}
@@ -1,5 +1,6 @@
 from __future__ import annotations
 from fastapi import APIRouter
+from ..services.llm.ratelimit import shared_limiter_state
 from ..settings import settings
 
 router = APIRouter(prefix="/providers", tags=["providers"])
@@ -13,3 +14,8 @@ async def list_providers():
             {"id": "ollama", "models": [settings.ollama_model]},
         ],
     }
+
+@router.get("/rate-limits")
+async def rate_limits():
+    """Shared limiter state per provider/model: AIMD concurrency, 429 pause and permit wait totals."""
+    return await shared_limiter_state()
@@ -0,0 +1,54 @@
+from __future__ import annotations
+import datetime as dt
+from collections import defaultdict
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
+from ..db import get_db
+from ..models import Artifact, Chapter, Job
+from ..services.llm.usage import Usage, UsageRecorder
+
+router = APIRouter(prefix="/usage", tags=["usage"])
+
+@router.get("")
+async def usage_summary(book_id: int | None = None, since: dt.datetime | None = None, db: AsyncSession = Depends(get_db)):
+    """Provider usage (tokens, latency, retries, cost) summed over jobs and artifacts.
+
+    by_book and by_phase come from jobs, so shared map/merge calls are counted
+    once. by_artifact_type sums each artifact's own reduce calls.
+    """
+    # Filtered in SQL, and only the two columns needed: the jobs table grows with every request.
+    job_book_col = func.json_extract(Job.payload, "$.book_id")
+    # json_type also skips JSON null, which is what an unset JSON column holds (IS NOT NULL does not).
+    q = select(job_book_col, Job.usage).where(func.json_type(Job.usage) == "object")
+    if book_id is not None:
+        q = q.where(job_book_col == book_id)
+    if since is not None:
+        q = q.where(Job.created_at >= since)
+    total = UsageRecorder()
+    by_book: dict[int, UsageRecorder] = defaultdict(UsageRecorder)
+    jobs = 0
+    for job_book, job_usage in (await db.execute(q)).all():
+        rec = UsageRecorder.from_dict(job_usage)
+        total.merge(rec)
+        if job_book is not None:
+            by_book[job_book].merge(rec)
+        jobs += 1
+
+    q = select(Artifact.type, Artifact.usage).where(Artifact.usage.is_not(None))
+    if book_id is not None:
+        q = q.join(Chapter, Artifact.chapter_id==Chapter.id).where(Chapter.book_id==book_id)
+    if since is not None:
+        q = q.where(Artifact.created_at >= since)
+    by_type: dict[str, Usage] = defaultdict(Usage)
+    artifacts: dict[str, int] = defaultdict(int)
+    for artifact_type, usage in (await db.execute(q)).all():
+        by_type[artifact_type].add(Usage.from_dict(usage))
+        artifacts[artifact_type] += 1
+
+    return {
+        "jobs": jobs,
+        **total.as_dict(),
+        "by_book": {str(b): rec.total.as_dict() for b, rec in sorted(by_book.items())},
+        "by_artifact_type": {t: {"artifacts": artifacts[t], **u.as_dict()} for t, u in sorted(by_type.items())},
+    }
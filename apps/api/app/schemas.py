@@ -36,6 +36,7 @@ class ArtifactOut(BaseModel):
     model: str
     params_hash: str
     version: int
+    usage: dict[str, Any] | None = None
     created_at: dt.datetime
 
 class GenerateRequest(BaseModel):
@@ -50,6 +51,26 @@ class GenerateRequest(BaseModel):
     provider_name: str | None = Field(None, alias="provider")
     model: str | None = None
     temperature: float = 0.3
+    fresh: bool = False  # sample again even if an identical artifact exists
+
+class GenerateBookRequest(BaseModel):
+    model_config = {"populate_by_name": True}
+    book_id: int
+    chapter_indices: list[int] | None = None  # None = every chapter
+    outputs: list[ArtifactType]
+    difficulty: Literal["beginner", "intermediate", "advanced"] = "intermediate"
+    tone: Literal["tutor", "socratic", "concise"] = "tutor"
+    length: Literal["short", "medium", "long"] = "medium"
+    include_code: bool = True
+    provider_name: str | None = Field(None, alias="provider")
+    model: str | None = None
+    temperature: float = 0.3
+    fresh: bool = False
+
+class RechapterizeRequest(BaseModel):
+    min_chapter_chars: int = Field(2000, ge=0)
+    strategy: Literal["toc_pages", "toc_titles", "printed_toc", "heading_regex", "page_fallback", "single_section"] | None = None
+    discard_artifacts: bool = False  # chapters with generated artifacts are only replaced when set
 
 class FlashcardReviewOut(BaseModel):
     card_index: int
@@ -77,5 +98,8 @@ class JobOut(BaseModel):
     progress: int
     message: str | None
     payload: dict[str, Any]
+    usage: dict[str, Any] | None = None
     created_at: dt.datetime
     updated_at: dt.datetime
+    started_at: dt.datetime | None = None
+    finished_at: dt.datetime | None = None
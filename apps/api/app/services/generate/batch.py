@@ -0,0 +1,107 @@
+from __future__ import annotations
+import logging
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ...models import Chapter, Chunk
+from ...settings import settings
+from ..llm.openai_provider import OpenAIProvider
+from ..llm.usage import phase
+from .engine import _parse_notes
+from .map_cache import MapNotesCache
+from .prompts import map_prompt
+
+logger = logging.getLogger(__name__)
+
+# Batch statuses after which the batch will not change any more.
+TERMINAL = {"completed", "failed", "expired", "cancelled"}
+
+
+def _cache(session: AsyncSession, model: str | None, temperature: float) -> MapNotesCache:
+    return MapNotesCache(
+        session,
+        provider="openai",
+        model=model or settings.openai_model,
+        temperature=temperature,
+    )
+
+
+async def _chunks(session: AsyncSession, book_id: int, chapter_indices: list[int] | None) -> list[Chunk]:
+    q = (
+        select(Chunk)
+        .join(Chapter, Chunk.chapter_id==Chapter.id)
+        .where(Chapter.book_id==book_id)
+        .order_by(Chapter.index.asc(), Chunk.chunk_index.asc())
+    )
+    if chapter_indices:
+        q = q.where(Chapter.index.in_(chapter_indices))
+    return list((await session.execute(q)).scalars().all())
+
+
+async def submit_map_batch(
+    session: AsyncSession,
+    *,
+    book_id: int,
+    chapter_indices: list[int] | None,
+    model: str | None,
+    temperature: float,
+) -> dict | None:
+    """Submit one OpenAI batch with the map prompt of every chunk not already in the map cache.
+
+    Returns the state to persist ({"batch_id", "status", "requests"}), or None when
+    every chunk is already cached and the reduce phase can start right away.
+    """
+    cache = _cache(session, model, temperature)
+    chunks = await _chunks(session, book_id, chapter_indices)
+    await cache.prefetch([c.text for c in chunks])
+    await session.commit()
+
+    requests: list[tuple[str, str, str, dict]] = []
+    seen: set[str] = set()
+    for c in chunks:
+        key = cache.key(c.text)
+        if cache.get(key) is not None or key in seen:
+            continue
+        seen.add(key)
+        system, user = map_prompt(c.text)
+        # custom_id is the chunk id; results are matched back to chunk text (and cache key) by it.
+        requests.append((str(c.id), system, user, {"model": model, "temperature": temperature}))
+    if not requests:
+        return None
+
+    batch_id = await OpenAIProvider().submit_batch(requests, metadata={"book_id": str(book_id)})
+    logger.info("Submitted map batch %s for book %s (%d requests)", batch_id, book_id, len(requests))
+    return {"batch_id": batch_id, "status": "validating", "requests": len(requests)}
+
+
+async def poll_map_batch(
+    session: AsyncSession,
+    state: dict,
+    *,
+    model: str | None,
+    temperature: float,
+) -> dict:
+    """Refresh batch state; once completed, store every result in the map-notes cache.
+
+    Safe to call repeatedly: results are only ingested once (``state["stored"]``).
+    """
+    provider = OpenAIProvider()
+    batch = await provider.get_batch(state["batch_id"])
+    counts = batch.get("request_counts") or {}
+    state = {**state, "status": batch.get("status"), "completed": counts.get("completed", 0), "failed": counts.get("failed", 0)}
+    if state["status"] != "completed" or state.get("stored") is not None:
+        return state
+
+    with phase("map_batch"):
+        results = await provider.batch_results(batch)
+    ids = [int(cid) for cid in results if cid.isdigit()]
+    texts = dict((await session.execute(select(Chunk.id, Chunk.text).where(Chunk.id.in_(ids)))).all()) if ids else {}
+    cache = _cache(session, model, temperature)
+    for cid, out in results.items():
+        text = texts.get(int(cid)) if cid.isdigit() else None
+        notes, parsed = _parse_notes(out)
+        # Chunks whose result is missing or unparseable are simply mapped live later.
+        if text is not None and parsed:
+            cache.put(cache.key(text), notes)
+    await cache.flush()
+    await session.commit()
+    return {**state, "stored": cache.stats.stored}
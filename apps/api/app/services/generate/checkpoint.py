@@ -0,0 +1,69 @@
+from __future__ import annotations
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any
+from redis.exceptions import RedisError
+from ...redis_pool import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "coursegen:job"
+CHECKPOINT_TTL_S = 7 * 24 * 3600  # refreshed on every save; as long as a failed job stays resumable
+
+
+def _key(job_id: str) -> str:
+    return f"{KEY_PREFIX}:{job_id}:checkpoint"
+
+
+@dataclass
+class Checkpoint:
+    """Results of a job's finished LLM calls, saved as each one lands.
+
+    A retried or resumed run of the same job loads them up front and only calls
+    the provider for work that was still in flight. Fields are
+    ``<scope><kind>:<key>``: map and merge notes by cache key, artifact ids by
+    type; whole-book jobs scope each chapter (``scoped("ch3:")``). Without a
+    job id nothing is saved. Redis errors are logged, never raised: a lost
+    checkpoint only costs the calls it would have saved.
+    """
+    job_id: str | None = None
+    scope: str = ""
+    _saved: dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    async def load(cls, job_id: str) -> Checkpoint:
+        try:
+            raw = await get_redis().hgetall(_key(job_id))
+        except RedisError:
+            logger.warning("Could not load checkpoint for job %s", job_id, exc_info=True)
+            raw = {}
+        return cls(job_id, _saved={k.decode(): json.loads(v) for k, v in raw.items()})
+
+    def scoped(self, scope: str) -> Checkpoint:
+        """A view whose fields are prefixed with ``scope``, sharing this one's saved results."""
+        return Checkpoint(self.job_id, self.scope + scope, self._saved)
+
+    def get(self, kind: str, key: str) -> Any | None:
+        return self._saved.get(f"{self.scope}{kind}:{key}")
+
+    async def put(self, kind: str, key: str, value: Any) -> None:
+        name = f"{self.scope}{kind}:{key}"
+        self._saved[name] = value
+        if self.job_id is None:
+            return
+        try:
+            async with get_redis().pipeline(transaction=False) as pipe:
+                pipe.hset(_key(self.job_id), name, json.dumps(value))
+                pipe.expire(_key(self.job_id), CHECKPOINT_TTL_S)
+                await pipe.execute()
+        except RedisError:
+            logger.warning("Could not save checkpoint for job %s", self.job_id, exc_info=True)
+
+
+async def clear(job_id: str) -> None:
+    """Drop a job's checkpoint once nothing is left to resume."""
+    try:
+        await get_redis().delete(_key(job_id))
+    except RedisError:
+        logger.warning("Could not clear checkpoint for job %s", job_id, exc_info=True)
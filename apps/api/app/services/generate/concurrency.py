@@ -0,0 +1,22 @@
+from __future__ import annotations
+import asyncio
+from typing import Awaitable, TypeVar
+
+T = TypeVar("T")
+
+
+async def gather_or_cancel(*aws: Awaitable[T]) -> list[T]:
+    """Like asyncio.gather, but the first failure cancels the other calls and waits for them.
+
+    Plain gather leaves the rest running after it raises; they would go on
+    writing artifacts and checkpoint entries through a session the caller has
+    already closed, or alongside the retry it schedules.
+    """
+    tasks = [asyncio.ensure_future(a) for a in aws]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
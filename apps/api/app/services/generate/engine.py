@@ -1,13 +1,24 @@
 from __future__ import annotations
-import asyncio, hashlib, json, re
+import asyncio, contextlib, hashlib, json, logging, re, time
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from ..llm.openai_provider import OpenAIProvider
 from ..llm.ollama_provider import OllamaProvider
+from ..llm.base import is_transient
+from ..llm.ratelimit import limiter_stats
+from ..llm.streaming import collect_stream
+from ..llm.tokens import default_model, get_tokenizer, reduce_token_budget
+from ..llm.usage import new_recorder, phase, track
 from ...settings import settings
 from ...models import Chapter, Chunk, Artifact
-from .prompts import map_prompt, reduce_prompt
+from .checkpoint import Checkpoint
+from .concurrency import gather_or_cancel
+from .map_cache import MapNotesCache
+from .prompts import MERGE_PROMPT_VERSION, map_prompt, merge_prompt, reduce_prompt
 from .render import to_markdown
+from .tree_reduce import tree_reduce
+
+logger = logging.getLogger(__name__)
 
 _CODE_FENCE_RE = re.compile(r"^```(?:json)?\s*\n?(.*?)\n?\s*```$", re.DOTALL)
 
@@ -16,10 +27,27 @@ def _strip_code_fence(text: str) -> str:
     m = _CODE_FENCE_RE.match(text.strip())
     return m.group(1).strip() if m else text
 
+def _parse_notes(out: dict) -> tuple[dict, bool]:
+    """Notes dict from a map/merge response, and whether it parsed (only parsed notes are cached)."""
+    if "raw_text" in out and isinstance(out["raw_text"], str):
+        try:
+            return json.loads(_strip_code_fence(out["raw_text"])), True
+        except Exception:
+            return {"important_points":[out["raw_text"]], "concepts":[], "definitions":[], "examples":[], "pitfalls":[]}, False
+    return out, True
+
 def _hash_params(d: dict) -> str:
     s = json.dumps(d, sort_keys=True)
     return hashlib.sha256(s.encode("utf-8")).hexdigest()[:32]
 
+def chapter_fingerprint(chunks) -> str:
+    """Hash of a chapter's chunk texts in order; changes whenever the chapter is re-chunked."""
+    h = hashlib.sha256()
+    for c in chunks:
+        h.update(c.text.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()[:32]
+
 def _provider(provider_name: str):
     if provider_name == "openai":
         return OpenAIProvider()
@@ -40,9 +68,30 @@ async def generate_artifacts(
     provider_name: str | None,
     model: str | None,
     temperature: float,
+    fresh: bool = False,
     progress_cb=None,
+    semaphore: asyncio.Semaphore | None = None,
+    write_lock: asyncio.Lock | None = None,
+    checkpoint: Checkpoint | None = None,
 ) -> list[int]:
+    """Generate the requested artifacts for a chapter; returns artifact ids in ``outputs`` order.
+
+    Unless ``fresh`` is set, an output whose params_hash and chapter fingerprint
+    match an existing artifact reuses that artifact instead of sampling again.
+
+    ``semaphore`` and ``write_lock`` may be shared by several chapters running
+    at once (see generate_book). Every write is committed under ``write_lock``
+    right away, so no transaction stays open across LLM calls. SQLite allows
+    only one writer at a time.
+
+    Map and merge notes and new artifacts are saved to ``checkpoint`` as they
+    complete; a later run with the same checkpoint (a retry or resume of the
+    job) skips them, ``fresh`` or not.
+    """
     provider_name = provider_name or settings.llm_provider
+    # Resolved up front so reuse keys and Artifact.model change with the configured default model.
+    model = model or default_model(provider_name)[1]
+    checkpoint = checkpoint or Checkpoint()
     provider = _provider(provider_name)
 
     ch = (await session.execute(
@@ -53,64 +102,236 @@ async def generate_artifacts(
         select(Chunk).where(Chunk.chapter_id==ch.id).order_by(Chunk.chunk_index.asc())
     )).scalars().all()
 
-    created_ids: list[int] = []
-    total_steps = max(1, len(chunks) + len(outputs))
+    fingerprint = chapter_fingerprint(chunks)
+    params_hashes = {
+        artifact_type: _hash_params({
+            "difficulty": difficulty,
+            "tone": tone,
+            "length": length,
+            "include_code": include_code,
+            "provider_name": provider_name,
+            "model": model,
+            "temperature": temperature,
+            "artifact_type": artifact_type,
+        })
+        for artifact_type in outputs
+    }
+
+    artifact_ids: dict[str, int] = {}
+    saved = {t: checkpoint.get("artifact", t) for t in outputs}
+    saved = {t: i for t, i in saved.items() if i is not None}
+    if saved:
+        # Only artifacts that still exist; one deleted since is generated again.
+        still_there = set((await session.execute(
+            select(Artifact.id).where(Artifact.id.in_(list(saved.values())), Artifact.chapter_id==ch.id)
+        )).scalars().all())
+        artifact_ids.update({t: i for t, i in saved.items() if i in still_there})
+    if not fresh:
+        for artifact_type, params_hash in params_hashes.items():
+            if artifact_type in artifact_ids:
+                continue
+            existing = (await session.execute(
+                select(Artifact.id).where(
+                    Artifact.chapter_id==ch.id,
+                    Artifact.type==artifact_type,
+                    Artifact.params_hash==params_hash,
+                    Artifact.source_hash==fingerprint,
+                ).order_by(Artifact.version.desc()).limit(1)
+            )).scalar_one_or_none()
+            if existing is not None:
+                artifact_ids[artifact_type] = existing
+    pending = [t for t in dict.fromkeys(outputs) if t not in artifact_ids]
+    if progress_cb and artifact_ids:
+        await progress_cb(1, f"Reused {', '.join(artifact_ids)}", extra={"reused_artifacts": list(artifact_ids.values())})
+    if not pending:
+        return [artifact_ids[t] for t in outputs]
+
+    total_steps = max(1, len(chunks) + len(pending))
     done = 0
 
-    # Map: notes for each chunk (concurrent with limited parallelism)
-    semaphore = asyncio.Semaphore(5)
+    # Notes depend only on the chunk text and the map call's settings, not on outputs/tone/difficulty.
+    cache = MapNotesCache(
+        session,
+        provider=provider_name,
+        model=model,
+        temperature=temperature,
+        enabled=settings.map_cache_enabled,
+    )
+    write_lock = write_lock or asyncio.Lock()
+    async with write_lock:
+        await cache.prefetch([c.text for c in chunks])
+        await session.commit()
+
+    # Map: notes for each chunk. The per-job cap only bounds in-flight tasks; the
+    # Redis-backed provider limiter enforces RPM/TPM and concurrency across workers.
+    semaphore = semaphore or asyncio.Semaphore(settings.llm_job_concurrency)
     progress_lock = asyncio.Lock()
+    # Map and merge calls serve every output of this run; each artifact records them as "shared".
+    shared_usage = new_recorder()
     last_progress_pct = 0
+    resumed = 0
 
-    async def _map_chunk(c):
-        nonlocal done, last_progress_pct
-        sys, usr = map_prompt(c.text)
-        async with semaphore:
-            out = await provider.generate(
-                system=sys,
-                user=usr,
-                json_schema=None,
-                params={"model": model, "temperature": temperature},
-            )
-        done += 1
+    async def _report_map_progress():
+        nonlocal last_progress_pct
         # Throttle DB writes: only update when progress jumps by 5%+
         pct = int(done / total_steps * 100)
         if progress_cb and pct >= last_progress_pct + 5:
             async with progress_lock:
                 if pct >= last_progress_pct + 5:
                     last_progress_pct = pct
-                    await progress_cb(pct, f"Mapped chunk {done}/{len(chunks)}")
-        if "raw_text" in out and isinstance(out["raw_text"], str):
-            try:
-                return json.loads(_strip_code_fence(out["raw_text"]))
-            except Exception:
-                return {"important_points":[out["raw_text"]], "concepts":[], "definitions":[], "examples":[], "pitfalls":[]}
-        return out
+                    await progress_cb(
+                        pct,
+                        f"Mapped chunk {done}/{len(chunks)} ({cache.stats.hits} cached)",
+                        extra={"map_cache": cache.stats.as_dict()},
+                    )
 
-    notes = list(await asyncio.gather(*[_map_chunk(c) for c in chunks]))
+    async def _map_chunk(c):
+        nonlocal done, resumed
+        key = cache.key(c.text)
+        saved_notes = checkpoint.get("map", key)
+        if saved_notes is not None:
+            resumed += 1
+            done += 1
+            await _report_map_progress()
+            return saved_notes
+        cached = cache.get(key)
+        if cached is not None:
+            done += 1
+            await _report_map_progress()
+            return cached
 
-    # Reduce: each artifact
-    for artifact_type in outputs:
-        params = {
-            "difficulty": difficulty,
-            "tone": tone,
-            "length": length,
-            "include_code": include_code,
-            "provider_name": provider_name,
-            "model": model or "",
-            "temperature": temperature,
-            "artifact_type": artifact_type,
-        }
-        params_hash = _hash_params(params)
+        sys, usr = map_prompt(c.text)
+        async with semaphore:
+            with phase("map"):
+                out = await provider.generate(
+                    system=sys,
+                    user=usr,
+                    json_schema=None,
+                    params={"model": model, "temperature": temperature},
+                )
+        done += 1
+        notes, parsed = _parse_notes(out)
+        # Unparseable output is not cached so a later run can do better, but this job already paid for it.
+        if parsed:
+            cache.put(key, notes)
+        await checkpoint.put("map", key, notes)
+        await _report_map_progress()
+        return notes
 
-        sys, usr = reduce_prompt(artifact_type, notes, difficulty=difficulty, tone=tone, length=length, include_code=include_code)
-        out = await provider.generate(
-            system=sys,
-            user=usr + "\n\nReturn JSON only.",
-            json_schema=None,
-            params={"model": model, "temperature": temperature},
+    with track(shared_usage):
+        notes = await gather_or_cancel(*[_map_chunk(c) for c in chunks])
+    async with write_lock:
+        await cache.flush()
+        await session.commit()
+    if progress_cb:
+        await progress_cb(
+            int(done / total_steps * 100),
+            f"Mapped {len(chunks)} chunks ({cache.stats.hits} cached, "
+            + (f"{resumed} resumed, " if resumed else "")
+            + f"{cache.stats.misses} generated)",
+            extra={"map_cache": cache.stats.as_dict(), "rate_limit": limiter_stats()},
+        )
+
+    # Tree-reduce: when all notes will not fit one reduce prompt, merge them in rounds first.
+    if settings.tree_reduce_enabled:
+        merge_cache = MapNotesCache(
+            session,
+            provider=provider_name,
+            model=cache.model,
+            temperature=temperature,
+            enabled=settings.map_cache_enabled,
         )
 
+        def _merge_text(batch: list[dict]) -> str:
+            # Merged notes are cached like map notes, keyed on the batch instead of chunk text.
+            return f"merge:{MERGE_PROMPT_VERSION}\n" + json.dumps(batch, sort_keys=True)
+
+        async def _on_level(level: int, batches: list[list[dict]]):
+            async with write_lock:
+                await merge_cache.prefetch([_merge_text(b) for b in batches if len(b) > 1])
+                await session.commit()
+            if progress_cb:
+                await progress_cb(
+                    int(done / total_steps * 100),
+                    f"Merging notes (level {level}): {sum(len(b) for b in batches)} -> {len(batches)}",
+                    extra={"tree_reduce": {"level": level, "batches": len(batches)}},
+                )
+
+        async def _merge(batch: list[dict]) -> dict:
+            key = merge_cache.key(_merge_text(batch))
+            saved_notes = checkpoint.get("merge", key)
+            if saved_notes is not None:
+                return saved_notes
+            cached = merge_cache.get(key)
+            if cached is not None:
+                return cached
+            sys, usr = merge_prompt(batch)
+            async with semaphore:
+                with phase("merge"):
+                    out = await provider.generate(
+                        system=sys,
+                        user=usr,
+                        json_schema=None,
+                        params={"model": model, "temperature": temperature},
+                    )
+            merged, parsed = _parse_notes(out)
+            if parsed:
+                merge_cache.put(key, merged)
+            await checkpoint.put("merge", key, merged)
+            return merged
+
+        with track(shared_usage):
+            notes = await tree_reduce(
+                notes,
+                merge=_merge,
+                budget=reduce_token_budget(provider_name, cache.model),
+                fan_in=settings.tree_reduce_fan_in,
+                count=get_tokenizer(cache.model),
+                on_level=_on_level,
+            )
+        async with write_lock:
+            await merge_cache.flush()
+            await session.commit()
+
+    # Reduce: one call per artifact, concurrently under the same limiter as the map phase.
+    # The session is not safe for concurrent use, so versioning and inserts go through write_lock.
+    stream_stats: dict[str, dict] = {}
+
+    async def _reduce(artifact_type: str):
+        nonlocal done
+        sys, usr = reduce_prompt(artifact_type, notes, difficulty=difficulty, tone=tone, length=length, include_code=include_code)
+        params = {"model": model, "temperature": temperature}
+        async with semaphore, _track_reduce(artifact_type) as reduce_usage:
+            if settings.llm_stream:
+                # Reduce outputs are long; stream them so the job shows live progress.
+                async def on_delta(text: str, stats):
+                    stream_stats[artifact_type] = stats.as_dict()
+                    if progress_cb:
+                        await progress_cb(
+                            int(done/total_steps*100),
+                            f"Generating {artifact_type}: {stats.output_tokens} tokens ({stats.tokens_per_s:.0f} tok/s)",
+                            extra={"streams": dict(stream_stats)},
+                        )
+
+                text, stats = await collect_stream(
+                    provider,
+                    system=sys,
+                    user=usr + "\n\nReturn JSON only.",
+                    params=params,
+                    on_delta=on_delta,
+                    expect_json=True,
+                    progress_interval=settings.llm_stream_progress_interval,
+                )
+                stream_stats[artifact_type] = stats.as_dict()
+                out = {"raw_text": text}
+            else:
+                out = await provider.generate(
+                    system=sys,
+                    user=usr + "\n\nReturn JSON only.",
+                    json_schema=None,
+                    params=params,
+                )
+
         if "raw_text" in out and isinstance(out["raw_text"], str):
             try:
                 data = json.loads(_strip_code_fence(out["raw_text"]))
@@ -121,29 +342,124 @@ async def generate_artifacts(
 
         md = to_markdown(artifact_type if artifact_type!="takeaways" else "takeaways", data)
 
-        # versioning
-        existing_versions = (await session.execute(
-            select(Artifact.version).where(Artifact.chapter_id==ch.id, Artifact.type==artifact_type).order_by(Artifact.version.desc())
-        )).scalars().all()
-        version = (existing_versions[0] + 1) if existing_versions else 1
-
-        art = Artifact(
-            chapter_id=ch.id,
-            type=artifact_type,
-            content_md=md,
-            content_json=data,
-            provider=provider_name,
-            model=model or "",
-            params_hash=params_hash,
-            version=version,
-        )
-        session.add(art)
-        await session.flush()
-        created_ids.append(art.id)
+        async with write_lock:
+            # versioning
+            existing_versions = (await session.execute(
+                select(Artifact.version).where(Artifact.chapter_id==ch.id, Artifact.type==artifact_type).order_by(Artifact.version.desc())
+            )).scalars().all()
+            version = (existing_versions[0] + 1) if existing_versions else 1
 
-        done += 1
-        if progress_cb:
-            await progress_cb(int(done/total_steps*100), f"Generated {artifact_type}")
+            art = Artifact(
+                chapter_id=ch.id,
+                type=artifact_type,
+                content_md=md,
+                content_json=data,
+                provider=provider_name,
+                model=model,
+                params_hash=params_hashes[artifact_type],
+                source_hash=fingerprint,
+                version=version,
+                usage={**reduce_usage.as_dict(), "shared": shared_usage.total.as_dict()},
+            )
+            session.add(art)
+            await session.commit()
+            artifact_ids[artifact_type] = art.id
+            await checkpoint.put("artifact", artifact_type, art.id)
+
+            done += 1
+            if progress_cb:
+                await progress_cb(
+                    int(done/total_steps*100),
+                    f"Generated {artifact_type}",
+                    extra={"rate_limit": limiter_stats(), "streams": dict(stream_stats)},
+                )
+
+    await gather_or_cancel(*[_reduce(t) for t in pending])
+    return [artifact_ids[t] for t in outputs]
+
+@contextlib.asynccontextmanager
+async def _track_reduce(artifact_type: str):
+    with track() as rec, phase(f"reduce:{artifact_type}"):
+        yield rec
+
+async def generate_book(
+    session_factory,
+    *,
+    book_id: int,
+    chapter_indices: list[int] | None,
+    outputs: list[str],
+    progress_cb=None,
+    checkpoint: Checkpoint | None = None,
+    **options,
+) -> dict[int, dict]:
+    """Generate artifacts for many chapters of a book in one shared work pool.
+
+    Chapters run concurrently (at most ``settings.book_chapter_concurrency``), each
+    in its own session. All of their map, merge and reduce calls share one
+    semaphore. Each chapter commits as it goes, so a failing chapter is recorded
+    and skipped without undoing the others. Returns per-chapter state keyed by
+    chapter index: status, progress, artifact_ids, error, and whether the error
+    was transient (worth retrying). With a ``checkpoint``, a rerun picks each
+    chapter up where it stopped.
+    """
+    checkpoint = checkpoint or Checkpoint()
+    async with session_factory() as session:
+        q = select(Chapter.index).where(Chapter.book_id==book_id).order_by(Chapter.index.asc())
+        if chapter_indices:
+            q = q.where(Chapter.index.in_(chapter_indices))
+        indices = list((await session.execute(q)).scalars().all())
+    if not indices:
+        raise ValueError(f"No chapters to generate for book {book_id}")
+
+    semaphore = asyncio.Semaphore(settings.llm_job_concurrency)
+    write_lock = asyncio.Lock()
+    chapter_slots = asyncio.Semaphore(settings.book_chapter_concurrency)
+    state: dict[int, dict] = {i: {"status": "queued", "progress": 0} for i in indices}
+    last_report = 0.0
+
+    async def _report(msg: str, force: bool = False):
+        nonlocal last_report
+        # Many chapters stream at once; only status changes bypass the 1s throttle.
+        now = time.monotonic()
+        if progress_cb and (force or now - last_report >= 1.0):
+            last_report = now
+            overall = sum(s["progress"] for s in state.values()) // len(state)
+            await progress_cb(overall, msg, extra={"chapters": {str(i): dict(s) for i, s in state.items()}})
+
+    async def _chapter(index: int):
+        async with chapter_slots:
+            state[index]["status"] = "started"
+
+            async def chapter_progress(pct: int, msg: str, extra: dict | None = None):
+                state[index]["progress"] = pct
+                await _report(f"Chapter {index}: {msg}")
+
+            chapter_usage = new_recorder()
+            try:
+                async with session_factory() as session:
+                    with track(chapter_usage):
+                        ids = await generate_artifacts(
+                            session,
+                            book_id=book_id,
+                            chapter_index=index,
+                            outputs=outputs,
+                            progress_cb=chapter_progress,
+                            semaphore=semaphore,
+                            write_lock=write_lock,
+                            checkpoint=checkpoint.scoped(f"ch{index}:"),
+                            **options,
+                        )
+                state[index].update(status="finished", progress=100, artifact_ids=ids, usage=chapter_usage.total.as_dict())
+                await _report(f"Chapter {index}: done", force=True)
+            except Exception as e:
+                logger.exception("Generation failed for book %s chapter %s", book_id, index)
+                state[index].update(
+                    status="failed",
+                    error=f"{type(e).__name__}: {e}"[:500],
+                    transient=is_transient(e),
+                    usage=chapter_usage.total.as_dict(),
+                )
+                await _report(f"Chapter {index}: failed", force=True)
 
-    await session.commit()
-    return created_ids
+    await asyncio.gather(*[_chapter(i) for i in indices])
+    return state
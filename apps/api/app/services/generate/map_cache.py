@@ -0,0 +1,115 @@
+from __future__ import annotations
+import datetime as dt
+import hashlib
+import logging
+from dataclasses import asdict, dataclass, field
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from ...models import MapNote
+from ...settings import settings
+from .prompts import MAP_PROMPT_VERSION
+
+logger = logging.getLogger(__name__)
+
+
+def notes_key(chunk_text: str, provider: str, model: str, temperature: float) -> str:
+    text_hash = hashlib.sha256(chunk_text.encode("utf-8")).hexdigest()
+    s = f"{text_hash}|{provider}|{model}|{temperature!r}|{MAP_PROMPT_VERSION}"
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class MapCacheStats:
+    hits: int = 0
+    misses: int = 0
+    stored: int = 0
+    evicted: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class MapNotesCache:
+    """Map-phase notes for one generation run, loaded up front and written back in one batch.
+
+    The map phase runs concurrently on a single AsyncSession, so lookups are served
+    from memory (``prefetch``) and new notes are buffered until ``flush``.
+    """
+    session: AsyncSession
+    provider: str
+    model: str
+    temperature: float
+    enabled: bool = True
+    stats: MapCacheStats = field(default_factory=MapCacheStats)
+    _hits: dict[str, dict] = field(default_factory=dict)
+    _pending: dict[str, dict] = field(default_factory=dict)
+
+    def key(self, chunk_text: str) -> str:
+        return notes_key(chunk_text, self.provider, self.model, self.temperature)
+
+    async def prefetch(self, chunk_texts: list[str]) -> None:
+        if not self.enabled:
+            return
+        keys = list({self.key(t) for t in chunk_texts})
+        for i in range(0, len(keys), 500):
+            rows = (await self.session.execute(
+                select(MapNote.key, MapNote.notes).where(MapNote.key.in_(keys[i:i + 500]))
+            )).all()
+            self._hits.update({k: notes for k, notes in rows})
+        if self._hits:
+            await self.session.execute(
+                update(MapNote).where(MapNote.key.in_(list(self._hits))).values(last_used_at=dt.datetime.utcnow())
+            )
+
+    def get(self, key: str) -> dict | None:
+        notes = self._hits.get(key) if self.enabled else None
+        if notes is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return notes
+
+    def put(self, key: str, notes: dict) -> None:
+        if self.enabled:
+            self._pending[key] = notes
+
+    async def flush(self) -> None:
+        """Insert buffered notes (ignoring keys another job stored meanwhile), then evict."""
+        if not self._pending:
+            return
+        now = dt.datetime.utcnow()
+        rows = [
+            {"key": k, "provider": self.provider, "model": self.model, "notes": n, "created_at": now, "last_used_at": now}
+            for k, n in self._pending.items()
+        ]
+        if self.session.bind.dialect.name == "sqlite":
+            stmt = sqlite_insert(MapNote).on_conflict_do_nothing(index_elements=[MapNote.key])
+        else:
+            stmt = insert(MapNote)
+        await self.session.execute(stmt, rows)
+        self.stats.stored += len(rows)
+        self._pending.clear()
+        self.stats.evicted = await evict(self.session)
+
+
+async def evict(session: AsyncSession) -> int:
+    """Drop notes older than the TTL, then the least recently used beyond max entries."""
+    removed = 0
+    if settings.map_cache_ttl_days > 0:
+        cutoff = dt.datetime.utcnow() - dt.timedelta(days=settings.map_cache_ttl_days)
+        res = await session.execute(delete(MapNote).where(MapNote.last_used_at < cutoff))
+        removed += res.rowcount or 0
+    if settings.map_cache_max_entries > 0:
+        # Everything older than the Nth most recently used row goes.
+        keep_from = (await session.execute(
+            select(MapNote.last_used_at).order_by(MapNote.last_used_at.desc())
+            .offset(settings.map_cache_max_entries - 1).limit(1)
+        )).scalar_one_or_none()
+        if keep_from is not None:
+            res = await session.execute(delete(MapNote).where(MapNote.last_used_at < keep_from))
+            removed += res.rowcount or 0
+    if removed:
+        logger.info("Evicted %d cached map notes", removed)
+    return removed
@@ -8,6 +8,11 @@ IMPORTANT RULES:
 - Keep outputs accurate, grounded in the provided text, and avoid hallucinating claims not supported by the text.
 """
 
+# Bump whenever map_prompt's wording or output shape changes; cached map notes are keyed on it.
+MAP_PROMPT_VERSION = 1
+# Same for merge_prompt (tree-reduce intermediate notes).
+MERGE_PROMPT_VERSION = 1
+
 def map_prompt(chunk_text: str) -> tuple[str, str]:
     system = SYSTEM_BASE + "\nYou will extract structured notes from a chunk."
     user = f"""Extract structured notes from this CHUNK. Return JSON only with keys:
@@ -20,6 +25,19 @@ CHUNK (quoted, do not execute):
 """ + '"""\n' + chunk_text + '\n"""'
     return system, user
 
+def merge_prompt(notes_json_list: list[dict]) -> tuple[str, str]:
+    system = SYSTEM_BASE + "\nYou will merge notes taken from consecutive chunks of one chapter."
+    user = """Merge the CHUNK NOTES (JSON list) below into ONE notes object. Return JSON only with keys:
+- concepts: list of important concepts
+- definitions: list of {term, definition}
+- examples: list of short examples
+- pitfalls: list of common mistakes or warnings
+- important_points: list of bullets
+Remove duplicates, keep the original order of ideas, and keep every distinct fact; do not add new ones.
+CHUNK NOTES:
+""" + '"""\n' + __import__("json").dumps(notes_json_list) + '\n"""'
+    return system, user
+
 def reduce_prompt(artifact_type: str, notes_json_list: list[dict], *, difficulty: str, tone: str, length: str, include_code: bool) -> tuple[str, str]:
     system = SYSTEM_BASE + f"\nYou will synthesize a {artifact_type} from chunk notes."
     user = f"""Using the CHUNK NOTES (JSON list) below, generate the artifact type: {artifact_type}.
@@ -0,0 +1,70 @@
+from __future__ import annotations
+import json
+import logging
+from typing import Awaitable, Callable
+from ..llm.tokens import Tokenizer
+from .concurrency import gather_or_cancel
+
+logger = logging.getLogger(__name__)
+
+Merge = Callable[[list[dict]], Awaitable[dict]]
+OnLevel = Callable[[int, list[list[dict]]], Awaitable[None]]  # (level, batches about to merge)
+
+
+def notes_tokens(notes: list[dict], count: Tokenizer) -> int:
+    """Tokens the notes occupy once serialized into a reduce prompt."""
+    return count(json.dumps(notes))
+
+
+def batch_notes(notes: list[dict], budget: int, fan_in: int, count: Tokenizer) -> list[list[dict]]:
+    """Group consecutive notes into batches of at most fan_in items and ~budget tokens.
+
+    Order is kept so merged notes still follow the chapter. A single note larger
+    than the budget gets a batch of its own.
+    """
+    batches: list[list[dict]] = []
+    batch: list[dict] = []
+    size = 0
+    for note in notes:
+        n = count(json.dumps(note))
+        if batch and (len(batch) >= fan_in or size + n > budget):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(note)
+        size += n
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+async def tree_reduce(
+    notes: list[dict],
+    *,
+    merge: Merge,
+    budget: int,
+    fan_in: int,
+    count: Tokenizer,
+    on_level: OnLevel | None = None,
+) -> list[dict]:
+    """Merge notes level by level until they fit budget; returns the (possibly unchanged) list.
+
+    Each level merges its batches concurrently (``merge`` is expected to apply
+    its own concurrency limit and caching). Single-note batches pass through.
+    """
+    fan_in = max(2, fan_in)
+    level = 0
+    while len(notes) > 1 and notes_tokens(notes, count) > budget:
+        level += 1
+        batches = batch_notes(notes, budget, fan_in, count)
+        if len(batches) >= len(notes):
+            # Every note is already too large to pair with another; merging cannot shrink this.
+            logger.warning("tree-reduce stopped at level %d: %d notes do not fit the %d-token budget", level, len(notes), budget)
+            break
+        if on_level:
+            await on_level(level, batches)
+
+        async def _merge(batch: list[dict]) -> dict:
+            return batch[0] if len(batch) == 1 else await merge(batch)
+
+        notes = await gather_or_cancel(*[_merge(b) for b in batches])
+    return notes
@@ -1,11 +1,18 @@
 from __future__ import annotations
 import bisect
+import itertools
 import logging
 import re
-from dataclasses import dataclass
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from functools import cached_property
 
 logger = logging.getLogger(__name__)
 
+# Strategy names, most to least reliable; any of them can be forced via chapterize(strategy=...).
+STRATEGIES = ("toc_pages", "toc_titles", "printed_toc", "heading_regex", "page_fallback", "single_section")
+
 @dataclass
 class ChapterSpan:
     index: int
@@ -13,11 +20,161 @@ class ChapterSpan:
     start: int
     end: int
 
-_HEADING_PATTERNS = [
-    re.compile(r"^(chapter\s+\d+\b.*)$", re.IGNORECASE | re.MULTILINE),
-    re.compile(r"^(\d+\.\s+[^\n]{3,})$", re.MULTILINE),
-    re.compile(r"^(\d+\.\d+\s+[^\n]{3,})$", re.MULTILINE),
-]
+@dataclass
+class StrategyRecord:
+    """Outcome of one chapterize strategy attempt."""
+    strategy: str  # toc_pages|toc_titles|printed_toc|heading_regex|page_fallback
+    wall_ms: float = 0.0
+    candidates: int = 0  # raw inputs considered (TOC rows, printed entries, heading hits, ...)
+    spans: int = 0  # usable spans produced before finalizing
+    coverage: float = 0.0  # fraction of the text covered by those spans
+    won: bool = False
+
+@dataclass
+class ChapterizeReport:
+    text_len: int
+    strategies: list[StrategyRecord] = field(default_factory=list)
+    winner: str | None = None  # strategy name, or "single_section" when nothing worked
+    chapters: int = 0
+    total_ms: float = 0.0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+def _coverage(spans: list[ChapterSpan], text_len: int) -> float:
+    covered = sum(max(0, s.end - s.start) for s in spans)
+    return round(covered / text_len, 4) if text_len > 0 else 0.0
+
+@contextmanager
+def _strategy(report: ChapterizeReport, name: str):
+    rec = StrategyRecord(strategy=name)
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    finally:
+        rec.wall_ms = round((time.perf_counter() - t0) * 1000, 2)
+        report.strategies.append(rec)
+        logger.debug(
+            "chapterize strategy=%s wall_ms=%.2f candidates=%d spans=%d coverage=%.3f",
+            rec.strategy, rec.wall_ms, rec.candidates, rec.spans, rec.coverage,
+        )
+
+# Allow leading garbage (glyphs, control chars, punctuation) before "Chapter".
+_CHAPTER_LINE_RE = re.compile(r"^\W*(chapter\b[\s\W_]{0,12}\d+\b[^\n]*)$", re.IGNORECASE | re.MULTILINE)
+# Numbered section headings ("1. Intro", "1.2 Intro", "1 Introduction") in one pass.
+_SECTION_LINE_RE = re.compile(
+    r"^(?P<dotted>\d+\.\s+[^\n]{3,})$"
+    r"|^(?P<sub>\d+\.\d+\s+[^\n]{3,})$"
+    r"|^\s*(?P<plain>\d{1,2}\s+[A-Z][^\n]{3,120})$",
+    re.MULTILINE,
+)
+_GARBAGE_TABLE = dict.fromkeys([*range(0x00, 0x0a), *range(0x0b, 0x20), 0x7f, 0x25a0, 0x25a1, 0xfffd])
+_WS_RE = re.compile(r"\s+")
+_WS_RUN_RE = re.compile(r"\s{2,}")
+
+
+def _phrase_re(phrase: str) -> re.Pattern:
+    return re.compile(re.escape(phrase).replace(r"\ ", r"\s+"), re.IGNORECASE)
+
+
+class TextIndex:
+    """Precomputed views of the book text shared by every chapterize strategy.
+
+    Each view is built lazily in one linear pass: line starts, stripped and
+    garbage-free lines, a page lookup, and a whitespace-collapsed lowercase view
+    (with an offset map back to the original text) for phrase searches.
+    """
+
+    def __init__(self, text: str, page_offsets: list[int] | None = None):
+        self.text = text
+        self.page_offsets = page_offsets or []
+
+    @cached_property
+    def _split(self) -> tuple[list[str], list[int]]:
+        lines = self.text.splitlines(keepends=True)
+        starts = list(itertools.accumulate((len(l) for l in lines), initial=0))
+        starts.pop()
+        return lines, starts
+
+    @property
+    def lines(self) -> list[str]:
+        """Lines with their line endings, as from str.splitlines(keepends=True)."""
+        return self._split[0]
+
+    @property
+    def line_starts(self) -> list[int]:
+        return self._split[1]
+
+    @cached_property
+    def clean_lines(self) -> list[str]:
+        """Lines stripped of whitespace, control characters and PDF garbage glyphs."""
+        return [l.strip().translate(_GARBAGE_TABLE).strip() for l in self.lines]
+
+    def lines_before(self, end: int) -> list[str]:
+        """Lines of text[:end] without line endings."""
+        n = bisect.bisect_left(self.line_starts, end)
+        out = [l.rstrip("\r\n") for l in self.lines[:n]]
+        if out and self.line_starts[n - 1] + len(out[-1]) > end:
+            out[-1] = out[-1][:end - self.line_starts[n - 1]]
+        return out
+
+    def page_of(self, offset: int) -> int:
+        """0-based page containing offset (-1 before the first page or without pages)."""
+        return bisect.bisect_right(self.page_offsets, offset) - 1
+
+    def is_near_page_top(self, offset: int, max_chars_from_page_start: int = 1400) -> bool:
+        return _is_near_page_top(offset, self.page_offsets, max_chars_from_page_start)
+
+    @cached_property
+    def _norm(self) -> tuple[str, bool, list[int], list[int], list[int]]:
+        norm = _WS_RE.sub(" ", self.text)
+        lowered = norm.lower()
+        # Rare characters change length when lowercased; then offsets can't be mapped.
+        folded = len(lowered) == len(norm)
+        norm_breaks: list[int] = []  # norm index just after each collapsed run
+        orig_breaks: list[int] = []  # original offset of the same point
+        shifts: list[int] = []  # characters removed up to that point
+        shift = 0
+        for m in _WS_RUN_RE.finditer(self.text):
+            norm_breaks.append(m.start() - shift + 1)
+            shift += m.end() - m.start() - 1
+            orig_breaks.append(m.end())
+            shifts.append(shift)
+        return (lowered if folded else norm), folded, norm_breaks, orig_breaks, shifts
+
+    def _to_norm(self, offset: int) -> int:
+        _, _, norm_breaks, orig_breaks, shifts = self._norm
+        i = bisect.bisect_right(orig_breaks, offset) - 1
+        n = offset - shifts[i] if i >= 0 else offset
+        # Offsets inside a collapsed run land just after its single space.
+        if i + 1 < len(norm_breaks):
+            n = min(n, norm_breaks[i + 1])
+        return n
+
+    def _to_orig(self, n: int) -> int:
+        _, _, norm_breaks, _, shifts = self._norm
+        i = bisect.bisect_right(norm_breaks, n) - 1
+        return n + shifts[i] if i >= 0 else n
+
+    def find_phrase(self, phrase: str, start: int = 0) -> int:
+        """Offset of the first case- and whitespace-insensitive match at or after start, or -1."""
+        norm, folded, *_ = self._norm
+        if not folded:
+            m = _phrase_re(phrase).search(self.text, start)
+            return m.start() if m else -1
+        n = norm.find(_WS_RE.sub(" ", phrase).lower(), self._to_norm(start))
+        return self._to_orig(n) if n >= 0 else -1
+
+    def rfind_phrase(self, phrase: str) -> int:
+        """Offset of the last case- and whitespace-insensitive match, or -1."""
+        norm, folded, *_ = self._norm
+        if not folded:
+            last = None
+            for last in _phrase_re(phrase).finditer(self.text):
+                pass
+            return last.start() if last else -1
+        n = norm.rfind(_WS_RE.sub(" ", phrase).lower())
+        return self._to_orig(n) if n >= 0 else -1
 
 def _clean_title(title: str) -> str:
     t = title or ""
@@ -186,7 +343,8 @@ def _spans_from_toc_pages(
         return []
     return best
 
-def _spans_from_toc_titles(text: str, toc_titles: list[str], min_chapter_chars: int) -> list[ChapterSpan]:
+def _spans_from_toc_titles(idx: TextIndex, toc_titles: list[str], min_chapter_chars: int) -> list[ChapterSpan]:
+    text = idx.text
     # De-duplicate TOC labels first; repeated labels often come from noisy PDF outlines.
     ordered_titles: list[str] = []
     seen: set[str] = set()
@@ -207,15 +365,12 @@ def _spans_from_toc_titles(text: str, toc_titles: list[str], min_chapter_chars:
     pos = 0
     found_offsets: list[tuple[str, int]] = []
     for t in ordered_titles:
-        # Keep text offsets stable by matching directly against original text.
-        needle = t[:120]
-        pattern = re.escape(needle).replace(r"\ ", r"\s+")
-        m = re.search(pattern, text[pos:], flags=re.IGNORECASE)
-        if not m:
+        # Offsets come back in original-text coordinates, so slicing stays stable.
+        at = idx.find_phrase(t[:120], pos)
+        if at < 0:
             continue
-        idx = pos + m.start()
-        found_offsets.append((t, idx))
-        pos = idx + 1
+        found_offsets.append((t, at))
+        pos = at + 1
 
     if len(found_offsets) < 3:
         return []
@@ -234,10 +389,7 @@ def _spans_from_toc_titles(text: str, toc_titles: list[str], min_chapter_chars:
         return []
     return spans
 
-def _extract_printed_toc(
-    text: str,
-    page_offsets: list[int] | None = None,
-) -> list[tuple[str, int]]:
+def _extract_printed_toc(idx: TextIndex) -> list[tuple[str, int]]:
     """Parse a printed Table of Contents from early pages of the text.
 
     Handles multi-line formats where the page number is on a separate line:
@@ -248,12 +400,13 @@ def _extract_printed_toc(
          171
     """
     # Only scan front matter (first ~50 physical pages or 10% of text).
+    text, page_offsets = idx.text, idx.page_offsets
     if page_offsets and len(page_offsets) > 50:
         scan_end = page_offsets[50]
     else:
         scan_end = min(len(text), max(30000, len(text) // 10))
 
-    lines = text[:scan_end].splitlines()
+    lines = idx.lines_before(scan_end)
     entries: list[tuple[str, int]] = []
     seen_nums: set[int] = set()
 
@@ -305,16 +458,13 @@ def _extract_printed_toc(
         else:
             i += 1
 
-    print(f"[chapterize] _extract_printed_toc: {len(entries)} entries found")
-    for t, p in entries[:25]:
-        print(f"  page={p:>4}: {t!r}")
+    logger.debug("chapterize printed_toc: %d entries found", len(entries))
     return entries
 
 
 def _spans_from_printed_toc(
-    text: str,
+    idx: TextIndex,
     entries: list[tuple[str, int]],
-    page_offsets: list[int],
     min_chapter_chars: int,
 ) -> list[ChapterSpan]:
     """Build chapter spans by mapping printed page numbers to physical pages.
@@ -322,6 +472,7 @@ def _spans_from_printed_toc(
     Uses the first chapter's subtitle to calibrate the offset between
     printed page numbers and physical PDF pages, then maps all entries.
     """
+    text, page_offsets = idx.text, idx.page_offsets
     if len(entries) < 2 or not page_offsets:
         return []
 
@@ -332,17 +483,13 @@ def _spans_from_printed_toc(
     if len(subtitle) < 10:
         return []
 
-    needle = re.escape(subtitle[:80]).replace(r"\ ", r"\s+")
-    last_match = None
-    for m in re.finditer(needle, text, flags=re.IGNORECASE):
-        last_match = m
-    if last_match is None:
-        print(f"[chapterize] printed_toc calibration: can't find {subtitle[:60]!r}")
+    content_offset = idx.rfind_phrase(subtitle[:80])
+    if content_offset < 0:
+        logger.debug("chapterize printed_toc calibration: can't find %r", subtitle[:60])
         return []
 
     # Determine which physical page (0-based) this offset is on.
-    content_offset = last_match.start()
-    physical_page = bisect.bisect_right(page_offsets, content_offset) - 1
+    physical_page = idx.page_of(content_offset)
     if physical_page < 0:
         return []
 
@@ -350,8 +497,8 @@ def _spans_from_printed_toc(
     front_matter_count = physical_page - (first_printed_page - 1)
     if front_matter_count < 0:
         front_matter_count = 0
-    print(f"[chapterize] printed_toc calibration: subtitle at offset {content_offset}, "
-          f"physical_page={physical_page}, front_matter={front_matter_count}")
+    logger.debug("chapterize printed_toc calibration: offset=%d physical_page=%d front_matter=%d",
+                 content_offset, physical_page, front_matter_count)
 
     # Map all entries to character offsets via page_offsets.
     spans: list[ChapterSpan] = []
@@ -373,7 +520,6 @@ def _spans_from_printed_toc(
         return []
     covered = sum(s.end - s.start for s in spans)
     coverage = covered / len(text) if text else 0.0
-    print(f"[chapterize] printed_toc spans: {len(spans)}, coverage={coverage:.1%}")
     if coverage < 0.5:
         return []
     return spans
@@ -388,23 +534,18 @@ def _is_near_page_top(offset: int, page_offsets: list[int] | None, max_chars_fro
     return (offset - page_offsets[i]) <= max_chars_from_page_start
 
 def _heading_candidates(
-    text: str,
+    idx: TextIndex,
     *,
-    page_offsets: list[int] | None = None,
     prefer_chapter_only: bool = False,
 ) -> list[tuple[int, str]]:
+    text = idx.text
     # Prefer explicit "Chapter N" headings when available.
     chapter_hits: list[tuple[int, str, int | None]] = []
-    # Allow leading garbage (glyphs, control chars, punctuation) before "Chapter".
-    chapter_pattern = re.compile(
-        r"^\W*(chapter\b[\s\W_]{0,12}\d+\b[^\n]*)$",
-        re.IGNORECASE | re.MULTILINE,
-    )
-    for m in chapter_pattern.finditer(text):
+    for m in _CHAPTER_LINE_RE.finditer(text):
         title = m.group(1).strip()
         if len(title) > 160:
             continue
-        if not _is_near_page_top(m.start(), page_offsets):
+        if not idx.is_near_page_top(m.start()):
             continue
         chapter_hits.append((m.start(), title, _chapter_number(title)))
 
@@ -414,21 +555,17 @@ def _heading_candidates(
     # and
     #   7
     #   Advanced Optimization
-    lines = text.splitlines(keepends=True)
-    offsets: list[int] = []
-    cur = 0
-    for line in lines:
-        offsets.append(cur)
-        cur += len(line)
-    for i in range(len(lines) - 1):
-        l1 = lines[i].strip()
-        l2 = lines[i + 1].strip()
-        # Strip garbage glyphs and control chars for matching.
-        l1_clean = re.sub(r"[\x00-\x09\x0b-\x1f\x7f\u25a0\u25a1\ufffd]", "", l1).strip()
-        l2_clean = re.sub(r"[\x00-\x09\x0b-\x1f\x7f\u25a0\u25a1\ufffd]", "", l2).strip()
+    clean = idx.clean_lines
+    offsets = idx.line_starts
+    for i in range(len(clean) - 1):
+        l1_clean = clean[i]
+        # Cheap prefilter: the first line must be "chapter N" or a bare number.
+        if not l1_clean or not (l1_clean[0].isdigit() or l1_clean[:7].lower() == "chapter"):
+            continue
+        l2_clean = clean[i + 1]
         if len(l2_clean) < 3 or len(l2_clean) > 180:
             continue
-        if not _is_near_page_top(offsets[i], page_offsets):
+        if not idx.is_near_page_top(offsets[i]):
             continue
         if re.fullmatch(r"chapter\s+\d+", l1_clean, flags=re.IGNORECASE):
             title = f"{l1_clean} {l2_clean}"
@@ -491,17 +628,12 @@ def _heading_candidates(
         return []
 
     # Fallback: numbered section headings only when explicit chapter headings are absent.
+    # Includes the common "1 Introduction" (no dot) format.
     section_hits: list[tuple[int, str]] = []
-    for pat in _HEADING_PATTERNS[1:]:
-        for m in pat.finditer(text):
-            if not _is_near_page_top(m.start(), page_offsets):
-                continue
-            section_hits.append((m.start(), m.group(1).strip()))
-    # Common heading format: "1 Introduction" (no dot).
-    for m in re.finditer(r"^\s*(\d{1,2}\s+[A-Z][^\n]{3,120})$", text, flags=re.MULTILINE):
-        if not _is_near_page_top(m.start(), page_offsets):
+    for m in _SECTION_LINE_RE.finditer(text):
+        if not idx.is_near_page_top(m.start()):
             continue
-        section_hits.append((m.start(), m.group(1).strip()))
+        section_hits.append((m.start(), (m.group("dotted") or m.group("sub") or m.group("plain")).strip()))
     return sorted(set(section_hits), key=lambda x: x[0])
 
 def _fallback_page_splits(text: str, page_offsets: list[int], min_chapter_chars: int) -> list[ChapterSpan]:
@@ -532,82 +664,92 @@ def _fallback_page_splits(text: str, page_offsets: list[int], min_chapter_chars:
         spans.append(ChapterSpan(index=len(spans) + 1, title=f"Section {len(spans) + 1}", start=start, end=end))
     return spans if len(spans) >= 2 else []
 
+def _finish(report: ChapterizeReport, winner: str, spans: list[ChapterSpan], t0: float) -> list[ChapterSpan]:
+    report.winner = winner
+    report.chapters = len(spans)
+    report.total_ms = round((time.perf_counter() - t0) * 1000, 2)
+    for rec in report.strategies:
+        rec.won = rec.strategy == winner
+    logger.debug("chapterize winner=%s chapters=%d total_ms=%.2f text_len=%d",
+                 winner, len(spans), report.total_ms, report.text_len)
+    return spans
+
 def chapterize(
     text: str,
     toc_titles: list[str] | None = None,
     toc_entries: list[tuple[int, str, int]] | None = None,
     page_offsets: list[int] | None = None,
     min_chapter_chars: int = 2000,
+    index: TextIndex | None = None,
+    report: ChapterizeReport | None = None,
+    strategy: str | None = None,
 ) -> list[ChapterSpan]:
-    print(f"[chapterize] text_len={len(text)}, toc_entries={len(toc_entries or [])}, "
-          f"page_offsets={len(page_offsets or [])}")
+    """Split text into chapter spans, trying strategies from most to least reliable.
+
+    Pass a ``ChapterizeReport`` to collect per-strategy timings and the winner.
+    ``strategy`` restricts detection to one entry of ``STRATEGIES``; if it finds
+    nothing the whole text becomes a single section.
+    """
+    if strategy is not None and strategy not in STRATEGIES:
+        raise ValueError(f"Unknown chapterize strategy: {strategy}")
+    t0 = time.perf_counter()
+    report = report if report is not None else ChapterizeReport(text_len=len(text))
+    idx = index or TextIndex(text, page_offsets)
+    single = [ChapterSpan(index=1, title="Section 1", start=0, end=len(text))]
+
+    def allowed(name: str) -> bool:
+        return strategy is None or strategy == name
 
     # Best source for PDF chapter boundaries: TOC page numbers.
-    if toc_entries and page_offsets:
-        spans = _spans_from_toc_pages(text, toc_entries, page_offsets, min_chapter_chars)
-        print(f"[chapterize] toc_pages path: {len(spans)} spans")
+    if toc_entries and page_offsets and allowed("toc_pages"):
+        with _strategy(report, "toc_pages") as rec:
+            spans = _spans_from_toc_pages(text, toc_entries, page_offsets, min_chapter_chars)
+            rec.candidates, rec.spans, rec.coverage = len(toc_entries), len(spans), _coverage(spans, len(text))
         if spans:
-            result = _finalize_spans(spans, len(text), min_chapter_chars)
-            print(f"[chapterize] toc_pages finalized: {len(result)} chapters")
-            for s in result:
-                print(f"  ch{s.index}: {s.title!r} ({s.start}-{s.end})")
-            return result
-        else:
-            print("[chapterize] toc_pages path produced 0 usable spans, falling through")
+            return _finish(report, "toc_pages", _finalize_spans(spans, len(text), min_chapter_chars), t0)
 
-    if len(text) < min_chapter_chars:
-        return [ChapterSpan(index=1, title="Section 1", start=0, end=len(text))]
+    if len(text) < min_chapter_chars or strategy == "single_section":
+        return _finish(report, "single_section", single, t0)
 
     # If TOC titles exist (from embedded bookmarks), try to find them in text.
-    if toc_titles:
-        spans = _spans_from_toc_titles(text, toc_titles, min_chapter_chars)
-        print(f"[chapterize] toc_titles path: {len(spans)} spans")
+    if toc_titles and allowed("toc_titles"):
+        with _strategy(report, "toc_titles") as rec:
+            spans = _spans_from_toc_titles(idx, toc_titles, min_chapter_chars)
+            rec.candidates, rec.spans, rec.coverage = len(toc_titles), len(spans), _coverage(spans, len(text))
         if spans:
-            result = _finalize_spans(spans, len(text), min_chapter_chars)
-            print(f"[chapterize] toc_titles finalized: {len(result)} chapters")
-            return result
+            return _finish(report, "toc_titles", _finalize_spans(spans, len(text), min_chapter_chars), t0)
 
     # Try parsing a printed Table of Contents from the front matter.
-    if page_offsets:
-        printed_entries = _extract_printed_toc(text, page_offsets)
-        if len(printed_entries) >= 2:
-            spans = _spans_from_printed_toc(text, printed_entries, page_offsets, min_chapter_chars)
-            if spans:
-                result = _finalize_spans(spans, len(text), min_chapter_chars)
-                print(f"[chapterize] printed_toc finalized: {len(result)} chapters")
-                for s in result:
-                    print(f"  ch{s.index}: {s.title!r} ({s.start}-{s.end})")
-                return result
+    if page_offsets and allowed("printed_toc"):
+        with _strategy(report, "printed_toc") as rec:
+            printed_entries = _extract_printed_toc(idx)
+            spans = _spans_from_printed_toc(idx, printed_entries, min_chapter_chars) if len(printed_entries) >= 2 else []
+            rec.candidates, rec.spans, rec.coverage = len(printed_entries), len(spans), _coverage(spans, len(text))
+        if spans:
+            return _finish(report, "printed_toc", _finalize_spans(spans, len(text), min_chapter_chars), t0)
 
     # Heuristic headings by regex
-    candidates = _heading_candidates(
-        text,
-        page_offsets=page_offsets,
-        prefer_chapter_only=bool(page_offsets),
-    )
-    print(f"[chapterize] heading_candidates: {len(candidates)} found")
-    for c in candidates[:30]:
-        print(f"  offset={c[0]}: {c[1][:80]!r}")
-
-    if len(candidates) < 2:
-        if page_offsets:
-            fallback = _fallback_page_splits(text, page_offsets, min_chapter_chars)
-            if fallback:
-                return _finalize_spans(fallback, len(text), min_chapter_chars)
-        return [ChapterSpan(index=1, title="Section 1", start=0, end=len(text))]
-
-    spans: list[ChapterSpan] = []
-    for i, (start, title) in enumerate(candidates, start=1):
-        end = candidates[i][0] if i < len(candidates) else len(text)
-        if end - start < min_chapter_chars:
-            continue
-        spans.append(ChapterSpan(index=len(spans)+1, title=title, start=start, end=end))
+    if allowed("heading_regex"):
+        with _strategy(report, "heading_regex") as rec:
+            candidates = _heading_candidates(
+                idx,
+                prefer_chapter_only=bool(page_offsets),
+            )
+            spans = []
+            if len(candidates) >= 2:
+                for i, (start, title) in enumerate(candidates, start=1):
+                    end = candidates[i][0] if i < len(candidates) else len(text)
+                    if end - start < min_chapter_chars:
+                        continue
+                    spans.append(ChapterSpan(index=len(spans)+1, title=title, start=start, end=end))
+            rec.candidates, rec.spans, rec.coverage = len(candidates), len(spans), _coverage(spans, len(text))
+        if spans:
+            return _finish(report, "heading_regex", _finalize_spans(spans, len(text), min_chapter_chars), t0)
 
-    if not spans:
-        if page_offsets:
+    if page_offsets and allowed("page_fallback"):
+        with _strategy(report, "page_fallback") as rec:
             fallback = _fallback_page_splits(text, page_offsets, min_chapter_chars)
-            if fallback:
-                return _finalize_spans(fallback, len(text), min_chapter_chars)
-        return [ChapterSpan(index=1, title="Section 1", start=0, end=len(text))]
-
-    return _finalize_spans(spans, len(text), min_chapter_chars)
+            rec.candidates, rec.spans, rec.coverage = len(page_offsets), len(fallback), _coverage(fallback, len(text))
+        if fallback:
+            return _finish(report, "page_fallback", _finalize_spans(fallback, len(text), min_chapter_chars), t0)
+    return _finish(report, "single_section", single, t0)
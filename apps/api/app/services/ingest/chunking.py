@@ -1,5 +1,10 @@
 from __future__ import annotations
 import re
+from typing import Iterator
+from ..llm.tokens import Tokenizer, estimate_tokens
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
 
 def clean_text(t: str) -> str:
     t = t.replace("\x00", "")
@@ -7,21 +12,66 @@ def clean_text(t: str) -> str:
     t = re.sub(r"\n{3,}", "\n\n", t)
     return t.strip()
 
-def chunk_text(text: str, max_chars: int = 6000, overlap: int = 400) -> list[str]:
-    text = clean_text(text)
-    if not text:
-        return []
-    chunks: list[str] = []
-    i = 0
-    n = len(text)
-    while i < n:
-        j = min(n, i + max_chars)
-        # try to break on paragraph boundary
-        cut = text.rfind("\n\n", i, j)
-        if cut == -1 or cut < i + max_chars * 0.5:
-            cut = j
-        chunk = text[i:cut].strip()
-        if chunk:
-            chunks.append(chunk)
-        i = max(i + 1, cut - overlap)
-    return chunks
+def _units(text: str, max_tokens: int, count: Tokenizer) -> Iterator[tuple[str, str, int]]:
+    """Yield (separator, piece, tokens): paragraphs, or sentences/slices of oversized ones."""
+    for para in _PARAGRAPH_RE.split(text):
+        para = para.strip()
+        if not para:
+            continue
+        n = count(para)
+        if n <= max_tokens:
+            yield "\n\n", para, n
+            continue
+        sep = "\n\n"
+        for sent in _SENTENCE_RE.split(para):
+            n = count(sent)
+            if n <= max_tokens:
+                yield sep, sent, n
+            else:
+                # No usable boundary; fall back to proportional character slices.
+                step = max(1, len(sent) * max_tokens // n)
+                for i in range(0, len(sent), step):
+                    piece = sent[i:i + step]
+                    yield (sep if i == 0 else ""), piece, count(piece)
+            sep = " "
+
+def iter_chunks(
+    text: str,
+    max_tokens: int,
+    overlap_tokens: int = 0,
+    count: Tokenizer = estimate_tokens,
+) -> Iterator[tuple[str, int]]:
+    """Yield (chunk, token_count) pieces of at most ~max_tokens each.
+
+    Chunks break on paragraph boundaries, then sentence boundaries; the last
+    ~overlap_tokens of each chunk are repeated at the start of the next.
+    Expects text that is already cleaned (see clean_text).
+    """
+    window: list[tuple[str, str, int]] = []
+    size = 0
+    for unit in _units(text, max_tokens, count):
+        if window and size + unit[2] > max_tokens:
+            chunk = _join(window)
+            yield chunk, count(chunk)
+            # Carry trailing units forward as overlap.
+            carried: list[tuple[str, str, int]] = []
+            carried_size = 0
+            for u in reversed(window):
+                if carried_size + u[2] > overlap_tokens or carried_size + u[2] + unit[2] > max_tokens:
+                    break
+                carried.insert(0, u)
+                carried_size += u[2]
+            window, size = carried, carried_size
+        window.append(unit)
+        size += unit[2]
+    # The window always ends with at least one unit that has not been emitted yet.
+    if window:
+        chunk = _join(window)
+        yield chunk, count(chunk)
+
+def _join(units: list[tuple[str, str, int]]) -> str:
+    out = [units[0][1]]
+    for sep, piece, _ in units[1:]:
+        out.append(sep)
+        out.append(piece)
+    return "".join(out).strip()
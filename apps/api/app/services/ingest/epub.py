@@ -2,58 +2,144 @@ from __future__ import annotations
 import logging
 import os
 import re
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import TypedDict
+import ebooklib
 from ebooklib import epub
 from bs4 import BeautifulSoup
+from ...settings import settings
+from .images import ImageSink, StoredImage, dedupe_images
 
 logger = logging.getLogger(__name__)
 
 MIN_IMAGE_BYTES = 5 * 1024  # 5 KB
 
-
-class ExtractedImage(TypedDict):
-    data: bytes
-    ext: str
-    mime: str
-    page: int  # item index (no real pages in EPUB)
-    offset: int
-    width: int
-    height: int
+# Tags whose strings BeautifulSoup's get_text() leaves out (Script, Stylesheet, TemplateString, ruby text).
+_SKIP_TEXT_TAGS = {"script", "style", "template", "rt", "rp"}
+# Tags inside which BeautifulSoup keeps whitespace-only strings as they are.
+_PRESERVE_WHITESPACE_TAGS = {"pre", "textarea"}
+_ASCII_SPACES = " \n\t\x0c\r"  # BeautifulSoup.ASCII_SPACES
+_NS_PREFIX_RE = re.compile(rb"</?([A-Za-z_][\w.-]*):|\s([A-Za-z_][\w.-]*):[A-Za-z_][\w.-]*\s*=")
 
 
 @dataclass
 class EpubExtract:
     text: str
-    images: list[ExtractedImage] = field(default_factory=list)
-
-def extract_epub(path: str) -> EpubExtract:
+    images: list[StoredImage] = field(default_factory=list)  # page = spine item index; already on disk
+
+def _parse_soup(content: bytes) -> tuple[str, list[str]]:
+    """Reference parser: document text as soup.get_text("\\n") plus <img> srcs in document order."""
+    soup = BeautifulSoup(content, "html.parser")
+    return soup.get_text("\n"), [img.get("src", "") for img in soup.find_all("img")]
+
+def _soup_string(text: str, preserve: bool) -> str:
+    # BeautifulSoup collapses a whitespace-only string to "\n" (if it has one) or " ", except inside <pre>/<textarea>.
+    if preserve or text.strip(_ASCII_SPACES):
+        return text
+    return "\n" if "\n" in text else " "
+
+def _lxml_strings(el, out: list[str], srcs: list[str], preserve: bool = False) -> None:
+    if el.text:
+        out.append(_soup_string(el.text, preserve))
+    for child in el:
+        tag = child.tag
+        # Comments and processing instructions have non-str tags; only their tail is text.
+        if isinstance(tag, str):
+            name = tag.rsplit("}", 1)[-1].lower()
+            if name == "img":
+                srcs.append(child.get("src", ""))
+            if name not in _SKIP_TEXT_TAGS:
+                _lxml_strings(child, out, srcs, preserve or name in _PRESERVE_WHITESPACE_TAGS)
+            else:
+                srcs.extend(i.get("src", "") for i in child.iter("{*}img"))
+        if child.tail:
+            out.append(_soup_string(child.tail, preserve))
+
+def _xml_parser():
+    from lxml import etree
+    # No entity expansion or network access; huge_tree for very large spine documents.
+    return etree.XMLParser(resolve_entities=False, no_network=True, huge_tree=True)
+
+def _parse_lxml(content: bytes) -> tuple[str, list[str]]:
+    """Fast path producing exactly the strings, in the same order, as _parse_soup.
+
+    ebooklib hands over body content re-serialized by lxml, so it is
+    well-formed XML. An XML parse keeps every text node, which libxml2's HTML
+    parser would not: it drops whitespace-only text in places such as after a
+    block element. BeautifulSoup's whitespace collapsing is then applied string
+    by string. A document that does not parse as XML goes through _parse_soup.
+    """
+    from lxml import etree
+    if not content.strip():
+        return "", []
+    if b"<![CDATA[" in content:
+        return _parse_soup(content)  # soup keeps a CDATA section as a string of its own; lxml merges it into the text
+    # ebooklib drops the namespace declarations of prefixed names (epub:type); declare them on the wrapper.
+    prefixes = {m.group(1) or m.group(2) for m in _NS_PREFIX_RE.finditer(content)} - {b"xml", b"xmlns"}
+    declarations = b"".join(b' xmlns:%s="urn:coursegen:%s"' % (p, p) for p in sorted(prefixes))
+    try:
+        root = etree.fromstring(b"<div" + declarations + b">" + content + b"</div>", _xml_parser())
+    except etree.XMLSyntaxError:
+        return _parse_soup(content)
+    out: list[str] = []
+    srcs: list[str] = []
+    _lxml_strings(root, out, srcs)
+    return "\n".join(out), srcs
+
+def _document_parser(name: str | None = None):
+    name = name or settings.epub_parser
+    if name == "lxml":
+        try:
+            import lxml.etree  # noqa: F401
+            return _parse_lxml
+        except ImportError:
+            logger.warning("lxml not installed; falling back to html.parser for EPUB parsing")
+    return _parse_soup
+
+def _executor(workers: int) -> Executor:
+    if settings.epub_parse_executor == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    # lxml releases the GIL while parsing, so threads scale without pickling documents.
+    return ThreadPoolExecutor(max_workers=workers)
+
+def extract_epub(path: str, image_sink: ImageSink | None = None, workers: int | None = None) -> EpubExtract:
+    """Extract text and images from an EPUB.
+
+    Documents are parsed with lxml when available (``settings.epub_parser``) and,
+    with ``workers > 1`` (default: ``settings.epub_parse_workers``), across a
+    thread or process pool; results are stitched back in document order.
+    """
+    workers = settings.epub_parse_workers if workers is None else workers
     book = epub.read_epub(path)
 
     # Build map of image item file names to their raw bytes
     image_items: dict[str, epub.EpubImage] = {}
     for item in book.get_items():
-        if item.get_type() == epub.ITEM_IMAGE:
+        if item.get_type() == ebooklib.ITEM_IMAGE:
             # Store by full href and by basename for flexible matching
             image_items[item.get_name()] = item
             image_items[os.path.basename(item.get_name())] = item
 
     parts: list[str] = []
-    images: list[ExtractedImage] = []
+    images: list[StoredImage] = []
+    seen_items: set[str] = set()
     cursor = 0
     item_index = 0
 
-    for item in book.get_items():
-        if item.get_type() != epub.EpubHtml.TYPE_DOCUMENT:
-            continue
-        content = item.get_body_content()
-        soup = BeautifulSoup(content, "html.parser")
-        text = soup.get_text("\n")
+    documents = [item for item in book.get_items() if item.get_type() == ebooklib.ITEM_DOCUMENT]
+    contents = [item.get_body_content() for item in documents]
+    parse = _document_parser()
+    if workers > 1 and len(documents) > 1:
+        with _executor(workers) as pool:
+            parsed = list(pool.map(parse, contents, chunksize=max(1, len(contents) // (workers * 4))))
+    else:
+        parsed = [parse(c) for c in contents]
+
+    for item, (text, srcs) in zip(documents, parsed):
         parts.append(text)
 
-        # Find <img> tags and extract referenced images
-        for img_tag in soup.find_all("img"):
-            src = img_tag.get("src", "")
+        # Resolve <img> references to image items
+        for src in (srcs if image_sink else []):
             if not src:
                 continue
             # Resolve relative paths
@@ -67,6 +153,10 @@ def extract_epub(path: str) -> EpubExtract:
                 img_item = image_items.get(resolved)
             if not img_item:
                 continue
+            # An image referenced from several documents is kept at its first reference.
+            if img_item.get_name() in seen_items:
+                continue
+            seen_items.add(img_item.get_name())
 
             img_bytes = img_item.get_content()
             if len(img_bytes) < MIN_IMAGE_BYTES:
@@ -83,8 +173,10 @@ def extract_epub(path: str) -> EpubExtract:
             }
             ext = ext_map.get(mime, mime.split("/")[-1] if "/" in mime else "png")
 
-            images.append(ExtractedImage(
-                data=img_bytes,
+            filename, digest = image_sink.store(img_bytes, ext)
+            images.append(StoredImage(
+                filename=filename,
+                sha256=digest,
                 ext=ext,
                 mime=mime,
                 page=item_index,
@@ -97,4 +189,4 @@ def extract_epub(path: str) -> EpubExtract:
         cursor += 1  # newline from join
         item_index += 1
 
-    return EpubExtract(text="\n".join(parts), images=images)
+    return EpubExtract(text="\n".join(parts), images=dedupe_images(images))
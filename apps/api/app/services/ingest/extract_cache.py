@@ -0,0 +1,72 @@
+from __future__ import annotations
+import gzip
+import json
+import logging
+import os
+import uuid
+from dataclasses import asdict, dataclass, field
+from .images import StoredImage
+
+logger = logging.getLogger(__name__)
+
+EXTRACT_CACHE_DIR = "/data/extract-cache"
+# Bump when the stored layout or the text normalisation it captures changes.
+CACHE_VERSION = 1
+
+
+@dataclass
+class CachedExtract:
+    """Extraction output needed to re-run chapterize without re-parsing the source file."""
+    source_type: str
+    text: str  # exactly what chapterize saw (already cleaned when text_is_clean)
+    text_is_clean: bool
+    toc: list[tuple[int, str, int]] | None = None
+    page_offsets: list[int] | None = None
+    images: list[StoredImage] = field(default_factory=list)
+
+    @property
+    def toc_titles(self) -> list[str] | None:
+        return [t for (_, t, _) in self.toc] if self.toc else None
+
+
+def _cache_path(content_hash: str) -> str:
+    return os.path.join(EXTRACT_CACHE_DIR, f"{content_hash}.json.gz")
+
+
+def save_extract(content_hash: str, extract: CachedExtract) -> None:
+    """Write the sidecar atomically. Failures are logged, never raised: the cache is an optimisation."""
+    path = _cache_path(content_hash)
+    tmp = f"{path}.{uuid.uuid4().hex}.part"
+    try:
+        os.makedirs(EXTRACT_CACHE_DIR, exist_ok=True)
+        data = json.dumps({"version": CACHE_VERSION, **asdict(extract)}, separators=(",", ":")).encode()
+        with gzip.open(tmp, "wb", compresslevel=6) as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        logger.warning("Could not write extraction cache for %s", content_hash, exc_info=True)
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def load_extract(content_hash: str | None) -> CachedExtract | None:
+    """Return the cached extraction for an upload hash, or None if absent, stale or unreadable."""
+    if not content_hash:
+        return None
+    try:
+        with gzip.open(_cache_path(content_hash), "rb") as f:
+            raw = json.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        logger.warning("Ignoring unreadable extraction cache for %s", content_hash, exc_info=True)
+        return None
+    if raw.pop("version", None) != CACHE_VERSION:
+        return None
+    if raw.get("toc"):
+        raw["toc"] = [tuple(e) for e in raw["toc"]]
+    return CachedExtract(**raw)
+
+
+def has_extract(content_hash: str | None) -> bool:
+    return bool(content_hash) and os.path.exists(_cache_path(content_hash))
@@ -0,0 +1,55 @@
+from __future__ import annotations
+import hashlib
+import os
+from dataclasses import dataclass, field
+from typing import TypedDict
+
+
+class StoredImage(TypedDict):
+    filename: str
+    sha256: str
+    ext: str
+    mime: str
+    page: int
+    offset: int
+    width: int
+    height: int
+
+
+@dataclass
+class ImageSink:
+    """Writes extracted images straight to disk, named by content hash.
+
+    Picklable so PDF pool workers can each carry one: identical images map to the same
+    file, so duplicates collapse on disk even across processes.
+    """
+    directory: str
+    _seen: set[str] = field(default_factory=set, repr=False)
+
+    def store(self, data: bytes, ext: str) -> tuple[str, str]:
+        """Persist image bytes (once per content hash). Returns (filename, sha256)."""
+        digest = hashlib.sha256(data).hexdigest()
+        filename = f"{digest[:32]}.{ext}"
+        if digest in self._seen:
+            return filename, digest
+        self._seen.add(digest)
+        path = os.path.join(self.directory, filename)
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return filename, digest
+
+
+def dedupe_images(images: list[StoredImage]) -> list[StoredImage]:
+    """Keep the first occurrence (in document order) of each distinct image."""
+    seen: set[str] = set()
+    out: list[StoredImage] = []
+    for img in images:
+        if img["sha256"] in seen:
+            continue
+        seen.add(img["sha256"])
+        out.append(img)
+    return out
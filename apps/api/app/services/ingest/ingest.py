@@ -1,14 +1,19 @@
 from __future__ import annotations
 import logging
 import os
+import shutil
+import time
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
-from ...models import Book, Chapter, Chunk, Image
-from .pdf import extract_pdf, ExtractedImage as PdfExtractedImage
-from .epub import extract_epub, ExtractedImage as EpubExtractedImage
+from sqlalchemy import select, delete, func
+from ...models import Artifact, Book, Chapter, Job
+from .pdf import extract_pdf
+from .epub import extract_epub
+from .images import ImageSink, StoredImage
 from .text import extract_text
-from .chapterize import chapterize
-from .chunking import chunk_text, clean_text
+from .chapterize import chapterize, ChapterizeReport
+from .chunking import clean_text
+from .extract_cache import CachedExtract, load_extract, save_extract
+from .persist import delete_chapters, insert_chapters, insert_images, reassign_images
 
 logger = logging.getLogger(__name__)
 
@@ -16,148 +21,191 @@ SUPPORTED = {".pdf", ".epub", ".txt", ".md"}
 IMAGES_ROOT = "/data/images"
 
 
-def _save_images_to_disk(
-    book_id: int,
-    images: list[PdfExtractedImage] | list[EpubExtractedImage],
-    source_type: str,
-) -> list[dict]:
-    """Save extracted image bytes to disk and return metadata dicts."""
-    if not images:
-        return []
-    book_dir = os.path.join(IMAGES_ROOT, str(book_id))
-    os.makedirs(book_dir, exist_ok=True)
-
-    saved: list[dict] = []
-    seen_xrefs: set[bytes] = set()  # deduplicate identical image data
-
-    for idx, img in enumerate(images):
-        # Simple deduplication by first 64 bytes + length
-        sig = img["data"][:64] + len(img["data"]).to_bytes(8, "big")
-        if sig in seen_xrefs:
-            continue
-        seen_xrefs.add(sig)
-
-        if source_type == "pdf":
-            filename = f"{book_id}_{img['page']}_{idx}.{img['ext']}"
-        else:
-            filename = f"{book_id}_{idx}.{img['ext']}"
-
-        filepath = os.path.join(book_dir, filename)
-        with open(filepath, "wb") as f:
-            f.write(img["data"])
-
-        saved.append({
-            "filename": filename,
-            "mime_type": img["mime"],
-            "source_page": img["page"],
-            "position_offset": img["offset"],
-            "width": img["width"],
-            "height": img["height"],
-        })
-
-    return saved
-
-
-async def ingest_book(session: AsyncSession, file_path: str, title: str | None = None, author: str | None = None) -> Book:
+_SOURCE_TYPES = {".pdf": "pdf", ".epub": "epub"}
+
+# Tasks that read a book's chapters while they run; rechapterizing under them pulls the rows away.
+GENERATION_TASKS = (
+    "app.workers.tasks.generate_job",
+    "app.workers.tasks.generate_book_job",
+    "app.workers.tasks.batch_generate_job",
+)
+
+
+def _book_image_dir(book_id: int) -> str:
+    return os.path.join(IMAGES_ROOT, str(book_id))
+
+
+async def ingest_book(
+    session: AsyncSession,
+    file_path: str,
+    title: str | None = None,
+    author: str | None = None,
+    content_hash: str | None = None,
+    progress_cb=None,
+) -> Book:
     ext = os.path.splitext(file_path)[1].lower()
     if ext not in SUPPORTED:
         raise ValueError(f"Unsupported file type: {ext}. Supported: {sorted(SUPPORTED)}")
 
+    async def _progress(pct: int, msg: str):
+        if progress_cb:
+            await progress_cb(pct, msg)
+
+    source_type = _SOURCE_TYPES.get(ext, "text")
+
+    # The book row comes first so extraction can stream images straight into its directory.
+    inferred_title = title or os.path.basename(file_path)
+    book = Book(title=inferred_title, author=author, source_type=source_type, content_hash=content_hash)
+    session.add(book)
+    await session.flush()
+    sink = ImageSink(_book_image_dir(book.id))
+    try:
+        return await _ingest_into(session, book, file_path, ext, sink, _progress)
+    except Exception:
+        shutil.rmtree(sink.directory, ignore_errors=True)
+        raise
+
+
+async def _ingest_into(session: AsyncSession, book: Book, file_path: str, ext: str, sink: ImageSink, _progress) -> Book:
     toc_entries: list[tuple[int, str, int]] | None = None
     page_offsets: list[int] | None = None
-    extracted_images: list[PdfExtractedImage] | list[EpubExtractedImage] = []
+    extracted_images: list[StoredImage] = []
 
+    await _progress(5, "Extracting text")
+    t0 = time.perf_counter()
     if ext == ".pdf":
-        ex = extract_pdf(file_path)
+        ex = extract_pdf(file_path, image_sink=sink)
         full_text = ex.text
         toc_titles = [t for (_, t, _) in ex.toc] if ex.toc else None
         toc_entries = ex.toc or None
         page_offsets = ex.page_offsets
         extracted_images = ex.images
-        source_type = "pdf"
     elif ext == ".epub":
-        ex = extract_epub(file_path)
+        ex = extract_epub(file_path, image_sink=sink)
         full_text = ex.text
         toc_titles = None
         extracted_images = ex.images
-        source_type = "epub"
     else:
         full_text = extract_text(file_path)
         toc_titles = None
-        source_type = "text"
 
     # Keep raw PDF text when using page-based TOC offsets so slicing remains aligned.
-    if not (toc_entries and page_offsets):
+    text_is_clean = not (toc_entries and page_offsets)
+    if text_is_clean:
         full_text = clean_text(full_text)
-    inferred_title = title or os.path.basename(file_path)
-    book = Book(title=inferred_title, author=author, source_type=source_type)
-    session.add(book)
-    await session.flush()
-
-    # Save extracted images to disk
-    image_records = _save_images_to_disk(book.id, extracted_images, source_type)
-
+    extract_ms = round((time.perf_counter() - t0) * 1000, 2)
+
+    if book.content_hash:
+        save_extract(book.content_hash, CachedExtract(
+            source_type=book.source_type,
+            text=full_text,
+            text_is_clean=text_is_clean,
+            toc=toc_entries,
+            page_offsets=page_offsets,
+            images=extracted_images,
+        ))
+
+    await _progress(30, "Detecting chapters")
+    report = ChapterizeReport(text_len=len(full_text))
     spans = chapterize(
         full_text,
         toc_titles=toc_titles,
         toc_entries=toc_entries,
         page_offsets=page_offsets,
+        report=report,
     )
+    book.ingest_report = {
+        "extract_ms": extract_ms,
+        "pages": len(page_offsets or []),
+        "images": len(extracted_images),
+        "chapterize": report.as_dict(),
+    }
+
+    # store chapters + chunks (batched inserts, one transaction)
+    await _progress(50, f"Chunking {len(spans)} chapters")
+    chapter_ids = await insert_chapters(session, book.id, spans, full_text, text_is_clean=text_is_clean)
+
+    # Images are already on disk (written by the sink during extraction); only index them here.
+    await _progress(70, f"Indexing {len(extracted_images)} images")
+    await insert_images(session, book.id, spans, chapter_ids, extracted_images)
+
+    await _progress(90, "Committing")
+    await session.commit()
+    return book
 
-    # store chapters + chunks
-    for span in spans:
-        ch_text = full_text[span.start:span.end].strip()
-        words = len(ch_text.split())
-        chapter = Chapter(
-            book_id=book.id,
-            index=span.index,
-            title=span.title,
-            start_offset=span.start,
-            end_offset=span.end,
-            word_count=words,
+
+async def count_artifacts(session: AsyncSession, book_id: int) -> int:
+    return (await session.execute(
+        select(func.count(Artifact.id)).join(Chapter, Artifact.chapter_id==Chapter.id).where(Chapter.book_id==book_id)
+    )).scalar_one()
+
+
+async def active_generation_jobs(session: AsyncSession, book_id: int) -> list[str]:
+    """Ids of generation jobs for the book that are queued or running."""
+    return list((await session.execute(
+        select(Job.id).where(
+            Job.task.in_(GENERATION_TASKS),
+            Job.status.in_(("queued", "started")),
+            func.json_extract(Job.payload, "$.book_id") == book_id,
         )
-        session.add(chapter)
-        await session.flush()
-
-        chunks = chunk_text(ch_text)
-        for i, c in enumerate(chunks, start=1):
-            session.add(Chunk(chapter_id=chapter.id, chunk_index=i, text=c))
-
-        # Assign images to this chapter based on position_offset
-        for img_rec in image_records:
-            offset = img_rec.get("position_offset")
-            if offset is not None and span.start <= offset < span.end:
-                session.add(Image(
-                    book_id=book.id,
-                    chapter_id=chapter.id,
-                    filename=img_rec["filename"],
-                    mime_type=img_rec["mime_type"],
-                    source_page=img_rec["source_page"],
-                    position_offset=offset,
-                    width=img_rec["width"],
-                    height=img_rec["height"],
-                ))
-
-    # Save any images that didn't fall into a chapter (offset before first or after last)
-    assigned_offsets = set()
-    for span in spans:
-        for img_rec in image_records:
-            offset = img_rec.get("position_offset")
-            if offset is not None and span.start <= offset < span.end:
-                assigned_offsets.add(id(img_rec))
-
-    for img_rec in image_records:
-        if id(img_rec) not in assigned_offsets:
-            session.add(Image(
-                book_id=book.id,
-                chapter_id=None,
-                filename=img_rec["filename"],
-                mime_type=img_rec["mime_type"],
-                source_page=img_rec["source_page"],
-                position_offset=img_rec.get("position_offset"),
-                width=img_rec["width"],
-                height=img_rec["height"],
-            ))
+    )).scalars().all())
+
+
+async def rechapterize_book(
+    session: AsyncSession,
+    book: Book,
+    min_chapter_chars: int = 2000,
+    strategy: str | None = None,
+    discard_artifacts: bool = False,
+    progress_cb=None,
+) -> int:
+    """Re-run chapter detection from the cached extraction and rewrite chapter/chunk rows.
+
+    The source file is not read; images stay on disk and are only re-pointed at
+    the new chapters. Existing artifacts belong to the old chapters and are
+    removed, but only with ``discard_artifacts``; that and the absence of
+    generation jobs on the book are checked again here, in the transaction that
+    deletes the chapters. Returns the new chapter count.
+    """
+    async def _progress(pct: int, msg: str):
+        if progress_cb:
+            await progress_cb(pct, msg)
+
+    ex = load_extract(book.content_hash)
+    if ex is None:
+        raise LookupError(f"No extraction cache for book {book.id}")
+
+    await _progress(10, "Detecting chapters")
+    report = ChapterizeReport(text_len=len(ex.text))
+    spans = chapterize(
+        ex.text,
+        toc_titles=ex.toc_titles,
+        toc_entries=ex.toc,
+        page_offsets=ex.page_offsets,
+        min_chapter_chars=min_chapter_chars,
+        report=report,
+        strategy=strategy,
+    )
 
+    await _progress(40, f"Chunking {len(spans)} chapters")
+    # Checked again at run time: artifacts or generation jobs may have appeared since the request.
+    running = await active_generation_jobs(session, book.id)
+    if running:
+        raise RuntimeError(f"Generation job {running[0]} is queued or running for this book")
+    if not discard_artifacts:
+        artifacts = await count_artifacts(session, book.id)
+        if artifacts:
+            raise RuntimeError(f"Book has {artifacts} generated artifacts; set discard_artifacts to replace its chapters")
+    await delete_chapters(session, book.id)
+    chapter_ids = await insert_chapters(session, book.id, spans, ex.text, text_is_clean=ex.text_is_clean)
+    await reassign_images(session, book.id, spans, chapter_ids)
+
+    # Reassign so SQLAlchemy sees the JSON column change.
+    book.ingest_report = {
+        **(book.ingest_report or {}),
+        "chapterize": report.as_dict(),
+        "rechapterize": {"min_chapter_chars": min_chapter_chars, "strategy": strategy},
+    }
+    await _progress(90, "Committing")
     await session.commit()
-    return book
+    return len(spans)
@@ -1,9 +1,12 @@
 from __future__ import annotations
 import io
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import fitz  # PyMuPDF
 from dataclasses import dataclass, field
-from typing import TypedDict
+from ...settings import settings
+from .images import ImageSink, StoredImage, dedupe_images
 
 logger = logging.getLogger(__name__)
 
@@ -11,83 +14,150 @@ MIN_IMAGE_BYTES = 5 * 1024  # 5 KB
 MIN_IMAGE_DIM = 50  # pixels
 
 
-class ExtractedImage(TypedDict):
-    data: bytes
-    ext: str
-    mime: str
-    page: int
-    offset: int
-    width: int
-    height: int
-
-
 @dataclass
 class PdfExtract:
     text: str
     toc: list[tuple[int, str, int]]  # (level, title, page)
     page_offsets: list[int]  # 0-based character offsets by 1-based PDF page index
-    images: list[ExtractedImage] = field(default_factory=list)
+    images: list[StoredImage] = field(default_factory=list)  # already on disk via ImageSink
+
+
+@dataclass
+class _PageResult:
+    index: int
+    text: str
+    images: list[StoredImage] = field(default_factory=list)  # offset filled in when stitching
+
+
+def _page_images(
+    doc: fitz.Document,
+    page: fitz.Page,
+    i: int,
+    sink: ImageSink,
+    seen_xrefs: set[int],
+) -> list[StoredImage]:
+    images: list[StoredImage] = []
+    try:
+        for img_index, img_info in enumerate(page.get_images(full=True)):
+            xref = img_info[0]
+            # Same xref on a later page is the same image; only the first occurrence is kept.
+            if xref in seen_xrefs:
+                continue
+            seen_xrefs.add(xref)
+            # get_images() reports dimensions, so skip icons before decoding anything.
+            if img_info[2] < MIN_IMAGE_DIM or img_info[3] < MIN_IMAGE_DIM:
+                continue
+            try:
+                extracted = doc.extract_image(xref)
+                if not extracted or not extracted.get("image"):
+                    continue
+                img_bytes = extracted["image"]
+                if len(img_bytes) < MIN_IMAGE_BYTES:
+                    continue
+                w = extracted.get("width", 0)
+                h = extracted.get("height", 0)
+                if w < MIN_IMAGE_DIM or h < MIN_IMAGE_DIM:
+                    continue
+                ext = extracted.get("ext", "png")
+                mime_map = {
+                    "png": "image/png",
+                    "jpeg": "image/jpeg",
+                    "jpg": "image/jpeg",
+                    "webp": "image/webp",
+                    "gif": "image/gif",
+                    "bmp": "image/bmp",
+                    "tiff": "image/tiff",
+                }
+                mime = mime_map.get(ext, f"image/{ext}")
+                filename, digest = sink.store(img_bytes, ext)
+                images.append(StoredImage(
+                    filename=filename,
+                    sha256=digest,
+                    ext=ext,
+                    mime=mime,
+                    page=i,
+                    offset=0,
+                    width=w,
+                    height=h,
+                ))
+            except Exception:
+                logger.debug("Failed to extract image xref %d on page %d", xref, i)
+    except Exception:
+        logger.debug("Failed to get images from page %d", i)
+    return images
 
-def extract_pdf(path: str) -> PdfExtract:
+
+def _extract_page_range(path: str, start: int, end: int, sink: ImageSink | None) -> list[_PageResult]:
+    """Extract pages [start, end) of a PDF. Runs in pool workers, so it opens its own document."""
     doc = fitz.open(path)
-    toc = doc.get_toc(simple=True)  # list [lvl, title, page]
+    try:
+        results: list[_PageResult] = []
+        seen_xrefs: set[int] = set()
+        for i in range(start, min(end, len(doc))):
+            page = doc[i]
+            images = _page_images(doc, page, i, sink, seen_xrefs) if sink else []
+            results.append(_PageResult(index=i, text=page.get_text("text"), images=images))
+        return results
+    finally:
+        doc.close()
+
+
+def _page_ranges(total_pages: int, workers: int) -> list[tuple[int, int]]:
+    # A few shards per worker so one slow (image-heavy) range doesn't stall the pool.
+    shards = max(1, min(total_pages, workers * 4))
+    step = -(-total_pages // shards)
+    return [(s, min(total_pages, s + step)) for s in range(0, total_pages, step)]
+
+
+def _stitch(pages: list[_PageResult], toc: list, total_pages: int) -> PdfExtract:
     parts: list[str] = []
     page_offsets: list[int] = []
-    images: list[ExtractedImage] = []
+    images: list[StoredImage] = []
     cursor = 0
-    total_pages = len(doc)
-    for i, page in enumerate(doc):
+    for r in pages:
         page_offsets.append(cursor)
-        page_text = page.get_text("text")
-        parts.append(page_text)
-
-        # Extract images from this page
-        try:
-            for img_index, img_info in enumerate(page.get_images(full=True)):
-                xref = img_info[0]
-                try:
-                    extracted = doc.extract_image(xref)
-                    if not extracted or not extracted.get("image"):
-                        continue
-                    img_bytes = extracted["image"]
-                    if len(img_bytes) < MIN_IMAGE_BYTES:
-                        continue
-                    w = extracted.get("width", 0)
-                    h = extracted.get("height", 0)
-                    if w < MIN_IMAGE_DIM or h < MIN_IMAGE_DIM:
-                        continue
-                    ext = extracted.get("ext", "png")
-                    mime_map = {
-                        "png": "image/png",
-                        "jpeg": "image/jpeg",
-                        "jpg": "image/jpeg",
-                        "webp": "image/webp",
-                        "gif": "image/gif",
-                        "bmp": "image/bmp",
-                        "tiff": "image/tiff",
-                    }
-                    mime = mime_map.get(ext, f"image/{ext}")
-                    images.append(ExtractedImage(
-                        data=img_bytes,
-                        ext=ext,
-                        mime=mime,
-                        page=i,
-                        offset=cursor,
-                        width=w,
-                        height=h,
-                    ))
-                except Exception:
-                    logger.debug("Failed to extract image xref %d on page %d", xref, i)
-        except Exception:
-            logger.debug("Failed to get images from page %d", i)
-
-        cursor += len(page_text)
-        if i < total_pages - 1:
+        parts.append(r.text)
+        for img in r.images:
+            img["offset"] = cursor
+            images.append(img)
+        cursor += len(r.text)
+        if r.index < total_pages - 1:
             cursor += 1  # newline inserted by "\n".join(parts)
-    text = "\n".join(parts)
     return PdfExtract(
-        text=text,
+        text="\n".join(parts),
         toc=[(lvl, title, page) for (lvl, title, page) in toc],
         page_offsets=page_offsets,
-        images=images,
+        # Shards can each meet the same xref; keep the first occurrence in page order.
+        images=dedupe_images(images),
     )
+
+
+def extract_pdf(path: str, image_sink: ImageSink | None = None, workers: int | None = None) -> PdfExtract:
+    """Extract text, TOC, page offsets and images from a PDF.
+
+    Images are written through ``image_sink`` as they are found (skipped if it is None),
+    so only their metadata is held in memory.
+
+    With ``workers > 1`` (default: ``settings.pdf_extract_workers``) and enough pages,
+    page ranges are sharded across a process pool and stitched back in page order;
+    the result is identical to the serial path.
+    """
+    workers = settings.pdf_extract_workers if workers is None else workers
+    doc = fitz.open(path)
+    try:
+        toc = doc.get_toc(simple=True)  # list [lvl, title, page]
+        total_pages = len(doc)
+    finally:
+        doc.close()
+
+    if workers <= 1 or total_pages < settings.pdf_parallel_min_pages:
+        pages = _extract_page_range(path, 0, total_pages, image_sink)
+        return _stitch(pages, toc, total_pages)
+
+    ranges = _page_ranges(total_pages, workers)
+    # spawn: PyMuPDF state is not fork-safe, and each worker opens its own document anyway.
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=ctx) as pool:
+        futures = [pool.submit(_extract_page_range, path, s, e, image_sink) for (s, e) in ranges]
+        pages = [r for fut in futures for r in fut.result()]
+    return _stitch(pages, toc, total_pages)
@@ -0,0 +1,145 @@
+from __future__ import annotations
+import bisect
+from typing import Iterable, Iterator
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from ...models import Artifact, Chapter, Chunk, FlashcardReview, Image
+from ...settings import settings
+from ..llm.tokens import chunk_token_budget, default_model, get_tokenizer
+from .chapterize import ChapterSpan
+from .chunking import clean_text, iter_chunks
+from .images import StoredImage
+
+# Rows per executemany; bounds memory without giving up batching.
+BULK_BATCH = 1000
+
+
+def _batched(rows: Iterable[dict], size: int = BULK_BATCH) -> Iterator[list[dict]]:
+    batch: list[dict] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def insert_chapters(
+    session: AsyncSession,
+    book_id: int,
+    spans: list[ChapterSpan],
+    full_text: str,
+    *,
+    text_is_clean: bool = True,
+) -> list[int]:
+    """Insert all chapters (and their chunks) in batches. Returns chapter ids in span order.
+
+    Chunks are sized for the default provider/model's context window. Pass
+    ``text_is_clean=False`` when full_text is raw (kept for offset alignment) so
+    each chapter slice is cleaned before chunking.
+    """
+    chapter_ids: list[int] = []
+    rows = [
+        {
+            "book_id": book_id,
+            "index": span.index,
+            "title": span.title,
+            "start_offset": span.start,
+            "end_offset": span.end,
+            "word_count": len(full_text[span.start:span.end].split()),
+        }
+        for span in spans
+    ]
+    for batch in _batched(rows):
+        res = await session.execute(
+            insert(Chapter).returning(Chapter.id, sort_by_parameter_order=True),
+            batch,
+        )
+        chapter_ids.extend(res.scalars().all())
+
+    provider_name, model = default_model()
+    max_tokens = chunk_token_budget(provider_name, model)
+    count = get_tokenizer(model)
+
+    def _chunk_rows() -> Iterator[dict]:
+        for chapter_id, span in zip(chapter_ids, spans):
+            ch_text = full_text[span.start:span.end]
+            ch_text = ch_text.strip() if text_is_clean else clean_text(ch_text)
+            chunks = iter_chunks(ch_text, max_tokens, settings.chunk_overlap_tokens, count)
+            for i, (c, n) in enumerate(chunks, start=1):
+                yield {"chapter_id": chapter_id, "chunk_index": i, "text": c, "token_count": n}
+
+    for batch in _batched(_chunk_rows()):
+        await session.execute(insert(Chunk), batch)
+    return chapter_ids
+
+
+def _chapter_at(starts: list[int], spans: list[ChapterSpan], chapter_ids: list[int], offset: int | None) -> int | None:
+    if offset is None:
+        return None
+    i = bisect.bisect_right(starts, offset) - 1
+    return chapter_ids[i] if i >= 0 and offset < spans[i].end else None
+
+
+def assign_images(spans: list[ChapterSpan], chapter_ids: list[int], images: list[StoredImage]) -> Iterator[tuple[int | None, StoredImage]]:
+    """Yield (chapter_id, image); chapter_id is None for images outside every span.
+
+    Spans are sorted and non-overlapping (see chapterize._finalize_spans), so a binary
+    search over span starts finds the only candidate.
+    """
+    starts = [s.start for s in spans]
+    for img in images:
+        yield _chapter_at(starts, spans, chapter_ids, img["offset"]), img
+
+
+async def delete_chapters(session: AsyncSession, book_id: int) -> None:
+    """Remove a book's chapters with their chunks and artifacts.
+
+    Deleted explicitly rather than via ON DELETE CASCADE, which SQLite only
+    honours with PRAGMA foreign_keys enabled.
+    """
+    chapter_ids = select(Chapter.id).where(Chapter.book_id == book_id)
+    artifact_ids = select(Artifact.id).where(Artifact.chapter_id.in_(chapter_ids))
+    await session.execute(delete(FlashcardReview).where(FlashcardReview.artifact_id.in_(artifact_ids)))
+    await session.execute(delete(Artifact).where(Artifact.chapter_id.in_(chapter_ids)))
+    await session.execute(delete(Chunk).where(Chunk.chapter_id.in_(chapter_ids)))
+    await session.execute(update(Image).where(Image.book_id == book_id).values(chapter_id=None))
+    await session.execute(delete(Chapter).where(Chapter.book_id == book_id))
+
+
+async def reassign_images(session: AsyncSession, book_id: int, spans: list[ChapterSpan], chapter_ids: list[int]) -> None:
+    """Point a book's existing image rows at the chapters now covering their offsets."""
+    starts = [s.start for s in spans]
+    rows = (
+        {"id": image_id, "chapter_id": _chapter_at(starts, spans, chapter_ids, offset)}
+        for image_id, offset in (await session.execute(
+            select(Image.id, Image.position_offset).where(Image.book_id == book_id)
+        )).all()
+    )
+    for batch in _batched(rows):
+        await session.execute(update(Image), batch)
+
+
+async def insert_images(
+    session: AsyncSession,
+    book_id: int,
+    spans: list[ChapterSpan],
+    chapter_ids: list[int],
+    images: list[StoredImage],
+) -> None:
+    rows = (
+        {
+            "book_id": book_id,
+            "chapter_id": chapter_id,
+            "filename": img["filename"],
+            "mime_type": img["mime"],
+            "source_page": img["page"],
+            "position_offset": img["offset"],
+            "width": img["width"],
+            "height": img["height"],
+        }
+        for chapter_id, img in assign_images(spans, chapter_ids, images)
+    )
+    for batch in _batched(rows):
+        await session.execute(insert(Image), batch)
@@ -1,7 +1,54 @@
 from __future__ import annotations
-from typing import Protocol, Any
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Protocol, Any, AsyncIterator
+import httpx
+from redis.exceptions import RedisError
+from .ratelimit import RateLimited
+
+def is_transient(exc: BaseException) -> bool:
+    """Whether a failed call is worth trying again later: throttling, provider 5xx, lost connections."""
+    if isinstance(exc, (RateLimited, httpx.TransportError, asyncio.TimeoutError, RedisError)):
+        return True
+    msg = str(exc)
+    return isinstance(exc, RuntimeError) and any(f"error {c}" in msg for c in range(500, 600))
+
+@dataclass
+class StreamStats:
+    """Timing for one streamed completion; filled in by the provider while it streams."""
+    started: float = field(default_factory=time.perf_counter)
+    ttft_ms: float | None = None  # request start -> first text delta
+    total_ms: float = 0.0
+    output_tokens: int = 0  # provider-reported when available, else estimated from the text
+    usage_reported: bool = False  # set by the provider once output_tokens is its own count
+
+    def first_delta(self) -> None:
+        if self.ttft_ms is None:
+            self.ttft_ms = round((time.perf_counter() - self.started) * 1000, 2)
+
+    def finish(self) -> None:
+        self.total_ms = round((time.perf_counter() - self.started) * 1000, 2)
+
+    @property
+    def tokens_per_s(self) -> float:
+        """Decode rate, measured from the first delta so queueing/prefill is excluded."""
+        gen_ms = (self.total_ms or (time.perf_counter() - self.started) * 1000) - (self.ttft_ms or 0.0)
+        return round(self.output_tokens / (gen_ms / 1000), 2) if gen_ms > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "ttft_ms": self.ttft_ms,
+            "total_ms": self.total_ms,
+            "output_tokens": self.output_tokens,
+            "tokens_per_s": self.tokens_per_s,
+        }
 
 class LLMProvider(Protocol):
     name: str
     async def generate(self, *, system: str, user: str, json_schema: dict | None, params: dict) -> dict[str, Any]:
         ...
+
+    def stream(self, *, system: str, user: str, params: dict, stats: StreamStats | None = None) -> AsyncIterator[str]:
+        """Yield text deltas as they arrive. Not retried; see llm.streaming.collect_stream."""
+        ...
@@ -0,0 +1,138 @@
+"""Local stand-in for the OpenAI Files/Batches/Responses endpoints, for exercising bulk mode offline.
+
+    uvicorn app.services.llm.batch_stub:app --port 9000
+    COURSEGEN_OPENAI_BASE_URL=http://localhost:9000/v1 COURSEGEN_OPENAI_API_KEY=stub
+
+Every request gets the same canned notes. Batches complete after
+``BATCH_STUB_DELAY`` seconds (default 0). With ``BATCH_STUB_FAIL_EVERY=n``
+every n-th request of a batch fails and lands in its error file instead, as
+a partially failed OpenAI batch would. State is in memory only.
+"""
+from __future__ import annotations
+import json
+import os
+import time
+import uuid
+from fastapi import APIRouter, FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import PlainTextResponse
+
+DELAY = float(os.environ.get("BATCH_STUB_DELAY", "0"))
+FAIL_EVERY = int(os.environ.get("BATCH_STUB_FAIL_EVERY", "0"))
+
+NOTES = {
+    "important_points": ["Stub point from the local batch server."],
+    "concepts": ["stub concept"],
+    "definitions": [],
+    "examples": [],
+    "pitfalls": [],
+}
+
+_files: dict[str, str] = {}
+_batches: dict[str, dict] = {}
+
+router = APIRouter(prefix="/v1")
+
+
+def _response(model: str | None) -> dict:
+    return {
+        "id": f"resp_{uuid.uuid4().hex}",
+        "object": "response",
+        "model": model or "stub",
+        "status": "completed",
+        "output_text": json.dumps(NOTES),
+        "usage": {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0},
+    }
+
+
+def _store(lines: list[str]) -> str | None:
+    # Like OpenAI, an output or error file only exists if it has lines.
+    if not lines:
+        return None
+    file_id = f"file-{uuid.uuid4().hex}"
+    _files[file_id] = "\n".join(lines)
+    return file_id
+
+
+def _refresh(batch: dict) -> dict:
+    if batch["status"] != "in_progress" or time.time() < batch["created_at"] + DELAY:
+        return batch
+    lines: list[str] = []
+    errors: list[str] = []
+    requests = [json.loads(line) for line in _files[batch["input_file_id"]].splitlines() if line.strip()]
+    for n, req in enumerate(requests, start=1):
+        if FAIL_EVERY and n % FAIL_EVERY == 0:
+            errors.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": req["custom_id"],
+                "response": {"status_code": 500, "body": {"error": {"message": "Stub failure", "type": "server_error"}}},
+                "error": None,
+            }))
+            continue
+        body = _response(req.get("body", {}).get("model"))
+        lines.append(json.dumps({
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": req["custom_id"],
+            "response": {"status_code": 200, "body": body},
+            "error": None,
+        }))
+    batch.update(
+        status="completed",
+        output_file_id=_store(lines),
+        error_file_id=_store(errors),
+        completed_at=int(time.time()),
+        request_counts={"total": len(requests), "completed": len(lines), "failed": len(errors)},
+    )
+    return batch
+
+
+@router.post("/files")
+async def upload_file(file: UploadFile = File(...), purpose: str = Form(...)):
+    file_id = f"file-{uuid.uuid4().hex}"
+    _files[file_id] = (await file.read()).decode("utf-8")
+    return {"id": file_id, "object": "file", "purpose": purpose, "filename": file.filename}
+
+
+@router.get("/files/{file_id}/content", response_class=PlainTextResponse)
+async def file_content(file_id: str):
+    if file_id not in _files:
+        raise HTTPException(404, "File not found")
+    return _files[file_id]
+
+
+@router.post("/batches")
+async def create_batch(body: dict):
+    if body.get("input_file_id") not in _files:
+        raise HTTPException(400, "Unknown input_file_id")
+    total = sum(1 for line in _files[body["input_file_id"]].splitlines() if line.strip())
+    batch_id = f"batch_{uuid.uuid4().hex}"
+    _batches[batch_id] = {
+        "id": batch_id,
+        "object": "batch",
+        "endpoint": body.get("endpoint"),
+        "input_file_id": body["input_file_id"],
+        "completion_window": body.get("completion_window"),
+        "status": "in_progress",
+        "output_file_id": None,
+        "error_file_id": None,
+        "created_at": int(time.time()),
+        "metadata": body.get("metadata") or {},
+        "request_counts": {"total": total, "completed": 0, "failed": 0},
+    }
+    return _refresh(_batches[batch_id])
+
+
+@router.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    if batch_id not in _batches:
+        raise HTTPException(404, "Batch not found")
+    return _refresh(_batches[batch_id])
+
+
+@router.post("/responses")
+async def responses(body: dict):
+    # Non-streaming only; lets reduce calls finish against the stub too (with llm_stream off).
+    return _response(body.get("model"))
+
+
+app = FastAPI(title="coursegen batch stub")
+app.include_router(router)
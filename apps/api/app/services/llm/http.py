@@ -0,0 +1,48 @@
+from __future__ import annotations
+import asyncio
+import logging
+import weakref
+import httpx
+from ...settings import settings
+
+logger = logging.getLogger(__name__)
+
+# One pool per (event loop, base URL): httpx connections are bound to the loop that opened them.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+
+
+def _http2_enabled() -> bool:
+    if not settings.llm_http2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logger.warning("COURSEGEN_LLM_HTTP2 is set but h2 is not installed; using HTTP/1.1")
+        return False
+
+
+def get_client(base_url: str) -> httpx.AsyncClient:
+    """Shared keep-alive client for base_url on the running loop; created on first use."""
+    per_loop = _clients.setdefault(asyncio.get_running_loop(), {})
+    client = per_loop.get(base_url)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=base_url,
+            http2=_http2_enabled(),
+            limits=httpx.Limits(
+                max_connections=settings.llm_http_max_connections,
+                max_keepalive_connections=settings.llm_http_max_keepalive,
+                keepalive_expiry=settings.llm_http_keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(settings.llm_http_timeout, connect=10.0),
+        )
+        per_loop[base_url] = client
+    return client
+
+
+async def aclose_clients() -> None:
+    """Close the pools opened on the running loop (app shutdown, end of a worker job)."""
+    per_loop = _clients.pop(asyncio.get_running_loop(), {})
+    for client in per_loop.values():
+        await client.aclose()
@@ -1,8 +1,14 @@
 from __future__ import annotations
-from typing import Any
-import httpx
+import json
+import time
+from typing import Any, AsyncIterator
 from tenacity import retry, stop_after_attempt, wait_exponential
 from ...settings import settings
+from .base import StreamStats
+from .http import get_client
+from .ratelimit import RateLimited, parse_retry_after, permit
+from .tokens import count_tokens
+from .usage import count_retry, record
 
 class OllamaProvider:
     name = "ollama"
@@ -10,31 +16,41 @@ class OllamaProvider:
     def __init__(self, base_url: str | None = None):
         self.base_url = (base_url or settings.ollama_base_url).rstrip("/")
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=10))
-    async def generate(self, *, system: str, user: str, json_schema: dict | None, params: dict) -> dict[str, Any]:
+    def _payload(self, system: str, user: str, params: dict, *, stream: bool) -> tuple[str, dict[str, Any]]:
         model = params.get("model") or settings.ollama_model
         temperature = float(params.get("temperature", 0.3))
 
         # Ollama /api/chat
-        url = f"{self.base_url}/api/chat"
         payload: dict[str, Any] = {
             "model": model,
             "messages": [
                 {"role": "system", "content": system},
                 {"role": "user", "content": user},
             ],
-            "options": {"temperature": temperature},
-            "stream": False,
+            "options": {"temperature": temperature, "num_ctx": settings.ollama_num_ctx},
+            "stream": stream,
         }
+        return model, payload
+
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=10), before_sleep=count_retry)
+    async def generate(self, *, system: str, user: str, json_schema: dict | None, params: dict) -> dict[str, Any]:
+        model, payload = self._payload(system, user, params, stream=False)
 
         # If schema requested, we still ask for strict JSON in prompt
-        async with httpx.AsyncClient(timeout=180) as client:
-            r = await client.post(url, json=payload)
+        estimate = count_tokens(system + user, model) + settings.llm_output_token_reserve
+        async with permit(self.name, model, estimate) as p:
+            started = time.perf_counter()
+            r = await get_client(self.base_url).post("/api/chat", json=payload, timeout=180)
+            if r.status_code == 429:
+                raise RateLimited(f"Ollama error 429: {r.text[:500]}", parse_retry_after(r.headers))
             if r.status_code >= 400:
                 raise RuntimeError(f"Ollama error {r.status_code}: {r.text[:500]}")
             data = r.json()
+            if "eval_count" in data:
+                p.tokens = data.get("prompt_eval_count", 0) + data["eval_count"]
 
         content = data.get("message", {}).get("content", "") or ""
+        self._record(data, system + user, content, model, (time.perf_counter() - started) * 1000)
         if json_schema:
             import json as _json
             try:
@@ -42,3 +58,45 @@ class OllamaProvider:
             except Exception:
                 return {"raw_text": content}
         return {"raw_text": content}
+
+    async def stream(self, *, system: str, user: str, params: dict, stats: StreamStats | None = None) -> AsyncIterator[str]:
+        model, payload = self._payload(system, user, params, stream=True)
+        stats = stats if stats is not None else StreamStats()
+        estimate = count_tokens(system + user, model) + settings.llm_output_token_reserve
+        final: dict = {}
+        parts: list[str] = []  # only to estimate usage if the final line has no counts
+        async with permit(self.name, model, estimate) as p:
+            async with get_client(self.base_url).stream("POST", "/api/chat", json=payload, timeout=180) as r:
+                if r.status_code >= 400:
+                    body = (await r.aread()).decode("utf-8", "replace")[:500]
+                    if r.status_code == 429:
+                        raise RateLimited(f"Ollama error 429: {body}", parse_retry_after(r.headers))
+                    raise RuntimeError(f"Ollama error {r.status_code}: {body}")
+                # One JSON object per line; the last has done=true and the token counts.
+                async for line in r.aiter_lines():
+                    if not line.strip():
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise RuntimeError(f"Ollama error: {data['error']}")
+                    delta = (data.get("message") or {}).get("content") or ""
+                    if delta:
+                        stats.first_delta()
+                        parts.append(delta)
+                        yield delta
+                    if data.get("done"):
+                        final = data
+                        if "eval_count" in data:
+                            stats.output_tokens = data["eval_count"]
+                            stats.usage_reported = True
+                            p.tokens = data.get("prompt_eval_count", 0) + data["eval_count"]
+        stats.finish()
+        self._record(final, system + user, "".join(parts), model, stats.total_ms)
+
+    def _record(self, data: dict, prompt: str, output: str, model: str, latency_ms: float) -> None:
+        # Ollama reports prompt_eval_count/eval_count, but omits them e.g. when the prompt was cached.
+        if "eval_count" in data:
+            record(self.name, prompt_tokens=data.get("prompt_eval_count", 0), completion_tokens=data["eval_count"], latency_ms=latency_ms)
+        else:
+            record(self.name, prompt_tokens=count_tokens(prompt, model), completion_tokens=count_tokens(output, model),
+                   latency_ms=latency_ms, estimated=True)
@@ -1,8 +1,14 @@
 from __future__ import annotations
-from typing import Any
-import httpx
+import json
+import time
+from typing import Any, AsyncIterator
 from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 from ...settings import settings
+from .base import StreamStats
+from .http import get_client
+from .ratelimit import RateLimited, parse_retry_after, permit
+from .tokens import count_tokens
+from .usage import BATCH_PRICE_FACTOR, count_retry, record
 
 
 def _is_retryable(exc: BaseException) -> bool:
@@ -18,6 +24,23 @@ def _is_retryable(exc: BaseException) -> bool:
     return False
 
 
+def _output_text(data: dict) -> str:
+    # responses output can include output_text; text may be inside output[].content
+    # We'll try robustly.
+    if "output_text" in data:
+        return data.get("output_text") or ""
+    out_text = ""
+    # try to stitch text
+    try:
+        for item in data.get("output", []):
+            for c in item.get("content", []):
+                if c.get("type") == "output_text":
+                    out_text += c.get("text", "")
+    except Exception:
+        out_text = ""
+    return out_text
+
+
 class OpenAIProvider:
     name = "openai"
 
@@ -27,14 +50,9 @@ class OpenAIProvider:
         if not self.api_key:
             raise ValueError("OpenAI API key missing. Set COURSEGEN_OPENAI_API_KEY.")
 
-    @retry(retry=retry_if_exception(_is_retryable), stop=stop_after_attempt(5), wait=wait_exponential(min=2, max=30))
-    async def generate(self, *, system: str, user: str, json_schema: dict | None, params: dict) -> dict[str, Any]:
+    def _payload(self, system: str, user: str, params: dict) -> tuple[str, dict[str, Any]]:
         model = params.get("model") or settings.openai_model
         temperature = float(params.get("temperature", 0.3))
-
-        url = f"{self.base_url}/responses"
-        headers = {"Authorization": f"Bearer {self.api_key}"}
-
         payload: dict[str, Any] = {
             "model": model,
             "input": [
@@ -43,30 +61,34 @@ class OpenAIProvider:
             ],
             "temperature": temperature,
         }
+        return model, payload
+
+    @retry(
+        retry=retry_if_exception(_is_retryable),
+        stop=stop_after_attempt(5),
+        wait=wait_exponential(min=2, max=30),
+        before_sleep=count_retry,
+    )
+    async def generate(self, *, system: str, user: str, json_schema: dict | None, params: dict) -> dict[str, Any]:
+        model, payload = self._payload(system, user, params)
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+
         if json_schema:
             payload["text"] = {"format": {"type": "json_schema", "json_schema": {"name": "artifact", "schema": json_schema}}}
 
-        async with httpx.AsyncClient(timeout=120) as client:
-            r = await client.post(url, headers=headers, json=payload)
+        estimate = count_tokens(system + user, model) + settings.llm_output_token_reserve
+        async with permit(self.name, model, estimate) as p:
+            started = time.perf_counter()
+            r = await get_client(self.base_url).post("/responses", headers=headers, json=payload, timeout=120)
+            if r.status_code == 429:
+                raise RateLimited(f"OpenAI error 429: {r.text[:500]}", parse_retry_after(r.headers))
             if r.status_code >= 400:
                 raise RuntimeError(f"OpenAI error {r.status_code}: {r.text[:500]}")
             data = r.json()
+            p.tokens = (data.get("usage") or {}).get("total_tokens")
 
-        # Extract JSON if present
-        # responses output can include output_text; json may be inside output[0].content
-        # We'll try robustly.
-        out_text = ""
-        if "output_text" in data:
-            out_text = data.get("output_text") or ""
-        else:
-            # try to stitch text
-            try:
-                for item in data.get("output", []):
-                    for c in item.get("content", []):
-                        if c.get("type") == "output_text":
-                            out_text += c.get("text", "")
-            except Exception:
-                out_text = ""
+        out_text = _output_text(data)
+        self._record(data.get("usage"), system + user, out_text, model, (time.perf_counter() - started) * 1000)
 
         # If schema requested, attempt parse JSON from structured content
         if json_schema:
@@ -86,3 +108,120 @@ class OpenAIProvider:
                 return {"raw_text": out_text}
 
         return {"raw_text": out_text}
+
+    async def stream(self, *, system: str, user: str, params: dict, stats: StreamStats | None = None) -> AsyncIterator[str]:
+        model, payload = self._payload(system, user, params)
+        payload["stream"] = True
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        stats = stats if stats is not None else StreamStats()
+        estimate = count_tokens(system + user, model) + settings.llm_output_token_reserve
+        usage: dict = {}
+        parts: list[str] = []  # only to estimate usage if the stream never reports it
+        async with permit(self.name, model, estimate) as p:
+            async with get_client(self.base_url).stream("POST", "/responses", headers=headers, json=payload, timeout=120) as r:
+                if r.status_code >= 400:
+                    body = (await r.aread()).decode("utf-8", "replace")[:500]
+                    if r.status_code == 429:
+                        raise RateLimited(f"OpenAI error 429: {body}", parse_retry_after(r.headers))
+                    raise RuntimeError(f"OpenAI error {r.status_code}: {body}")
+                # Server-sent events; only text deltas and the final usage matter here.
+                async for line in r.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    event = json.loads(data)
+                    kind = event.get("type")
+                    if kind == "response.output_text.delta":
+                        delta = event.get("delta") or ""
+                        if delta:
+                            stats.first_delta()
+                            parts.append(delta)
+                            yield delta
+                    elif kind == "response.completed":
+                        usage = (event.get("response") or {}).get("usage") or {}
+                        if "output_tokens" in usage:
+                            stats.output_tokens = usage["output_tokens"]
+                            stats.usage_reported = True
+                        p.tokens = usage.get("total_tokens")
+                    elif kind in ("response.failed", "error"):
+                        raise RuntimeError(f"OpenAI stream error: {data[:500]}")
+        stats.finish()
+        self._record(usage, system + user, "".join(parts), model, stats.total_ms)
+
+    def _record(self, usage: dict | None, prompt: str, output: str, model: str, latency_ms: float, price_factor: float = 1.0) -> None:
+        # Responses API usage has input_tokens/output_tokens; estimate when it is missing.
+        if usage:
+            record(self.name, prompt_tokens=usage.get("input_tokens", 0), completion_tokens=usage.get("output_tokens", 0),
+                   latency_ms=latency_ms, price_factor=price_factor)
+        else:
+            record(self.name, prompt_tokens=count_tokens(prompt, model), completion_tokens=count_tokens(output, model),
+                   latency_ms=latency_ms, estimated=True, price_factor=price_factor)
+
+    # --- Batch API: offline, half-price, outside the per-minute rate limits ---
+
+    async def submit_batch(self, requests: list[tuple[str, str, str, dict]], metadata: dict | None = None) -> str:
+        """Upload (custom_id, system, user, params) requests as JSONL and start a batch. Returns its id."""
+        lines = []
+        for custom_id, system, user, params in requests:
+            _, body = self._payload(system, user, params)
+            lines.append(json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/responses", "body": body}))
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        client = get_client(self.base_url)
+
+        r = await client.post(
+            "/files",
+            headers=headers,
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", "\n".join(lines).encode("utf-8"), "application/jsonl")},
+            timeout=300,
+        )
+        if r.status_code >= 400:
+            raise RuntimeError(f"OpenAI error {r.status_code}: {r.text[:500]}")
+        file_id = r.json()["id"]
+
+        r = await client.post(
+            "/batches",
+            headers=headers,
+            json={
+                "input_file_id": file_id,
+                "endpoint": "/v1/responses",
+                "completion_window": settings.openai_batch_completion_window,
+                "metadata": metadata or {},
+            },
+        )
+        if r.status_code >= 400:
+            raise RuntimeError(f"OpenAI error {r.status_code}: {r.text[:500]}")
+        return r.json()["id"]
+
+    async def get_batch(self, batch_id: str) -> dict:
+        r = await get_client(self.base_url).get(f"/batches/{batch_id}", headers={"Authorization": f"Bearer {self.api_key}"})
+        if r.status_code >= 400:
+            raise RuntimeError(f"OpenAI error {r.status_code}: {r.text[:500]}")
+        return r.json()
+
+    async def batch_results(self, batch: dict) -> dict[str, dict]:
+        """custom_id -> {"raw_text": ...} for every request that succeeded in a completed batch."""
+        file_id = batch.get("output_file_id")
+        if not file_id:
+            return {}
+        r = await get_client(self.base_url).get(
+            f"/files/{file_id}/content", headers={"Authorization": f"Bearer {self.api_key}"}, timeout=300,
+        )
+        if r.status_code >= 400:
+            raise RuntimeError(f"OpenAI error {r.status_code}: {r.text[:500]}")
+        results: dict[str, dict] = {}
+        for line in r.text.splitlines():
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            response = row.get("response") or {}
+            if row.get("error") or response.get("status_code") != 200:
+                continue
+            body = response.get("body") or {}
+            text = _output_text(body)
+            # Batch requests have no meaningful per-call latency; tokens and (discounted) cost still count.
+            self._record(body.get("usage"), "", text, body.get("model") or settings.openai_model, 0.0, BATCH_PRICE_FACTOR)
+            results[row["custom_id"]] = {"raw_text": text}
+        return results
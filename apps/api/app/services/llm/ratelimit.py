@@ -0,0 +1,276 @@
+from __future__ import annotations
+import asyncio
+import contextvars
+import email.utils
+import logging
+import random
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Iterator
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from ...redis_pool import get_redis as _redis
+from ...settings import settings
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "coursegen:ratelimit"
+# A permit whose holder died is reclaimed after this long.
+LEASE_TTL_MS = 10 * 60 * 1000
+# Poll interval while every concurrency slot is taken.
+_SLOT_POLL_S = 0.05
+
+# KEYS: bucket, leases, state. ARGV: now_ms, rpm, tpm, cost, lease_id, lease_ttl_ms, max_concurrency.
+# Returns 0 when the permit was granted, -1 when all concurrency slots are busy,
+# otherwise the milliseconds to wait before a bucket (or a 429 pause) allows the call.
+_ACQUIRE = """
+local now = tonumber(ARGV[1])
+local rpm = tonumber(ARGV[2])
+local tpm = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local blocked = tonumber(redis.call('HGET', KEYS[3], 'blocked_until') or '0')
+if blocked > now then return blocked - now end
+
+local limit = tonumber(redis.call('HGET', KEYS[3], 'limit') or ARGV[7])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+if redis.call('ZCARD', KEYS[2]) >= math.max(1, math.floor(limit)) then return -1 end
+
+local req = tonumber(redis.call('HGET', KEYS[1], 'req') or rpm)
+local tok = tonumber(redis.call('HGET', KEYS[1], 'tok') or tpm)
+local ts = tonumber(redis.call('HGET', KEYS[1], 'ts') or now)
+local elapsed = math.max(0, now - ts)
+req = math.min(rpm, req + elapsed * rpm / 60000)
+tok = math.min(tpm, tok + elapsed * tpm / 60000)
+
+local wait = 0
+if rpm > 0 and req < 1 then wait = math.max(wait, math.ceil((1 - req) * 60000 / rpm)) end
+-- A request larger than the whole bucket waits for a full bucket, then overdraws it.
+local need = math.min(cost, tpm)
+if tpm > 0 and tok < need then wait = math.max(wait, math.ceil((need - tok) * 60000 / tpm)) end
+if wait == 0 then
+  req = req - 1
+  tok = tok - cost
+  redis.call('ZADD', KEYS[2], now + tonumber(ARGV[6]), ARGV[5])
+end
+redis.call('HSET', KEYS[1], 'req', req, 'tok', tok, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], 120000)
+return wait
+"""
+
+# KEYS: leases, state. ARGV: lease_id, outcome (ok|throttled|error), now_ms, retry_after_ms, max, min.
+# AIMD: +1 slot per `limit` successes, halve on a 429 and pause everyone until Retry-After.
+_RELEASE = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+local limit = tonumber(redis.call('HGET', KEYS[2], 'limit') or ARGV[5])
+if ARGV[2] == 'throttled' then
+  limit = math.max(tonumber(ARGV[6]), limit / 2)
+  local resume = tonumber(ARGV[3]) + tonumber(ARGV[4])
+  if resume > tonumber(redis.call('HGET', KEYS[2], 'blocked_until') or '0') then
+    redis.call('HSET', KEYS[2], 'blocked_until', resume)
+  end
+  redis.call('HINCRBY', KEYS[2], 'throttled', 1)
+elseif ARGV[2] == 'ok' then
+  limit = math.min(tonumber(ARGV[5]), limit + 1 / limit)
+end
+redis.call('HSET', KEYS[2], 'limit', limit)
+return tostring(limit)
+"""
+
+
+class RateLimited(RuntimeError):
+    """Raised by providers on HTTP 429; carries the server's Retry-After, if any."""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(headers) -> float | None:
+    """Seconds to wait from retry-after-ms / Retry-After (delta-seconds or HTTP date)."""
+    if (ms := headers.get("retry-after-ms")) is not None:
+        try:
+            return float(ms) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class LimiterStats:
+    permits: int = 0
+    wait_ms: float = 0.0  # time spent waiting for permits
+    throttled: int = 0  # 429s seen
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+# Per-job counters keyed by provider:model. The dict is shared by every task the job spawns;
+# one worker process runs many jobs at once, so process-wide counters would mix them.
+_job_stats: contextvars.ContextVar[dict[str, LimiterStats] | None] = contextvars.ContextVar("llm_limiter_stats", default=None)
+
+
+@contextmanager
+def track_stats() -> Iterator[dict[str, LimiterStats]]:
+    """Count permits, waits and 429s of the provider calls made inside the block (one job)."""
+    stats: dict[str, LimiterStats] = {}
+    token = _job_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _job_stats.reset(token)
+
+
+@dataclass
+class Permit:
+    """Handle for one admitted call; set ``tokens`` to the actual usage to settle the TPM bucket."""
+    estimated: int
+    tokens: int | None = None
+
+
+class RateLimiter:
+    """RPM/TPM token buckets plus an AIMD concurrency cap for one provider+model, shared via Redis."""
+
+    def __init__(self, provider: str, model: str, *, rpm: int, tpm: int, max_concurrency: int):
+        self.provider = provider
+        self.model = model
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        base = f"{KEY_PREFIX}:{provider}:{model}"
+        self.bucket_key = f"{base}:bucket"
+        self.leases_key = f"{base}:leases"
+        self.state_key = f"{base}:state"
+
+    @asynccontextmanager
+    async def permit(self, tokens: int) -> AsyncIterator[Permit]:
+        handle = Permit(estimated=tokens)
+        lease = uuid.uuid4().hex
+        redis = _redis()
+        t0 = time.perf_counter()
+        try:
+            await self._acquire(redis, tokens, lease)
+        except RedisError:
+            # The limiter is an optimisation; never fail a generation because Redis hiccupped.
+            logger.warning("Rate limiter unavailable; calling %s without a permit", self.provider, exc_info=True)
+            redis = None
+        wait_ms = (time.perf_counter() - t0) * 1000
+        scope = _job_stats.get()
+        stats = scope.setdefault(f"{self.provider}:{self.model}", LimiterStats()) if scope is not None else LimiterStats()
+        stats.permits += 1
+        stats.wait_ms = round(stats.wait_ms + wait_ms, 2)
+
+        outcome, retry_after = "error", 0.0
+        try:
+            yield handle
+            outcome = "ok"
+        except RateLimited as e:
+            outcome, retry_after = "throttled", e.retry_after or 1.0
+            stats.throttled += 1
+            raise
+        finally:
+            if redis is not None:
+                try:
+                    await self._release(redis, lease, outcome, retry_after, handle, wait_ms)
+                except RedisError:
+                    logger.warning("Could not release rate limiter permit for %s", self.provider, exc_info=True)
+
+    async def _acquire(self, redis: Redis, tokens: int, lease: str) -> None:
+        acquire = redis.register_script(_ACQUIRE)
+        while True:
+            wait = int(await acquire(
+                keys=[self.bucket_key, self.leases_key, self.state_key],
+                args=[_now_ms(), self.rpm, self.tpm, tokens, lease, LEASE_TTL_MS, self.max_concurrency],
+            ))
+            if wait == 0:
+                return
+            # Jitter so workers woken by the same pause do not stampede.
+            delay = _SLOT_POLL_S if wait < 0 else wait / 1000
+            await asyncio.sleep(delay * random.uniform(1.0, 1.2))
+
+    async def _release(self, redis: Redis, lease: str, outcome: str, retry_after: float, handle: Permit, wait_ms: float) -> None:
+        release = redis.register_script(_RELEASE)
+        await release(
+            keys=[self.leases_key, self.state_key],
+            args=[lease, outcome, _now_ms(), int(retry_after * 1000), self.max_concurrency, 1],
+        )
+        async with redis.pipeline(transaction=False) as pipe:
+            if handle.tokens is not None and self.tpm > 0:
+                # Settle the estimate against real usage.
+                pipe.hincrbyfloat(self.bucket_key, "tok", handle.estimated - handle.tokens)
+            pipe.hincrby(self.state_key, "permits", 1)
+            pipe.hincrbyfloat(self.state_key, "wait_ms", round(wait_ms, 2))
+            await pipe.execute()
+
+
+_limiters: dict[tuple[str, str], RateLimiter] = {}
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _limits(provider: str) -> tuple[int, int, int]:
+    if provider == "ollama":
+        return settings.ollama_rpm, settings.ollama_tpm, settings.ollama_max_concurrency
+    return settings.openai_rpm, settings.openai_tpm, settings.openai_max_concurrency
+
+
+def get_limiter(provider: str, model: str) -> RateLimiter | None:
+    """Process-wide limiter for provider+model, or None when rate limiting is disabled."""
+    if not settings.llm_rate_limit_enabled:
+        return None
+    limiter = _limiters.get((provider, model))
+    if limiter is None:
+        rpm, tpm, conc = _limits(provider)
+        limiter = _limiters[(provider, model)] = RateLimiter(provider, model, rpm=rpm, tpm=tpm, max_concurrency=conc)
+    return limiter
+
+
+@asynccontextmanager
+async def permit(provider: str, model: str, tokens: int) -> AsyncIterator[Permit]:
+    """``async with permit(...)`` around one provider HTTP call; a no-op when limiting is off."""
+    limiter = get_limiter(provider, model)
+    if limiter is None:
+        yield Permit(estimated=tokens)
+        return
+    async with limiter.permit(tokens) as handle:
+        yield handle
+
+
+def limiter_stats() -> dict[str, dict]:
+    """Wait/permit counters of the current ``track_stats()`` block, keyed by provider:model (empty outside one)."""
+    return {k: s.as_dict() for k, s in (_job_stats.get() or {}).items()}
+
+
+async def shared_limiter_state() -> list[dict]:
+    """AIMD limit, pause and cumulative counters for every provider+model seen by any worker."""
+    redis = _redis()
+    out = []
+    async for key in redis.scan_iter(match=f"{KEY_PREFIX}:*:state"):
+        key = key.decode() if isinstance(key, bytes) else key
+        provider, model = key[len(KEY_PREFIX) + 1:-len(":state")].split(":", 1)
+        state = {k.decode(): float(v) for k, v in (await redis.hgetall(key)).items()}
+        out.append({
+            "provider": provider,
+            "model": model,
+            "concurrency_limit": round(state.get("limit", 0.0), 2),
+            "paused_ms": max(0, int(state.get("blocked_until", 0) - _now_ms())),
+            "permits": int(state.get("permits", 0)),
+            "wait_ms": round(state.get("wait_ms", 0.0), 2),
+            "throttled": int(state.get("throttled", 0)),
+        })
+    return out
+
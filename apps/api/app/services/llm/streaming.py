@@ -0,0 +1,79 @@
+from __future__ import annotations
+import contextlib
+import logging
+import re
+import time
+from typing import Awaitable, Callable
+from tenacity import AsyncRetrying, retry_if_exception, retry_if_exception_type, stop_after_attempt, wait_exponential
+from .base import LLMProvider, StreamStats, is_transient
+from .tokens import count_tokens
+from .usage import count_retry
+
+logger = logging.getLogger(__name__)
+
+# Characters of output after which a JSON-only response must have started with "{", "[" or a code fence.
+JSON_PREFIX_CHARS = 64
+_JSON_START_RE = re.compile(r"^\s*(?:```(?:json)?\s*)?[\[{]", re.IGNORECASE)
+
+OnDelta = Callable[[str, StreamStats], Awaitable[None]]
+
+
+class MalformedStream(RuntimeError):
+    """A stream expected to be JSON started with something else; aborted so it can be retried."""
+
+
+async def collect_stream(
+    provider: LLMProvider,
+    *,
+    system: str,
+    user: str,
+    params: dict,
+    on_delta: OnDelta | None = None,
+    expect_json: bool = False,
+    attempts: int = 3,
+    progress_interval: float = 2.0,
+) -> tuple[str, StreamStats]:
+    """Stream a completion to a string, retrying from scratch on transient failures.
+
+    ``on_delta(text_so_far, stats)`` is called at most every ``progress_interval``
+    seconds. With ``expect_json``, output that does not open like JSON is aborted
+    early and retried; the last attempt is always allowed to finish.
+    """
+    async for attempt in AsyncRetrying(
+        stop=stop_after_attempt(attempts),
+        wait=wait_exponential(min=1, max=30),
+        retry=retry_if_exception_type(MalformedStream) | retry_if_exception(is_transient),
+        before_sleep=count_retry,
+        reraise=True,
+    ):
+        with attempt:
+            check_json = expect_json and attempt.retry_state.attempt_number < attempts
+            stats = StreamStats()
+            parts: list[str] = []
+            size = 0
+            last_report = 0.0
+            # aclosing: an early abort must release the provider's permit and HTTP stream now, not at GC.
+            async with contextlib.aclosing(provider.stream(system=system, user=user, params=params, stats=stats)) as deltas:
+                async for delta in deltas:
+                    parts.append(delta)
+                    size += len(delta)
+                    if check_json and size >= JSON_PREFIX_CHARS:
+                        head = "".join(parts)
+                        if not _JSON_START_RE.match(head):
+                            raise MalformedStream(f"{provider.name} output is not JSON: {head[:80]!r}")
+                        check_json = False
+                    now = time.perf_counter()
+                    if on_delta and now - last_report >= progress_interval:
+                        last_report = now
+                        if not stats.usage_reported:  # running estimate until the provider reports usage
+                            stats.output_tokens = count_tokens("".join(parts), params.get("model"))
+                        await on_delta("".join(parts), stats)
+            text = "".join(parts)
+            if not stats.usage_reported:
+                stats.output_tokens = count_tokens(text, params.get("model"))
+            stats.finish()
+            logger.debug(
+                "%s stream ttft_ms=%s total_ms=%.0f tokens=%d tok/s=%.1f",
+                provider.name, stats.ttft_ms, stats.total_ms, stats.output_tokens, stats.tokens_per_s,
+            )
+            return text, stats
@@ -0,0 +1,94 @@
+from __future__ import annotations
+import logging
+from functools import lru_cache
+from typing import Callable
+from ...settings import settings
+
+logger = logging.getLogger(__name__)
+
+Tokenizer = Callable[[str], int]
+
+# Known context windows (tokens) by model-name prefix; longest prefix wins.
+_CONTEXT_WINDOWS = {
+    "gpt-4.1": 1_047_576,
+    "gpt-4o": 128_000,
+    "gpt-5": 400_000,
+    "o3": 200_000,
+    "o4-mini": 200_000,
+}
+_DEFAULT_OPENAI_WINDOW = 128_000
+
+# Tokens reserved for the map prompt's instructions and the JSON notes it returns.
+MAP_PROMPT_OVERHEAD = 1_000
+# Tokens of reduce_prompt instructions (artifact shapes, style controls).
+REDUCE_PROMPT_OVERHEAD = 1_500
+
+_TOKENIZERS: dict[str, Tokenizer] = {}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap tokenizer-free estimate (~4 characters per token for English prose)."""
+    return (len(text) + 3) // 4
+
+
+def register_tokenizer(model_prefix: str, fn: Tokenizer) -> None:
+    """Use fn to count tokens for models whose name starts with model_prefix."""
+    _TOKENIZERS[model_prefix] = fn
+    get_tokenizer.cache_clear()
+
+
+@lru_cache(maxsize=32)
+def get_tokenizer(model: str | None) -> Tokenizer:
+    model = model or ""
+    for prefix in sorted(_TOKENIZERS, key=len, reverse=True):
+        if model.startswith(prefix):
+            return _TOKENIZERS[prefix]
+    # tiktoken is optional; without it (or for non-OpenAI models) fall back to the estimate.
+    try:
+        import tiktoken
+        enc = tiktoken.encoding_for_model(model)
+        return lambda text: len(enc.encode(text, disallowed_special=()))
+    except Exception:
+        return estimate_tokens
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    return get_tokenizer(model)(text)
+
+
+def default_model(provider_name: str | None = None) -> tuple[str, str]:
+    provider_name = provider_name or settings.llm_provider
+    if provider_name == "ollama":
+        return provider_name, settings.ollama_model
+    return provider_name, settings.openai_model
+
+
+def context_window(provider_name: str | None = None, model: str | None = None) -> int:
+    provider_name, default = default_model(provider_name)
+    model = model or default
+    if provider_name == "ollama":
+        # Ollama truncates to num_ctx regardless of what the model supports.
+        return settings.ollama_num_ctx
+    for prefix in sorted(_CONTEXT_WINDOWS, key=len, reverse=True):
+        if model.startswith(prefix):
+            return _CONTEXT_WINDOWS[prefix]
+    return _DEFAULT_OPENAI_WINDOW
+
+
+def chunk_token_budget(provider_name: str | None = None, model: str | None = None) -> int:
+    """Max tokens per chunk so one map call fits the model's context window."""
+    if settings.chunk_max_tokens > 0:
+        return settings.chunk_max_tokens
+    window = context_window(provider_name, model)
+    # Half the window for the chunk; the cap keeps map notes detailed on huge-context models.
+    return max(256, min(settings.chunk_token_cap, window // 2 - MAP_PROMPT_OVERHEAD))
+
+
+def reduce_token_budget(provider_name: str | None = None, model: str | None = None) -> int:
+    """Max tokens of serialized notes in one reduce prompt before tree-reduce kicks in."""
+    window = context_window(provider_name, model)
+    # Half the window for the notes, the rest for instructions and the artifact itself.
+    budget = window // 2 - REDUCE_PROMPT_OVERHEAD
+    if settings.reduce_notes_max_tokens > 0:
+        budget = min(budget, settings.reduce_notes_max_tokens)
+    return max(512, budget)
@@ -0,0 +1,151 @@
+from __future__ import annotations
+import contextlib
+import contextvars
+from dataclasses import dataclass, field, fields
+from typing import Iterator
+from ...settings import settings
+
+# Batch API calls are billed at half the synchronous price.
+BATCH_PRICE_FACTOR = 0.5
+
+
+def cost_usd(provider: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """List-price cost of one call; local providers are free."""
+    if provider != "openai":
+        return 0.0
+    return (prompt_tokens * settings.openai_price_input_per_1m + completion_tokens * settings.openai_price_output_per_1m) / 1_000_000
+
+
+@dataclass
+class Usage:
+    """Token, latency and cost totals over some set of provider calls."""
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    estimated_calls: int = 0  # calls whose token counts were estimated locally, not reported by the provider
+    latency_ms: float = 0.0  # summed wall time of the successful attempts
+    retries: int = 0
+    cost_usd: float = 0.0
+
+    def add(self, other: Usage) -> None:
+        self.calls += other.calls
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.estimated_calls += other.estimated_calls
+        self.latency_ms += other.latency_ms
+        self.retries += other.retries
+        self.cost_usd += other.cost_usd
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Usage:
+        return cls(**{f.name: data.get(f.name, 0) for f in fields(cls)})
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "estimated_calls": self.estimated_calls,
+            "latency_ms": round(self.latency_ms, 2),
+            "avg_latency_ms": round(self.latency_ms / self.calls, 2) if self.calls else 0.0,
+            "retries": self.retries,
+            "cost_usd": round(self.cost_usd, 6),
+        }
+
+
+@dataclass
+class UsageRecorder:
+    """Collects the calls made while it is active; nested recorders also report to their parent."""
+    parent: UsageRecorder | None = None
+    total: Usage = field(default_factory=Usage)
+    by_phase: dict[str, Usage] = field(default_factory=dict)
+
+    def _add(self, phase: str, usage: Usage) -> None:
+        rec: UsageRecorder | None = self
+        while rec is not None:
+            rec.total.add(usage)
+            rec.by_phase.setdefault(phase, Usage()).add(usage)
+            rec = rec.parent
+
+    def merge(self, other: UsageRecorder) -> None:
+        """Add another recorder's totals (e.g. summing stored jobs); parents are not updated."""
+        self.total.add(other.total)
+        for name, usage in other.by_phase.items():
+            self.by_phase.setdefault(name, Usage()).add(usage)
+
+    @classmethod
+    def from_dict(cls, data: dict | None) -> UsageRecorder:
+        """Rebuild a recorder from ``as_dict()`` output, to keep counting across the steps of one job."""
+        rec = cls()
+        if data:
+            rec.total = Usage.from_dict(data)
+            rec.by_phase = {name: Usage.from_dict(u) for name, u in (data.get("by_phase") or {}).items()}
+        return rec
+
+    def as_dict(self) -> dict:
+        return {
+            **self.total.as_dict(),
+            "by_phase": {name: u.as_dict() for name, u in sorted(self.by_phase.items())},
+        }
+
+
+# Context variables follow asyncio tasks, so concurrent chapters and outputs each see their own recorder/phase.
+_recorder: contextvars.ContextVar[UsageRecorder | None] = contextvars.ContextVar("llm_usage_recorder", default=None)
+_phase: contextvars.ContextVar[str] = contextvars.ContextVar("llm_usage_phase", default="other")
+
+
+def new_recorder() -> UsageRecorder:
+    """A recorder nested in the current one; activate it (possibly several times) with ``track(rec)``."""
+    return UsageRecorder(parent=_recorder.get())
+
+
+@contextlib.contextmanager
+def track(rec: UsageRecorder | None = None) -> Iterator[UsageRecorder]:
+    """Record every provider call made inside the block (and report it to any enclosing recorder)."""
+    rec = rec or new_recorder()
+    token = _recorder.set(rec)
+    try:
+        yield rec
+    finally:
+        _recorder.reset(token)
+
+
+@contextlib.contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Label calls made inside the block, e.g. "map", "merge" or "reduce:summary"."""
+    token = _phase.set(name)
+    try:
+        yield
+    finally:
+        _phase.reset(token)
+
+
+def record(
+    provider: str,
+    *,
+    prompt_tokens: int,
+    completion_tokens: int,
+    latency_ms: float,
+    estimated: bool = False,
+    price_factor: float = 1.0,
+) -> None:
+    """Record one successful provider call. A no-op outside ``track()``."""
+    rec = _recorder.get()
+    if rec is None:
+        return
+    rec._add(_phase.get(), Usage(
+        calls=1,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        estimated_calls=int(estimated),
+        latency_ms=latency_ms,
+        cost_usd=cost_usd(provider, prompt_tokens, completion_tokens) * price_factor,
+    ))
+
+
+def count_retry(retry_state=None) -> None:
+    """tenacity ``before_sleep`` hook: count a retried attempt against the current phase."""
+    rec = _recorder.get()
+    if rec is not None:
+        rec._add(_phase.get(), Usage(retries=1))
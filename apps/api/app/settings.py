@@ -10,8 +10,62 @@ class Settings(BaseSettings):
     openai_api_key: str | None = None
     openai_model: str = "gpt-4.1-mini"
     openai_base_url: str = "https://api.openai.com/v1"
+    openai_batch_completion_window: str = "24h"
+    openai_batch_poll_interval: int = 60  # seconds between batch status checks
+    # USD per 1M tokens, for cost accounting only (defaults are gpt-4.1-mini list prices)
+    openai_price_input_per_1m: float = 0.40
+    openai_price_output_per_1m: float = 1.60
 
     ollama_base_url: str = "http://ollama:11434"
     ollama_model: str = "llama3.1:8b"
+    ollama_num_ctx: int = 8192  # context window requested from Ollama; chunk sizes follow it
+
+    # shared provider HTTP pools (one per base URL per event loop)
+    llm_http_max_connections: int = 20
+    llm_http_max_keepalive: int = 10
+    llm_http_keepalive_expiry: float = 30.0  # seconds an idle connection is kept
+    llm_http_timeout: float = 120.0  # default; providers pass their own per-request timeouts
+    llm_http2: bool = False  # needs the h2 package (httpx[http2])
+    llm_stream: bool = True  # stream reduce outputs (live progress, TTFT, early abort of non-JSON output)
+    llm_stream_progress_interval: float = 2.0  # seconds between progress updates while streaming
+
+    # rate limiting, shared by all workers through Redis (0 = unlimited)
+    llm_rate_limit_enabled: bool = True
+    llm_job_concurrency: int = 8  # in-flight provider calls per job; the shared limiter decides the rest
+    llm_output_token_reserve: int = 1000  # output tokens assumed when debiting the TPM bucket
+    openai_rpm: int = 500
+    openai_tpm: int = 200_000
+    openai_max_concurrency: int = 16  # AIMD ceiling; halves on 429
+    ollama_rpm: int = 0
+    ollama_tpm: int = 0
+    ollama_max_concurrency: int = 2
+
+    # generation concurrency
+    book_chapter_concurrency: int = 4  # chapters in flight at once in a whole-book job
+
+    # ingestion
+    pdf_extract_workers: int = 1  # >1 shards PDF pages across a process pool
+    pdf_parallel_min_pages: int = 64  # below this, pool startup costs more than it saves
+    epub_parser: str = "lxml"  # lxml|html.parser
+    epub_parse_workers: int = 1  # >1 parses EPUB documents in a pool
+    epub_parse_executor: str = "thread"  # thread|process
+    chunk_max_tokens: int = 0  # 0 = derive from the default model's context window
+    chunk_token_cap: int = 8000  # upper bound when deriving, so map notes stay detailed
+    chunk_overlap_tokens: int = 100
+
+    # generation
+    map_cache_enabled: bool = True  # reuse map-phase notes for unchanged chunks
+    map_cache_max_entries: int = 50_000  # least recently used notes are evicted beyond this
+    map_cache_ttl_days: int = 90  # 0 = keep until evicted by size
+    tree_reduce_enabled: bool = True  # merge notes in rounds when they overflow the reduce budget
+    tree_reduce_fan_in: int = 8  # max notes merged per call
+    reduce_notes_max_tokens: int = 24_000  # cap on notes per reduce prompt (0 = derive from the context window)
+    job_max_retries: int = 2  # automatic retries of a generation job after a transient provider failure
+    job_retry_delay: int = 30  # seconds before the first retry; doubles for each later one
+
+    # asyncio worker (python -m app.workers.async_worker)
+    worker_concurrency: int = 8  # jobs in flight per process
+    worker_process_slots: int = 1  # child processes for CPU-bound jobs (ingestion)
+    worker_shutdown_timeout: float = 60.0  # seconds running jobs get on SIGTERM before they are requeued
 
 settings = Settings()
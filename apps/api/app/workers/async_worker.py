@@ -0,0 +1,275 @@
+"""Asyncio worker: one event loop, DB engine and provider pool per process, many jobs at once.
+
+    python -m app.workers.async_worker --concurrency 8 --with-scheduler
+
+Generation jobs mostly wait on HTTP, so they share the loop. CPU-bound jobs
+(ingestion) each run in a spawned child process instead of blocking it. RQ job
+bookkeeping (started/finished/failed registries) matches the classic
+``rq worker``, so both kinds of worker can serve the same queue.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import traceback
+from typing import Any
+from rq import Queue
+from rq.defaults import DEFAULT_RESULT_TTL
+from rq.exceptions import DequeueTimeout
+from rq.job import Job as RQJob, JobStatus
+from rq.scheduler import RQScheduler
+from rq.utils import utcnow
+from ..db import engine
+from ..redis_pool import aclose_redis
+from ..services.llm.http import aclose_clients
+from ..settings import settings
+from .queue import get_queue
+from .tasks import LOOP_TASKS, TASKS, _update_job, run_in_process
+
+logger = logging.getLogger(__name__)
+
+DEQUEUE_TIMEOUT = 1  # seconds a dequeue blocks; also how long a stop request can go unnoticed
+
+
+class AsyncWorker:
+    """Runs up to ``concurrency`` jobs from one RQ queue on the current event loop.
+
+    A job that raises only fails itself. On SIGTERM/SIGINT the worker stops
+    taking jobs and gives running ones ``shutdown_timeout`` seconds. Loop jobs
+    still running after that are cancelled and requeued at the front of the
+    queue; jobs in child processes are allowed to finish (or time out).
+    """
+
+    def __init__(
+        self,
+        queue: Queue,
+        *,
+        concurrency: int,
+        process_slots: int,
+        shutdown_timeout: float,
+        with_scheduler: bool = False,
+    ):
+        self.queue = queue
+        self.connection = queue.connection
+        self.concurrency = max(1, concurrency)
+        self.shutdown_timeout = shutdown_timeout
+        self.with_scheduler = with_scheduler
+        self.name = f"async-{socket.gethostname()}-{os.getpid()}"
+        self._proc_slots = asyncio.Semaphore(max(1, process_slots))
+        self._running: dict[str, tuple[asyncio.Task, bool]] = {}  # rq job id -> (task, runs in a child process)
+        self._stop = asyncio.Event()
+
+    def request_stop(self) -> None:
+        if not self._stop.is_set():
+            logger.info("%s: stopping, %d job(s) running", self.name, len(self._running))
+            self._stop.set()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.request_stop)
+        slots = asyncio.Semaphore(self.concurrency)
+        scheduler = asyncio.create_task(self._schedule()) if self.with_scheduler else None
+        logger.info("%s: listening on %r with %d slots", self.name, self.queue.name, self.concurrency)
+        try:
+            while not self._stop.is_set():
+                if not await self._acquire(slots):
+                    break
+                dequeued = None
+                try:
+                    if not self._stop.is_set():
+                        dequeued = await asyncio.to_thread(self._dequeue)
+                except Exception:
+                    logger.exception("%s: dequeue failed", self.name)
+                    await asyncio.sleep(DEQUEUE_TIMEOUT)
+                if dequeued is None:
+                    slots.release()
+                    continue
+                job, queue = dequeued
+                task = asyncio.create_task(self._perform(job, queue), name=f"job-{job.id}")
+                self._running[job.id] = (task, job.func_name not in LOOP_TASKS)
+
+                def _done(_task: asyncio.Task, job_id: str = job.id) -> None:
+                    self._running.pop(job_id, None)
+                    slots.release()
+
+                task.add_done_callback(_done)
+        finally:
+            if scheduler:
+                scheduler.cancel()
+            await self._shutdown()
+
+    async def _acquire(self, slots: asyncio.Semaphore) -> bool:
+        """Wait for a free slot; False when a stop is requested first (every slot may be busy for a long time)."""
+        acquire = asyncio.ensure_future(slots.acquire())
+        stop = asyncio.ensure_future(self._stop.wait())
+        try:
+            await asyncio.wait({acquire, stop}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stop.cancel()
+            if not acquire.done():
+                acquire.cancel()
+                # Let the cancellation land: the acquire may still have won the slot meanwhile.
+                await asyncio.gather(acquire, return_exceptions=True)
+        if acquire.cancelled():
+            return False
+        if self._stop.is_set():
+            slots.release()
+            return False
+        return True
+
+    def _dequeue(self) -> tuple[RQJob, Queue] | None:
+        # Runs in a thread: BLMOVE/BLPOP would otherwise block the loop.
+        try:
+            result = Queue.dequeue_any([self.queue], DEQUEUE_TIMEOUT, connection=self.connection)
+        except DequeueTimeout:
+            return None
+        if not result or result[0] is None:
+            return None
+        job, queue = result
+        ttl = job.timeout + 60 if job.timeout and job.timeout > 0 else -1
+        with self.connection.pipeline() as pipe:
+            job.prepare_for_execution(self.name, pipe)
+            queue.started_job_registry.add(job, ttl, pipeline=pipe)
+            pipe.lrem(queue.intermediate_queue_key, 1, job.id)
+            pipe.execute()
+        return job, queue
+
+    async def _perform(self, job: RQJob, queue: Queue) -> None:
+        payload = job.args[0] if job.args else {}
+        # Continuations (batch polling) carry the tracking id; otherwise it is the rq job id.
+        job_id = payload.get("job_id") or job.id
+        timeout = job.timeout if job.timeout and job.timeout > 0 else None
+        logger.info("%s: started %s (%s)", self.name, job_id, job.func_name)
+        try:
+            if job.func_name in LOOP_TASKS:
+                work = TASKS[job.func_name](job_id, payload)
+            elif job.func_name in TASKS:
+                work = self._run_in_child(job.func_name, job_id, payload)
+            else:
+                raise ValueError(f"Unknown task {job.func_name}")
+            result = await asyncio.wait_for(work, timeout)
+        except asyncio.CancelledError:
+            logger.warning("%s: requeueing %s after shutdown", self.name, job_id)
+            await asyncio.to_thread(self._requeue, job, queue)
+            await _update_job(job_id, status="queued", message="Requeued: worker shut down")
+            raise
+        except Exception as e:
+            logger.exception("%s: job %s failed", self.name, job_id)
+            if isinstance(e, asyncio.TimeoutError):
+                await _update_job(job_id, status="failed", message=f"Failed: timed out after {timeout}s")
+            await asyncio.to_thread(self._finish, job, queue, None, traceback.format_exc())
+        else:
+            logger.info("%s: finished %s", self.name, job_id)
+            await asyncio.to_thread(self._finish, job, queue, result, None)
+
+    async def _run_in_child(self, func_name: str, job_id: str, payload: dict) -> Any:
+        """Run a task in its own process, terminated if this coroutine is cancelled (timeout).
+
+        A process per job rather than a pool: a timed-out job has to be killed, or
+        it would keep running and later overwrite the status it was failed with.
+        """
+        async with self._proc_slots:
+            # spawn: the child imports the app afresh instead of inheriting this loop's engine and pools.
+            ctx = multiprocessing.get_context("spawn")
+            receiver, sender = ctx.Pipe(duplex=False)
+            proc = ctx.Process(target=_child_main, args=(sender, func_name, job_id, payload), name=f"job-{job_id}", daemon=True)
+            proc.start()
+            sender.close()
+            try:
+                # recv() raises EOFError if the child dies without reporting.
+                outcome, value = await asyncio.to_thread(receiver.recv)
+            except EOFError:
+                outcome, value = "error", f"Child process exited with code {proc.exitcode}"
+            finally:
+                if proc.is_alive():
+                    proc.terminate()
+                await asyncio.to_thread(proc.join)
+                receiver.close()
+        if outcome == "error":
+            raise RuntimeError(f"{func_name} failed in child process:\n{value}")
+        return value
+
+    def _finish(self, job: RQJob, queue: Queue, result: Any, exc_string: str | None) -> None:
+        job.ended_at = utcnow()
+        with self.connection.pipeline() as pipe:
+            queue.started_job_registry.remove(job, pipeline=pipe)
+            # Same bookkeeping as rq's Worker.handle_job_success/handle_job_failure (rq is pinned).
+            if exc_string is None:
+                job._result = result
+                job._handle_success(job.get_result_ttl(DEFAULT_RESULT_TTL), pipeline=pipe)
+            else:
+                job.set_status(JobStatus.FAILED, pipeline=pipe)
+                job._handle_failure(exc_string, pipeline=pipe)
+            pipe.execute()
+
+    def _requeue(self, job: RQJob, queue: Queue) -> None:
+        queue.started_job_registry.remove(job)
+        queue.enqueue_job(job, at_front=True)
+
+    async def _schedule(self) -> None:
+        """Enqueue due ``enqueue_in`` jobs, like ``rq worker --with-scheduler`` (one holder of the lock at a time)."""
+        scheduler = RQScheduler([self.queue], connection=self.connection)
+
+        def _tick() -> None:
+            if scheduler.should_reacquire_locks:
+                scheduler.acquire_locks()
+            if scheduler.acquired_locks:
+                scheduler.enqueue_scheduled_jobs()
+                scheduler.heartbeat()
+
+        try:
+            while True:
+                try:
+                    await asyncio.to_thread(_tick)
+                except Exception:
+                    logger.exception("%s: scheduler tick failed", self.name)
+                await asyncio.sleep(scheduler.interval)
+        finally:
+            scheduler.release_locks()
+
+    async def _shutdown(self) -> None:
+        running = dict(self._running)
+        if running:
+            _, pending = await asyncio.wait([t for t, _ in running.values()], timeout=self.shutdown_timeout)
+            for task, in_process in running.values():
+                if task in pending and not in_process:
+                    task.cancel()
+            await asyncio.gather(*(t for t, _ in running.values()), return_exceptions=True)
+        await aclose_clients()
+        await aclose_redis()
+        await engine.dispose()
+        logger.info("%s: stopped", self.name)
+
+
+def _child_main(conn, func_name: str, job_id: str, payload: dict) -> None:
+    try:
+        conn.send(("ok", run_in_process(func_name, job_id, payload)))
+    except BaseException:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run coursegen jobs concurrently on one event loop.")
+    parser.add_argument("--concurrency", type=int, default=settings.worker_concurrency, help="jobs in flight at once")
+    parser.add_argument("--with-scheduler", action="store_true", help="also enqueue due scheduled jobs (batch polling)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    worker = AsyncWorker(
+        get_queue(),
+        concurrency=args.concurrency,
+        process_slots=settings.worker_process_slots,
+        shutdown_timeout=settings.worker_shutdown_timeout,
+        with_scheduler=args.with_scheduler,
+    )
+    asyncio.run(worker.run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+from __future__ import annotations
+import hashlib
+import json
+import logging
+from redis.exceptions import RedisError
+from ..redis_pool import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "coursegen:request"
+
+# KEYS: claim. ARGV: expected holder, new holder (empty to delete), ttl_s. Returns 1 if the claim changed.
+_SWAP = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then return 0 end
+if ARGV[2] == '' then
+  redis.call('DEL', KEYS[1])
+else
+  redis.call('SET', KEYS[1], ARGV[2], 'EX', tonumber(ARGV[3]))
+end
+return 1
+"""
+
+
+def request_key(func: str, payload: dict) -> str:
+    """Canonical key of a job request: same task and options, in any order.
+
+    List options (outputs, chapter indices) are sets as far as generation is
+    concerned, so they are sorted and de-duplicated first.
+    """
+    canonical = {k: sorted(set(v)) if isinstance(v, list) else v for k, v in payload.items()}
+    blob = json.dumps([func, canonical], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def _key(request_key: str) -> str:
+    return f"{KEY_PREFIX}:{request_key}"
+
+
+async def claim(request_key: str, job_id: str, ttl_s: int) -> str | None:
+    """Make ``job_id`` the in-flight job for this request.
+
+    Returns the job id already holding it, or None once ``job_id`` does (or when
+    Redis is unavailable: duplicates are then enqueued as before).
+    """
+    try:
+        redis = get_redis()
+        if await redis.set(_key(request_key), job_id, nx=True, ex=ttl_s):
+            return None
+        holder = await redis.get(_key(request_key))
+    except RedisError:
+        logger.warning("Could not claim request %s", request_key, exc_info=True)
+        return None
+    # Released between the two calls: the next claim usually wins.
+    return holder.decode() if holder else ""
+
+
+async def replace(request_key: str, holder: str, job_id: str, ttl_s: int) -> bool:
+    """Take a claim over from ``holder`` (a job that ended without releasing it)."""
+    try:
+        swap = get_redis().register_script(_SWAP)
+        return bool(await swap(keys=[_key(request_key)], args=[holder, job_id, ttl_s]))
+    except RedisError:
+        logger.warning("Could not replace claim on request %s", request_key, exc_info=True)
+        return False
+
+
+async def refresh(request_key: str, job_id: str, ttl_s: int) -> bool:
+    """Restart the claim's TTL if ``job_id`` still holds it. Never raises; a lost refresh only risks a duplicate."""
+    try:
+        swap = get_redis().register_script(_SWAP)
+        return bool(await swap(keys=[_key(request_key)], args=[job_id, job_id, ttl_s]))
+    except RedisError:
+        logger.warning("Could not refresh claim on request %s", request_key, exc_info=True)
+        return False
+
+
+async def release(request_key: str, job_id: str) -> None:
+    """Drop the claim if ``job_id`` still holds it. Never raises; claims expire anyway."""
+    try:
+        swap = get_redis().register_script(_SWAP)
+        await swap(keys=[_key(request_key)], args=[job_id, "", 0])
+    except RedisError:
+        logger.warning("Could not release request %s", request_key, exc_info=True)
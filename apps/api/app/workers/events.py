@@ -0,0 +1,63 @@
+from __future__ import annotations
+import json
+import logging
+import time
+from redis.exceptions import RedisError
+from ..redis_pool import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "coursegen:job"
+STREAM_MAXLEN = 1000  # approximate; old progress ticks are trimmed first
+STREAM_TTL_S = 24 * 3600  # refreshed on every event
+TERMINAL_STATUSES = ("finished", "failed")
+
+
+def _key(job_id: str) -> str:
+    return f"{KEY_PREFIX}:{job_id}:events"
+
+
+async def publish(job_id: str, event: dict) -> str | None:
+    """Append one event to the job's Redis stream; returns its id (the SSE event id).
+
+    A Redis stream rather than plain pub/sub so that clients can resume from a
+    Last-Event-ID. Never raises: the Job row stays the record of truth.
+    """
+    key = _key(job_id)
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            pipe.xadd(key, {"data": json.dumps({**event, "ts": time.time()}, default=str)}, maxlen=STREAM_MAXLEN, approximate=True)
+            pipe.expire(key, STREAM_TTL_S)
+            event_id, _ = await pipe.execute()
+    except RedisError:
+        logger.warning("Could not publish event for job %s", job_id, exc_info=True)
+        return None
+    return event_id.decode() if isinstance(event_id, bytes) else event_id
+
+
+def _decode(entries) -> list[tuple[str, dict]]:
+    out = []
+    for event_id, fields in entries:
+        event_id = event_id.decode() if isinstance(event_id, bytes) else event_id
+        out.append((event_id, json.loads(fields[b"data"])))
+    return out
+
+
+async def read(job_id: str, after: str = "0", *, block_ms: int = 15_000, count: int = 100) -> list[tuple[str, dict]]:
+    """Events after ``after`` (an event id, "0" for all), waiting up to ``block_ms`` for new ones."""
+    resp = await get_redis().xread({_key(job_id): after}, block=block_ms, count=count)
+    return _decode(resp[0][1]) if resp else []
+
+
+async def last(job_id: str) -> tuple[str, dict] | None:
+    """The most recent event, or None when the job has none (unknown, expired, or from before events)."""
+    entries = _decode(await get_redis().xrevrange(_key(job_id), count=1))
+    return entries[0] if entries else None
+
+
+async def reset(job_id: str) -> None:
+    """Start a resumed job's stream over: replay ends at the first finished/failed event."""
+    try:
+        await get_redis().delete(_key(job_id))
+    except RedisError:
+        logger.warning("Could not reset events for job %s", job_id, exc_info=True)
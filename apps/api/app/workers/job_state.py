@@ -0,0 +1,100 @@
+from __future__ import annotations
+import datetime as dt
+import json
+import logging
+from redis.exceptions import RedisError
+from ..redis_pool import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "coursegen:job"
+STATE_TTL_S = 7 * 24 * 3600  # refreshed on every update; the Job row has the final state anyway
+TERMINAL_STATUSES = ("finished", "failed")
+# Each payload key is its own hash field, so concurrent partial updates merge instead of clobbering each other.
+_PAYLOAD = "payload."
+
+
+def _key(job_id: str) -> str:
+    return f"{KEY_PREFIX}:{job_id}:state"
+
+
+def _fields(status, progress, message, payload, usage) -> dict[str, str | int]:
+    fields: dict[str, str | int] = {}
+    if status is not None:
+        fields["status"] = status
+    if progress is not None:
+        fields["progress"] = progress
+    if message is not None:
+        fields["message"] = message[:512]
+    if usage is not None:
+        fields["usage"] = json.dumps(usage)
+    for k, v in (payload or {}).items():
+        fields[_PAYLOAD + k] = json.dumps(v, default=str)
+    return fields
+
+
+async def create(job_id: str, *, status: str, message: str, payload: dict, created_at: dt.datetime) -> None:
+    """Initial state of a new job. Never raises; GET /jobs falls back to the Job row."""
+    now = created_at.isoformat()
+    key = _key(job_id)
+    try:
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping={**_fields(status, 0, message, payload, None), "created_at": now, "updated_at": now})
+            pipe.expire(key, STATE_TTL_S)
+            await pipe.execute()
+    except RedisError:
+        logger.warning("Could not store state for job %s", job_id, exc_info=True)
+
+
+async def update(
+    job_id: str,
+    *,
+    status: str | None = None,
+    progress: int | None = None,
+    message: str | None = None,
+    payload: dict | None = None,
+    usage: dict | None = None,
+) -> str | None:
+    """Apply a partial update. Returns the status it replaced ("" if there was none), or None if Redis failed."""
+    now = dt.datetime.utcnow().isoformat()
+    key = _key(job_id)
+    try:
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.hget(key, "status")
+            pipe.hset(key, mapping={**_fields(status, progress, message, payload, usage), "updated_at": now})
+            if status == "started":
+                pipe.hsetnx(key, "started_at", now)
+            if status in TERMINAL_STATUSES:
+                pipe.hset(key, "finished_at", now)
+            elif status is not None:
+                pipe.hdel(key, "finished_at")  # retried or resumed
+            pipe.expire(key, STATE_TTL_S)
+            previous = (await pipe.execute())[0]
+    except RedisError:
+        logger.warning("Could not update state for job %s", job_id, exc_info=True)
+        return None
+    return previous.decode() if previous else ""
+
+
+async def load(job_id: str) -> dict | None:
+    """Live state shaped like JobOut (fields never written are missing), or None if Redis has none."""
+    try:
+        raw = await get_redis().hgetall(_key(job_id))
+    except RedisError:
+        logger.warning("Could not load state for job %s", job_id, exc_info=True)
+        return None
+    if not raw:
+        return None
+    h = {k.decode(): v.decode() for k, v in raw.items()}
+    state: dict = {
+        "id": job_id,
+        "payload": {k[len(_PAYLOAD):]: json.loads(v) for k, v in h.items() if k.startswith(_PAYLOAD)},
+    }
+    for name in ("status", "message", "created_at", "updated_at", "started_at", "finished_at"):
+        if name in h:
+            state[name] = h[name]
+    if "progress" in h:
+        state["progress"] = int(h["progress"])
+    if "usage" in h:
+        state["usage"] = json.loads(h["usage"])
+    return state
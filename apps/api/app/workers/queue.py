@@ -0,0 +1,159 @@
+from __future__ import annotations
+import datetime as dt
+import uuid
+from rq import Queue
+from redis import Redis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models import Job
+from ..settings import settings
+from . import coalesce, events, job_state
+
+QUEUE_NAME = "coursegen"
+JOB_TIMEOUT = 3600
+CLAIM_TTL = JOB_TIMEOUT + 300  # how long a dead worker's job can block identical requests
+
+def get_queue() -> Queue:
+    redis = Redis.from_url(settings.redis_url)
+    return Queue(QUEUE_NAME, connection=redis, default_timeout=JOB_TIMEOUT)
+
+async def enqueue_tracked(db: AsyncSession, func: str, payload: dict, *, message: str = "Queued") -> str:
+    """Create a job's tracking `Job` row and live state, then enqueue it. Returns the job id.
+
+    The row and state exist before any worker can pick the job up, so the
+    worker's first update never races the "queued" one.
+    """
+    job_id, _ = await _enqueue(db, func, payload, message=message)
+    return job_id
+
+async def enqueue_coalesced(
+    db: AsyncSession,
+    func: str,
+    payload: dict,
+    *,
+    message: str = "Queued",
+    claim_ttl: int = CLAIM_TTL,
+    key: dict | None = None,
+) -> tuple[str, bool]:
+    """Like `enqueue_tracked`, unless an identical request is already queued or running.
+
+    Returns ``(job_id, deduplicated)``; a duplicate gets the in-flight job's id,
+    so double submits and client retries follow one job instead of paying for
+    the same map/reduce twice. Requests are identical when their payloads are,
+    or their ``key`` fields if given. The claim is released when the job
+    finishes or fails, and expires after ``claim_ttl`` seconds if its worker dies.
+    """
+    request_key = coalesce.request_key(func, payload if key is None else key)
+    return await _enqueue(db, func, payload, message=message, request_key=request_key, claim_ttl=claim_ttl)
+
+async def resume_tracked(db: AsyncSession, row: Job, payload: dict, *, message: str = "Resuming") -> tuple[str, bool]:
+    """Enqueue a failed or abandoned job again under its own id; the task continues from its checkpoint.
+
+    ``payload`` is the original task payload. Returns ``(job_id, deduplicated)``
+    like `enqueue_coalesced`: when an identical request has started another job
+    since, that job's id comes back and this one is left as it was.
+    """
+    request_key = (row.payload or {}).get("request_key")
+    if request_key:
+        holder = await _claim(db, request_key, row.id, (row.payload or {}).get("claim_ttl", CLAIM_TTL))
+        if holder is not None:
+            return holder, True
+
+    row.status = "queued"
+    row.message = message
+    row.finished_at = None
+    row.updated_at = dt.datetime.utcnow()
+    await db.commit()
+    # A fresh stream: SSE replay would otherwise stop at the old failed event.
+    await events.reset(row.id)
+    await job_state.update(row.id, status="queued", message=message)
+    await events.publish(row.id, {"status": "queued", "message": message})
+    try:
+        # A continuation, like batch polling: the payload names the tracking job.
+        get_queue().enqueue(row.task, {**payload, "job_id": row.id}, job_timeout=JOB_TIMEOUT, result_ttl=3600)
+    except Exception as e:
+        await _enqueue_failed(db, row, e, request_key)
+        raise
+    return row.id, False
+
+async def _job_status(db: AsyncSession, job_id: str) -> str | None:
+    state = await job_state.load(job_id)
+    if state and "status" in state:
+        return state["status"]
+    return (await db.execute(select(Job.status).where(Job.id==job_id))).scalar_one_or_none()
+
+async def _claim(db: AsyncSession, request_key: str, job_id: str, ttl: int) -> str | None:
+    """Claim ``request_key`` for ``job_id``. Returns the id of another queued or running job holding it instead."""
+    for _ in range(3):
+        holder = await coalesce.claim(request_key, job_id, ttl)
+        if holder is None:
+            return None
+        if holder and holder != job_id:
+            status = await _job_status(db, holder)
+            if status is not None and status not in job_state.TERMINAL_STATUSES:
+                return holder
+        # Held by a job that ended without releasing it (or by this one, when resuming): take it over.
+        if holder and await coalesce.replace(request_key, holder, job_id, ttl):
+            return None
+    # Still unclaimed after that: go ahead rather than fail the request.
+    return None
+
+async def _enqueue_failed(db: AsyncSession, row: Job, e: Exception, request_key: str | None) -> None:
+    row.status = "failed"
+    row.message = f"Failed: could not enqueue: {type(e).__name__}: {e}"[:512]
+    row.finished_at = dt.datetime.utcnow()
+    await db.commit()
+    await job_state.update(row.id, status="failed", message=row.message)
+    await events.publish(row.id, {"status": "failed", "message": row.message})
+    if request_key:
+        await coalesce.release(request_key, row.id)
+
+async def _enqueue(
+    db: AsyncSession,
+    func: str,
+    payload: dict,
+    *,
+    message: str,
+    request_key: str | None = None,
+    claim_ttl: int = CLAIM_TTL,
+) -> tuple[str, bool]:
+    job_id = str(uuid.uuid4())
+    now = dt.datetime.utcnow()
+    row = Job(
+        id=job_id,
+        task=func,
+        status="queued",
+        progress=0,
+        message=message,
+        # The key rides along in the row (not the task payload) so status updates can refresh the
+        # claim for the same TTL and the final one can release it.
+        payload={**payload, "request_key": request_key, "claim_ttl": claim_ttl} if request_key else payload,
+        created_at=now,
+        updated_at=now,
+    )
+    db.add(row)
+    await db.commit()
+
+    if request_key:
+        # Claimed only after the commit, so a duplicate never gets the id of a row that does not exist yet.
+        holder = await _claim(db, request_key, job_id, claim_ttl)
+        if holder is not None:
+            await db.delete(row)
+            await db.commit()
+            return holder, True
+
+    await job_state.create(job_id, status="queued", message=message, payload=row.payload, created_at=now)
+    await events.publish(job_id, {"status": "queued", "progress": 0, "message": message})
+
+    try:
+        get_queue().enqueue(
+            func,
+            payload,
+            job_id=job_id,
+            job_timeout=JOB_TIMEOUT,
+            result_ttl=3600,
+        )
+    except Exception as e:
+        await _enqueue_failed(db, row, e, request_key)
+        raise
+    return job_id, False
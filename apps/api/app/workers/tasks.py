@@ -1,52 +1,344 @@
 from __future__ import annotations
 import asyncio, datetime as dt
+from datetime import timedelta
 from sqlalchemy import select, update
 from redis import Redis
 from rq import get_current_job
 
 from ..settings import settings
 from ..db import SessionLocal
-from ..models import Job
-from ..services.generate.engine import generate_artifacts
+from ..models import Book, Job
+from ..redis_pool import aclose_redis
+from ..services.generate.batch import TERMINAL, poll_map_batch, submit_map_batch
+from ..services.generate.checkpoint import Checkpoint, clear as clear_checkpoint
+from ..services.generate.engine import generate_artifacts, generate_book
+from ..services.ingest.ingest import ingest_book, rechapterize_book
+from ..services.llm.base import is_transient
+from ..services.llm.http import aclose_clients
+from ..services.llm.ratelimit import track_stats
+from ..services.llm.usage import UsageRecorder, track
+from . import coalesce, events, job_state
+from .queue import CLAIM_TTL, JOB_TIMEOUT, get_queue
 
 def _run(coro):
     return asyncio.get_event_loop().run_until_complete(coro)
 
-async def _update_job(job_id: str, *, status: str | None = None, progress: int | None = None, message: str | None = None):
+async def _update_job(
+    job_id: str,
+    *,
+    status: str | None = None,
+    progress: int | None = None,
+    message: str | None = None,
+    payload: dict | None = None,
+    usage: UsageRecorder | None = None,
+):
+    """Record a job update: event stream and Redis state right away, the Job row only on status changes.
+
+    Progress ticks never touch SQLite. The row is written behind when the status
+    changes (including completion), or on every update while Redis is unavailable.
+    """
+    usage_dict = usage.as_dict() if usage is not None else None
+    event = {"status": status, "progress": progress, "message": message, "payload": payload, "usage": usage_dict}
+    await events.publish(job_id, {k: v for k, v in event.items() if v is not None})
+    previous = await job_state.update(job_id, status=status, progress=progress, message=message, payload=payload, usage=usage_dict)
+    if previous is not None and (status is None or status == previous):
+        return
     try:
         async with SessionLocal() as session:
             row = (await session.execute(select(Job).where(Job.id==job_id))).scalar_one_or_none()
             if not row:
                 return
+            state = await job_state.load(job_id) if previous is not None else None
+            if state:
+                # Catch the row up on the progress only Redis has seen since the last flush.
+                row.progress = state.get("progress", row.progress)
+                row.message = state.get("message", row.message)
+                row.payload = {**(row.payload or {}), **state["payload"]}
+            now = dt.datetime.utcnow()
+            if status == "started" and row.started_at is None:
+                row.started_at = now
+            if status in job_state.TERMINAL_STATUSES:
+                row.finished_at = now
+            elif status is not None:
+                row.finished_at = None  # retried or resumed
             if status is not None:
                 row.status = status
             if progress is not None:
                 row.progress = progress
             if message is not None:
                 row.message = message[:512]
-            row.updated_at = dt.datetime.utcnow()
+            if payload is not None:
+                # Reassign so SQLAlchemy sees the JSON column change.
+                row.payload = {**(row.payload or {}), **payload}
+            if usage is not None:
+                row.usage = usage_dict
+            row.updated_at = now
             await session.commit()
+            request_key = (row.payload or {}).get("request_key")
+            claim_ttl = (row.payload or {}).get("claim_ttl", CLAIM_TTL)
+        if request_key and status in job_state.TERMINAL_STATUSES:
+            # Identical requests start a new job from here on.
+            await coalesce.release(request_key, job_id)
+        elif request_key and status is not None:
+            # Each start, retry or resume restarts the TTL, so a long-lived job keeps its claim.
+            await coalesce.refresh(request_key, job_id, claim_ttl)
     except Exception:
-        # Progress updates are non-critical; SQLite lock errors during
-        # concurrent writes are expected and safe to ignore here.
-        if status in ("finished", "failed"):
+        # Redis has the live state; a lost intermediate flush is caught up by the next one.
+        if status in job_state.TERMINAL_STATUSES:
             raise  # Status transitions must succeed
 
-def generate_job(payload: dict):
+def _job_id(payload: dict) -> str:
+    # Continuations (rescheduled steps of one logical job) carry the tracking id explicitly.
+    if payload.get("job_id"):
+        return payload["job_id"]
     rq_job = get_current_job()
-    job_id = rq_job.id if rq_job else payload.get("job_id") or "unknown"
+    return rq_job.id if rq_job else "unknown"
+
+def _run_job(impl, job_id: str, payload: dict):
+    """Run one job's coroutine on this process's loop (forking RQ worker, or the asyncio worker's process pool)."""
+    async def _main():
+        try:
+            return await impl(job_id, payload)
+        finally:
+            # RQ forks a work horse per job, so the provider pools live exactly as long as the job.
+            await aclose_clients()
+            await aclose_redis()
+    return _run(_main())
+
+def _failed(e: BaseException) -> str:
+    return f"Failed: {type(e).__name__}: {str(e)}"
+
+# Keys a continuation adds to a task payload; the rest are the generation options.
+_CONTINUATION_KEYS = ("job_id", "attempt")
+
+def _options(payload: dict) -> dict:
+    return {k: v for k, v in payload.items() if k not in _CONTINUATION_KEYS}
+
+async def _load_usage(job_id: str) -> UsageRecorder:
+    # A retried or resumed job keeps counting from what its earlier attempts spent.
+    async with SessionLocal() as session:
+        usage = (await session.execute(select(Job.usage).where(Job.id==job_id))).scalar_one_or_none()
+    return UsageRecorder.from_dict(usage)
+
+async def _retry_later(job_id: str, func: str, payload: dict, error: str, usage: UsageRecorder | None) -> bool:
+    """Schedule another attempt of a job that hit a transient failure; False once retries are used up.
+
+    The next attempt loads the job's checkpoint, so only the calls that were in
+    flight are repeated. Needs a worker started with --with-scheduler.
+    """
+    attempt = payload.get("attempt", 1)
+    if attempt > settings.job_max_retries:
+        return False
+    delay = settings.job_retry_delay * 2 ** (attempt - 1)
+    try:
+        get_queue().enqueue_in(
+            timedelta(seconds=delay),
+            func,
+            {**payload, "job_id": job_id, "attempt": attempt + 1},
+            job_timeout=JOB_TIMEOUT,
+        )
+    except Exception:
+        return False  # the job is marked failed instead; it can still be resumed by hand
+    await _update_job(job_id, status="queued", message=f"Retrying in {delay}s (attempt {attempt + 1}): {error}", usage=usage)
+    return True
+
+async def run_generate(job_id: str, payload: dict) -> dict:
+    job_usage = await _load_usage(job_id)
+
+    async def progress_cb(pct: int, msg: str, extra: dict | None = None):
+        await _update_job(job_id, progress=pct, message=msg, status="started", payload=extra)
+
+    try:
+        await _update_job(job_id, status="started", progress=1, message="Starting")
+        checkpoint = await Checkpoint.load(job_id)
+        async with SessionLocal() as session:
+            with track(job_usage), track_stats():
+                artifact_ids = await generate_artifacts(session, progress_cb=progress_cb, checkpoint=checkpoint, **_options(payload))
+        await _update_job(job_id, status="finished", progress=100, message="Done",
+                          payload={"artifact_ids": artifact_ids}, usage=job_usage)
+        await clear_checkpoint(job_id)
+        return {"ok": True, "artifact_ids": artifact_ids}
+    except Exception as e:
+        if is_transient(e) and await _retry_later(job_id, "app.workers.tasks.generate_job", payload, _failed(e), job_usage):
+            return {"ok": False, "retrying": True}
+        await _update_job(job_id, status="failed", message=_failed(e), usage=job_usage)
+        raise
+
+async def run_generate_book(job_id: str, payload: dict) -> dict:
+    job_usage = await _load_usage(job_id)
+
+    async def progress_cb(pct: int, msg: str, extra: dict | None = None):
+        await _update_job(job_id, progress=pct, message=msg, status="started", payload=extra)
+
+    try:
+        await _update_job(job_id, status="started", progress=1, message="Starting")
+        checkpoint = await Checkpoint.load(job_id)
+        with track(job_usage), track_stats():
+            state = await generate_book(SessionLocal, progress_cb=progress_cb, checkpoint=checkpoint, **_options(payload))
+        transient = [i for i, s in state.items() if s["status"] == "failed" and s.get("transient")]
+        if transient and await _retry_later(
+            job_id, "app.workers.tasks.generate_book_job", payload,
+            f"{len(transient)} chapter(s) failed: {state[transient[0]]['error']}", job_usage,
+        ):
+            await _update_job(job_id, payload={"chapters": {str(i): s for i, s in state.items()}})
+            return {"ok": False, "retrying": True}
+        return await _finish_book(job_id, state, job_usage)
+    except Exception as e:
+        if is_transient(e) and await _retry_later(job_id, "app.workers.tasks.generate_book_job", payload, _failed(e), job_usage):
+            return {"ok": False, "retrying": True}
+        await _update_job(job_id, status="failed", message=_failed(e), usage=job_usage)
+        raise
+
+async def _finish_book(job_id: str, state: dict[int, dict], usage: UsageRecorder) -> dict:
+    chapters = {str(i): s for i, s in state.items()}
+    failed = [i for i, s in state.items() if s["status"] == "failed"]
+    if len(failed) == len(state):
+        raise RuntimeError(f"All {len(state)} chapters failed")
+    message = f"Done: {len(state) - len(failed)}/{len(state)} chapters" + (f" ({len(failed)} failed)" if failed else "")
+    await _update_job(job_id, status="finished", progress=100, message=message, payload={"chapters": chapters}, usage=usage)
+    if not failed:
+        # With failed chapters the checkpoint stays, so a resume only redoes those.
+        await clear_checkpoint(job_id)
+    return {"ok": True, "failed": failed}
+
+async def run_batch_generate(job_id: str, payload: dict) -> dict:
+    """Whole-book generation with the map phase sent through the OpenAI Batch API.
+
+    Each run performs one step (submit, or poll) and re-enqueues itself while the
+    batch is pending. The batch id is committed to the Job row before anything
+    else happens, so a worker restart only delays the next poll; it never
+    resubmits. Once the batch is done its notes are in the map cache and the
+    normal whole-book pass runs with live reduce calls.
+    """
+    options = _options(payload)
+    job_usage: UsageRecorder | None = None  # restored from the Job row by each step
 
+    async def progress_cb(pct: int, msg: str, extra: dict | None = None):
+        await _update_job(job_id, progress=pct, message=msg, status="started", payload=extra)
+
+    try:
+        async with SessionLocal() as session:
+            row = (await session.execute(select(Job).where(Job.id==job_id))).scalar_one_or_none()
+            # enqueue_tracked commits the row before the job can run.
+            if row is None:
+                raise RuntimeError("Job row not found")
+            state = (row.payload or {}).get("batch")
+            # Usage accumulates over every step of the job.
+            job_usage = UsageRecorder.from_dict(row.usage)
+            kwargs = {"model": options.get("model"), "temperature": options.get("temperature", 0.3)}
+            with track(job_usage), track_stats():
+                if state is None:
+                    state = await submit_map_batch(
+                        session, book_id=options["book_id"], chapter_indices=options.get("chapter_indices"), **kwargs,
+                    ) or {"status": "skipped"}
+                elif state["status"] not in TERMINAL or (state["status"] == "completed" and state.get("stored") is None):
+                    state = await poll_map_batch(session, state, **kwargs)
+            # Reassign so SQLAlchemy sees the JSON column change.
+            row.payload = {**(row.payload or {}), "batch": state}
+            row.usage = job_usage.as_dict()
+            row.status = "started"
+            row.started_at = row.started_at or dt.datetime.utcnow()
+            row.message = f"Map batch {state['status']}: {state.get('completed', 0)}/{state.get('requests', 0)} done"
+            row.updated_at = dt.datetime.utcnow()
+            await session.commit()
+            # Written to the row directly above because the next step reads it back; mirror it live.
+            await events.publish(job_id, {"status": row.status, "message": row.message, "payload": {"batch": state}})
+            await job_state.update(job_id, status=row.status, message=row.message, payload={"batch": state}, usage=row.usage)
+            if row.payload.get("request_key"):
+                # Every poll step keeps the claim alive for the whole (possibly hours-long) batch.
+                await coalesce.refresh(row.payload["request_key"], job_id, row.payload.get("claim_ttl", CLAIM_TTL))
+
+        if state["status"] not in TERMINAL and state["status"] != "skipped":
+            get_queue().enqueue_in(
+                timedelta(seconds=settings.openai_batch_poll_interval),
+                "app.workers.tasks.batch_generate_job",
+                {**options, "job_id": job_id},
+                job_timeout=JOB_TIMEOUT,
+            )
+            return {"ok": True, "pending": True}
+        with track(job_usage), track_stats():
+            chapters = await generate_book(SessionLocal, progress_cb=progress_cb, checkpoint=await Checkpoint.load(job_id), **options)
+        return await _finish_book(job_id, chapters, job_usage)
+    except Exception as e:
+        await _update_job(job_id, status="failed", message=_failed(e), usage=job_usage)
+        raise
+
+async def run_ingest(job_id: str, payload: dict) -> dict:
     async def progress_cb(pct: int, msg: str):
         await _update_job(job_id, progress=pct, message=msg, status="started")
 
     try:
-        _run(_update_job(job_id, status="started", progress=1, message="Starting"))
-        async def _do():
-            async with SessionLocal() as session:
-                await generate_artifacts(session, progress_cb=progress_cb, **payload)
-        _run(_do())
-        _run(_update_job(job_id, status="finished", progress=100, message="Done"))
-        return {"ok": True}
+        await _update_job(job_id, status="started", progress=1, message="Starting")
+        async with SessionLocal() as session:
+            book = await ingest_book(
+                session,
+                payload["path"],
+                title=payload.get("title"),
+                author=payload.get("author"),
+                content_hash=payload.get("content_hash"),
+                progress_cb=progress_cb,
+            )
+            book_id = book.id
+        await _update_job(job_id, status="finished", progress=100, message="Done", payload={"book_id": book_id})
+        return {"ok": True, "book_id": book_id}
     except Exception as e:
-        _run(_update_job(job_id, status="failed", message=f"Failed: {type(e).__name__}: {str(e)}"))
+        await _update_job(job_id, status="failed", message=_failed(e))
         raise
+
+async def run_rechapterize(job_id: str, payload: dict) -> dict:
+    async def progress_cb(pct: int, msg: str):
+        await _update_job(job_id, progress=pct, message=msg, status="started")
+
+    try:
+        await _update_job(job_id, status="started", progress=1, message="Starting")
+        async with SessionLocal() as session:
+            book = (await session.execute(select(Book).where(Book.id==payload["book_id"]))).scalar_one()
+            chapters = await rechapterize_book(
+                session,
+                book,
+                min_chapter_chars=payload.get("min_chapter_chars", 2000),
+                strategy=payload.get("strategy"),
+                discard_artifacts=payload.get("discard_artifacts", False),
+                progress_cb=progress_cb,
+            )
+        await _update_job(job_id, status="finished", progress=100, message=f"Done: {chapters} chapters",
+                          payload={"book_id": payload["book_id"], "chapters": chapters})
+        return {"ok": True, "chapters": chapters}
+    except Exception as e:
+        await _update_job(job_id, status="failed", message=_failed(e))
+        raise
+
+# RQ entry points (what enqueue_tracked names).
+def generate_job(payload: dict):
+    return _run_job(run_generate, _job_id(payload), payload)
+
+def generate_book_job(payload: dict):
+    return _run_job(run_generate_book, _job_id(payload), payload)
+
+def batch_generate_job(payload: dict):
+    return _run_job(run_batch_generate, _job_id(payload), payload)
+
+def ingest_job(payload: dict):
+    return _run_job(run_ingest, _job_id(payload), payload)
+
+def rechapterize_job(payload: dict):
+    return _run_job(run_rechapterize, _job_id(payload), payload)
+
+# Coroutine behind each RQ entry point, for the asyncio worker (workers/async_worker.py).
+TASKS = {
+    "app.workers.tasks.generate_job": run_generate,
+    "app.workers.tasks.generate_book_job": run_generate_book,
+    "app.workers.tasks.batch_generate_job": run_batch_generate,
+    "app.workers.tasks.ingest_job": run_ingest,
+    "app.workers.tasks.rechapterize_job": run_rechapterize,
+}
+# These spend their time waiting on HTTP and share the worker's loop; the rest
+# (ingestion is CPU-bound) go to a child process through run_in_process.
+LOOP_TASKS = {
+    "app.workers.tasks.generate_job",
+    "app.workers.tasks.generate_book_job",
+    "app.workers.tasks.batch_generate_job",
+}
+
+def run_in_process(func_name: str, job_id: str, payload: dict):
+    return _run_job(TASKS[func_name], job_id, payload)
@@ -0,0 +1,54 @@
+"""Time chapterize on a large synthetic book (default ~62 MB, 200 chapters).
+
+Two runs: with embedded TOC titles (the toc_titles strategy), and without a TOC,
+so the printed-TOC and heading strategies scan the whole text.
+
+    cd apps/api && PYTHONPATH=. python scripts/bench_chapterize.py [--mb 62] [--chapters 200]
+"""
+from __future__ import annotations
+import argparse
+import time
+from app.services.ingest.chapterize import chapterize
+
+PAGE_CHARS = 3000
+SENTENCE = "Engineers measure before they optimize, and they keep   the measurements honest. "
+
+
+def synthetic_book(mb: float, chapters: int) -> tuple[str, list[str], list[int]]:
+    chapter_chars = int(mb * 1_000_000) // chapters
+    body = (SENTENCE * (PAGE_CHARS // len(SENTENCE) + 1))[:PAGE_CHARS - 1] + "\n"
+    titles: list[str] = []
+    parts: list[str] = []
+    page_offsets: list[int] = []
+    cursor = 0
+    for i in range(1, chapters + 1):
+        title = f"Chapter {i}  Notes on   Topic {i}"  # doubled spaces, as PDF extraction leaves them
+        titles.append(title)
+        pages = max(1, chapter_chars // PAGE_CHARS)
+        # Each chapter opens a page with its heading on the first line.
+        page_offsets.append(cursor)
+        page_offsets.extend(cursor + len(title) + 1 + k * PAGE_CHARS for k in range(1, pages))
+        parts.append(f"{title}\n" + body * pages)
+        cursor += len(parts[-1])
+    return "".join(parts), titles, page_offsets
+
+
+def timed(label: str, **kwargs) -> None:
+    start = time.perf_counter()
+    spans = chapterize(**kwargs)
+    print(f"{label:<14} {time.perf_counter() - start:7.2f}s  {len(spans)} spans")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=float, default=62)
+    ap.add_argument("--chapters", type=int, default=200)
+    args = ap.parse_args()
+    text, titles, page_offsets = synthetic_book(args.mb, args.chapters)
+    print(f"{len(text) / 1e6:.1f} MB, {args.chapters} chapters, {len(page_offsets)} pages")
+    timed("toc titles", text=text, toc_titles=titles, page_offsets=page_offsets)
+    timed("no toc", text=text, page_offsets=page_offsets)
+
+
+if __name__ == "__main__":
+    main()
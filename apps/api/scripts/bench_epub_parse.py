@@ -0,0 +1,62 @@
+"""Time EPUB extraction of a synthetic 5,000-section book per parser and worker count.
+
+    cd apps/api && PYTHONPATH=. python scripts/bench_epub_parse.py [--sections 5000] [--workers 4]
+"""
+from __future__ import annotations
+import argparse
+import os
+import tempfile
+import time
+from ebooklib import epub
+from app.services.ingest import epub as epub_ingest
+from app.services.ingest.images import ImageSink
+
+PARAGRAPH = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt. " * 6
+
+
+def build(path: str, sections: int) -> None:
+    book = epub.EpubBook()
+    book.set_identifier("bench")
+    book.set_title("Benchmark")
+    book.add_item(epub.EpubItem(uid="img", file_name="images/fig.png", media_type="image/png", content=os.urandom(16 * 1024)))
+    spine = []
+    for i in range(sections):
+        doc = epub.EpubHtml(title=f"Section {i}", file_name=f"text/s{i:05d}.xhtml")
+        body = "".join(f"<p>{PARAGRAPH}</p>\n" for _ in range(8))
+        doc.content = (
+            f"<html><body><section epub:type='chapter'><h1>Section {i}</h1>\n{body}"
+            f"<figure><img src='../images/fig.png'/><figcaption>Figure {i}</figcaption></figure>\n"
+            f"<table><tr><td>cell</td><td>{i}</td></tr></table></section></body></html>"
+        )
+        book.add_item(doc)
+        spine.append(doc)
+    book.spine = spine
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    epub.write_epub(path, book)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sections", type=int, default=5000)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.epub")
+        build(path, args.sections)
+        print(f"{args.sections} sections, {os.path.getsize(path) / 1e6:.1f} MB")
+        texts = {}
+        for parser, workers in (("html.parser", 1), ("lxml", 1), ("lxml", args.workers)):
+            epub_ingest.settings.epub_parser = parser
+            sink = ImageSink(os.path.join(tmp, "images"))
+            start = time.perf_counter()
+            out = epub_ingest.extract_epub(path, sink, workers=workers)
+            elapsed = time.perf_counter() - start
+            texts[(parser, workers)] = out.text
+            print(f"{parser:<12} workers={workers:<3} {elapsed:7.2f}s  {len(out.text):,} chars")
+        print("identical text:", len(set(texts.values())) == 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Per-call latency of provider HTTP calls against a local stub: a client per call vs the shared pool.
+
+Starts services/llm/batch_stub on a free local port and POSTs /v1/responses the way
+the providers do. "per-call" opens and closes an httpx.AsyncClient around every
+request (the old provider code); "pooled" goes through llm.http.get_client. The stub
+is plain HTTP on loopback, so the TLS handshake a real provider adds per new
+connection is not in these numbers.
+
+    cd apps/api && PYTHONPATH=. python scripts/bench_llm_http.py [--calls 500] [--concurrency 8]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import socket
+import statistics
+import threading
+import time
+import httpx
+import uvicorn
+from app.services.llm.batch_stub import app as stub_app
+from app.services.llm.http import aclose_clients, get_client
+
+BODY = {"model": "stub", "input": [{"role": "user", "content": "Summarize the chapter."}]}
+
+
+def start_stub() -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(stub_app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+async def per_call(base_url: str) -> None:
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        r = await client.post("/responses", json=BODY)
+        r.raise_for_status()
+
+
+async def pooled(base_url: str) -> None:
+    r = await get_client(base_url).post("/responses", json=BODY)
+    r.raise_for_status()
+
+
+async def measure(call, base_url: str, calls: int, concurrency: int) -> list[float]:
+    latencies: list[float] = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        async with sem:
+            start = time.perf_counter()
+            await call(base_url)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(calls)))
+    return latencies
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--calls", type=int, default=500)
+    ap.add_argument("--concurrency", type=int, default=8)
+    args = ap.parse_args()
+    base_url = start_stub()
+    for concurrency in sorted({1, args.concurrency}):
+        for name, call in (("per-call", per_call), ("pooled", pooled)):
+            await measure(call, base_url, 20, concurrency)  # warm up
+            start = time.perf_counter()
+            ms = sorted(await measure(call, base_url, args.calls, concurrency))
+            wall = time.perf_counter() - start
+            print(
+                f"concurrency={concurrency:<3} {name:<9} p50={statistics.median(ms):6.2f}ms "
+                f"p95={ms[int(len(ms) * 0.95) - 1]:6.2f}ms  {args.calls / wall:7.0f} calls/s"
+            )
+    await aclose_clients()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
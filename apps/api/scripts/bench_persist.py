@@ -0,0 +1,120 @@
+"""Rows/sec persisting a synthetic 2,000-chapter / 20,000-image book, before and after bulk inserts.
+
+"before" replays the pre-persist.py ingest loop (one flush per chapter, one ORM object
+per chunk and image, chapters x images assignment); "after" is services/ingest/persist.py.
+Each run gets a fresh SQLite database.
+
+    cd apps/api && PYTHONPATH=. python scripts/bench_persist.py [--chapters 2000] [--images 20000]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from app.db import Base
+from app.models import Book, Chapter, Chunk, Image
+from app.settings import settings
+from app.services.ingest.chapterize import ChapterSpan
+from app.services.ingest.chunking import iter_chunks
+from app.services.ingest.images import StoredImage
+from app.services.ingest.persist import insert_chapters, insert_images
+from app.services.llm.tokens import chunk_token_budget, default_model, get_tokenizer
+
+PARAGRAPH = "The quick brown fox jumps over the lazy dog while the compiler checks every branch. " * 8
+
+
+def synthetic_book(chapters: int, images: int) -> tuple[str, list[ChapterSpan], list[StoredImage]]:
+    parts: list[str] = []
+    spans: list[ChapterSpan] = []
+    cursor = 0
+    for i in range(chapters):
+        text = f"Chapter {i + 1}\n\n" + "\n\n".join(PARAGRAPH for _ in range(6))
+        spans.append(ChapterSpan(index=i + 1, title=f"Chapter {i + 1}", start=cursor, end=cursor + len(text)))
+        parts.append(text)
+        cursor += len(text) + 1
+    full_text = "\n".join(parts)
+    rng = random.Random(0)
+    stored = [
+        StoredImage(filename=f"{n:032x}.png", sha256=f"{n:064x}", ext="png", mime="image/png",
+                    page=n, offset=rng.randrange(len(full_text)), width=640, height=480)
+        for n in range(images)
+    ]
+    return full_text, spans, stored
+
+
+async def legacy_persist(session: AsyncSession, book_id: int, spans, full_text: str, images) -> None:
+    provider_name, model = default_model()
+    max_tokens = chunk_token_budget(provider_name, model)
+    count = get_tokenizer(model)
+    chapters: list[tuple[Chapter, ChapterSpan]] = []
+    for span in spans:
+        ch_text = full_text[span.start:span.end].strip()
+        chapter = Chapter(book_id=book_id, index=span.index, title=span.title, start_offset=span.start,
+                          end_offset=span.end, word_count=len(ch_text.split()))
+        session.add(chapter)
+        await session.flush()
+        chapters.append((chapter, span))
+        for i, (c, n) in enumerate(iter_chunks(ch_text, max_tokens, settings.chunk_overlap_tokens, count), start=1):
+            session.add(Chunk(chapter_id=chapter.id, chunk_index=i, text=c, token_count=n))
+
+    def _image(chapter_id, img):
+        return Image(book_id=book_id, chapter_id=chapter_id, filename=img["filename"], mime_type=img["mime"],
+                     source_page=img["page"], position_offset=img["offset"], width=img["width"], height=img["height"])
+
+    for chapter, span in chapters:
+        for img in images:
+            if span.start <= img["offset"] < span.end:
+                session.add(_image(chapter.id, img))
+    assigned = set()
+    for span in spans:
+        for img in images:
+            if span.start <= img["offset"] < span.end:
+                assigned.add(id(img))
+    for img in images:
+        if id(img) not in assigned:
+            session.add(_image(None, img))
+
+
+async def bulk_persist(session: AsyncSession, book_id: int, spans, full_text: str, images) -> None:
+    chapter_ids = await insert_chapters(session, book_id, spans, full_text)
+    await insert_images(session, book_id, spans, chapter_ids, images)
+
+
+async def run(name: str, persist, full_text, spans, images, directory: str) -> None:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, name)}.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with Session() as session:
+        book = Book(title="Benchmark", source_type="txt")
+        session.add(book)
+        await session.commit()
+        start = time.perf_counter()
+        await persist(session, book.id, spans, full_text, images)
+        await session.commit()
+        elapsed = time.perf_counter() - start
+        rows = 0
+        for model in (Chapter, Chunk, Image):
+            rows += (await session.execute(select(func.count()).select_from(model))).scalar_one()
+    await engine.dispose()
+    print(f"{name:<7} {rows:>7,} rows in {elapsed:6.2f}s  {rows / elapsed:>10,.0f} rows/s")
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chapters", type=int, default=2000)
+    ap.add_argument("--images", type=int, default=20000)
+    args = ap.parse_args()
+    full_text, spans, images = synthetic_book(args.chapters, args.images)
+    print(f"{args.chapters} chapters, {args.images} images, {len(full_text) / 1e6:.1f}M chars")
+    with tempfile.TemporaryDirectory() as tmp:
+        await run("before", legacy_persist, full_text, spans, images, tmp)
+        await run("after", bulk_persist, full_text, spans, images, tmp)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# Settings are read at import time; keep tests off the container's /data volume.
+_tmp = tempfile.mkdtemp(prefix="coursegen-tests-")
+os.environ.setdefault("COURSEGEN_DB_URL", f"sqlite+aiosqlite:///{_tmp}/coursegen.db")
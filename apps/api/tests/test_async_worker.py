@@ -0,0 +1,138 @@
+import asyncio
+import pytest
+import redis
+from rq import Queue
+from rq.job import Job as RQJob
+from app.workers import async_worker
+
+TASK = "app.workers.tasks.generate_job"
+
+
+class StubRedis(redis.Redis):
+    """Records every command instead of sending it; reads come back empty."""
+
+    def __init__(self, commands=None):
+        super().__init__()
+        self.commands = [] if commands is None else commands
+
+    def execute_command(self, *args, **options):
+        self.commands.append(args)
+        if args[0] == "INFO":
+            return {"redis_version": "7.2.0"}  # results go to a stream from 5.0 on
+        return None
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return StubPipeline(self.commands)
+
+    def ops(self) -> list[tuple[str, str]]:
+        return [(args[0], args[1].decode() if isinstance(args[1], bytes) else args[1])
+                for args in self.commands if args[0] != "INFO"]
+
+
+class StubPipeline(StubRedis):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def multi(self):
+        pass
+
+    def watch(self, *names):
+        pass
+
+    def execute(self, raise_on_error=True):
+        return []
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    updates = []
+
+    async def update_job(job_id, **fields):
+        updates.append((job_id, fields))
+
+    monkeypatch.setattr(async_worker, "_update_job", update_job)
+    conn = StubRedis()
+    queue = Queue("coursegen", connection=conn)
+    w = async_worker.AsyncWorker(queue, concurrency=1, process_slots=1, shutdown_timeout=1)
+    job = RQJob.create(TASK, args=({"book_id": 1},), connection=conn, id="rq-1", timeout=5, origin=queue.name)
+    conn.commands.clear()
+    return w, job, queue, conn, updates
+
+
+def _perform(monkeypatch, worker, task):
+    w, job, queue, conn, _ = worker
+    monkeypatch.setitem(async_worker.TASKS, TASK, task)
+    asyncio.run(w._perform(job, queue))
+    return conn.ops()
+
+
+def test_dequeue_moves_the_job_to_the_started_registry(monkeypatch, worker):
+    w, job, queue, conn, _ = worker
+    monkeypatch.setattr(Queue, "dequeue_any", classmethod(lambda cls, *a, **kw: (job, queue)))
+    assert w._dequeue() == (job, queue)
+    assert conn.ops() == [
+        ("HSET", "rq:job:rq-1"),
+        ("ZADD", "rq:wip:coursegen"),
+        ("LREM", "rq:queue:coursegen:intermediate"),
+    ]
+    assert job.get_status(refresh=False) == "started"
+    assert job.worker_name == w.name
+
+
+def test_success_is_recorded_as_finished(monkeypatch, worker):
+    async def task(job_id, payload):
+        return {"job_id": job_id, **payload}
+
+    ops = _perform(monkeypatch, worker, task)
+    assert ("ZREM", "rq:wip:coursegen") in ops
+    assert ("XADD", "rq:results:rq-1") in ops
+    assert ("ZADD", "rq:finished:coursegen") in ops
+    assert ("ZADD", "rq:failed:coursegen") not in ops
+    job = worker[1]
+    assert job.get_status(refresh=False) == "finished"
+    assert job._result == {"job_id": "rq-1", "book_id": 1}
+
+
+def test_an_exception_fails_only_its_job(monkeypatch, worker):
+    async def task(job_id, payload):
+        raise ValueError("boom")
+
+    ops = _perform(monkeypatch, worker, task)
+    assert ("ZREM", "rq:wip:coursegen") in ops
+    assert ("ZADD", "rq:failed:coursegen") in ops
+    assert ("ZADD", "rq:finished:coursegen") not in ops
+    assert worker[1].get_status(refresh=False) == "failed"
+    assert worker[4] == []  # the task itself records its failure on the row
+
+
+def test_a_timeout_fails_the_job_row(monkeypatch, worker):
+    worker[1].timeout = 0.01
+
+    async def task(job_id, payload):
+        await asyncio.sleep(1)
+
+    ops = _perform(monkeypatch, worker, task)
+    assert ("ZADD", "rq:failed:coursegen") in ops
+    assert worker[4] == [("rq-1", {"status": "failed", "message": "Failed: timed out after 0.01s"})]
+
+
+def test_cancelled_jobs_are_requeued_at_the_front(monkeypatch, worker):
+    w, job, queue, conn, updates = worker
+    monkeypatch.setitem(async_worker.TASKS, TASK, lambda job_id, payload: asyncio.sleep(1))
+
+    async def main():
+        task = asyncio.create_task(w._perform(job, queue))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    ops = conn.ops()
+    assert ops[0] == ("ZREM", "rq:wip:coursegen")
+    assert ops[-1] == ("LPUSH", "rq:queue:coursegen")
+    assert ("ZADD", "rq:failed:coursegen") not in ops
+    assert updates == [("rq-1", {"status": "queued", "message": "Requeued: worker shut down"})]
@@ -0,0 +1,91 @@
+import asyncio
+import httpx
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.db import Base
+from app.models import Book, Chapter, Chunk, MapNote
+from app.services.generate import batch as batch_map
+from app.services.llm import batch_stub, http
+from app.settings import settings
+
+BASE_URL = "http://batch-stub/v1"
+
+
+def _run(tmp_path, steps):
+    async def main():
+        # Route the shared provider client for the stub's URL into the stub app, in process.
+        http._clients[asyncio.get_running_loop()] = {
+            BASE_URL: httpx.AsyncClient(transport=httpx.ASGITransport(app=batch_stub.app), base_url=BASE_URL),
+        }
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/batch.db")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+                book = Book(title="Batch", source_type="txt")
+                session.add(book)
+                await session.flush()
+                for index in (1, 2):
+                    chapter = Chapter(book_id=book.id, index=index, title=f"Chapter {index}")
+                    session.add(chapter)
+                    await session.flush()
+                    session.add_all(
+                        Chunk(chapter_id=chapter.id, chunk_index=i, text=f"Chapter {index}, chunk {i}.")
+                        for i in (1, 2)
+                    )
+                await session.commit()
+                return await steps(session, book.id)
+        finally:
+            await http.aclose_clients()
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+def _setup(monkeypatch, fail_every: int):
+    monkeypatch.setattr(settings, "openai_base_url", BASE_URL)
+    monkeypatch.setattr(settings, "openai_api_key", "stub")
+    monkeypatch.setattr(batch_stub, "FAIL_EVERY", fail_every)
+
+
+async def _submit_and_poll(session, book_id):
+    opts = {"model": "stub-model", "temperature": 0.2}
+    state = await batch_map.submit_map_batch(session, book_id=book_id, chapter_indices=None, **opts)
+    polled = await batch_map.poll_map_batch(session, state, **opts)
+    again = await batch_map.poll_map_batch(session, polled, **opts)
+    cached = (await session.execute(select(func.count()).select_from(MapNote))).scalar_one()
+    return state, polled, again, cached, opts
+
+
+def test_batch_maps_every_chunk_into_the_cache(tmp_path, monkeypatch):
+    _setup(monkeypatch, fail_every=0)
+
+    async def steps(session, book_id):
+        state, polled, _, cached, opts = await _submit_and_poll(session, book_id)
+        resubmit = await batch_map.submit_map_batch(session, book_id=book_id, chapter_indices=None, **opts)
+        return state, polled, cached, resubmit
+
+    state, polled, cached, resubmit = _run(tmp_path, steps)
+    assert state["requests"] == 4
+    assert polled["status"] == "completed"
+    assert (polled["completed"], polled["failed"], polled["stored"]) == (4, 0, 4)
+    assert cached == 4
+    assert resubmit is None  # everything is cached; reduce can start right away
+
+
+def test_partially_failed_batch_caches_only_successes(tmp_path, monkeypatch):
+    _setup(monkeypatch, fail_every=2)
+
+    async def steps(session, book_id):
+        state, polled, again, cached, opts = await _submit_and_poll(session, book_id)
+        monkeypatch.setattr(batch_stub, "FAIL_EVERY", 0)
+        retry = await batch_map.submit_map_batch(session, book_id=book_id, chapter_indices=None, **opts)
+        return state, polled, again, cached, retry
+
+    state, polled, again, cached, retry = _run(tmp_path, steps)
+    assert state["requests"] == 4
+    assert polled["status"] == "completed"
+    assert (polled["completed"], polled["failed"], polled["stored"]) == (2, 2, 2)
+    assert again == polled  # results are ingested once
+    assert cached == 2
+    assert retry["requests"] == 2  # only the failed chunks are submitted again
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.db import Base
+from app.models import Artifact, Book, Chapter, Chunk
+from app.services.generate import engine as gen
+from app.settings import settings
+
+NOTES = {"important_points": ["p"], "concepts": [], "definitions": [], "examples": [], "pitfalls": []}
+OPTIONS = {"difficulty": "intermediate", "tone": "tutor", "length": "short", "include_code": False, "temperature": 0.3}
+
+
+class FakeProvider:
+    name = "openai"
+
+    def __init__(self):
+        self.fail = False
+        self.models: list[str] = []
+        self.finished: list[str] = []
+        self.cancelled: list[str] = []
+
+    async def generate(self, *, system, user, json_schema, params):
+        self.models.append(params["model"])
+        if self.fail and "synthesize a summary" in system:
+            await asyncio.sleep(0.01)
+            raise RuntimeError("summary failed")
+        if "synthesize a quiz" in system:
+            try:
+                await asyncio.sleep(0.3)
+            except asyncio.CancelledError:
+                self.cancelled.append("quiz")
+                raise
+            self.finished.append("quiz")
+        return {"raw_text": json.dumps(NOTES)}
+
+
+def _run(tmp_path, monkeypatch, steps):
+    provider = FakeProvider()
+    monkeypatch.setattr(gen, "_provider", lambda name: provider)
+    monkeypatch.setattr(settings, "llm_stream", False)
+
+    async def main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/engine.db")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        Session = async_sessionmaker(engine, expire_on_commit=False)
+        try:
+            async with Session() as session:
+                book = Book(title="Book", source_type="txt")
+                session.add(book)
+                await session.flush()
+                chapter = Chapter(book_id=book.id, index=1, title="One")
+                session.add(chapter)
+                await session.flush()
+                session.add(Chunk(chapter_id=chapter.id, chunk_index=1, text="Some chapter text."))
+                await session.commit()
+                book_id = book.id
+            return await steps(Session, book_id, provider)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main()), provider
+
+
+def test_failed_reduce_cancels_the_others(tmp_path, monkeypatch):
+    async def steps(Session, book_id, provider):
+        provider.fail = True
+        async with Session() as session:
+            with pytest.raises(RuntimeError, match="summary failed"):
+                await gen.generate_artifacts(
+                    session, book_id=book_id, chapter_index=1, outputs=["summary", "quiz"],
+                    provider_name="openai", model="m", **OPTIONS,
+                )
+        # Nothing may still be running (or writing) once generate_artifacts has raised.
+        await asyncio.sleep(0.4)
+        async with Session() as session:
+            return (await session.execute(select(func.count()).select_from(Artifact))).scalar_one()
+
+    artifacts, provider = _run(tmp_path, monkeypatch, steps)
+    assert provider.cancelled == ["quiz"]
+    assert provider.finished == []
+    assert artifacts == 0
+
+
+def test_reuse_follows_the_configured_default_model(tmp_path, monkeypatch):
+    async def steps(Session, book_id, provider):
+        ids = []
+        for default in ("model-a", "model-a", "model-b"):
+            monkeypatch.setattr(settings, "openai_model", default)
+            async with Session() as session:
+                ids += await gen.generate_artifacts(
+                    session, book_id=book_id, chapter_index=1, outputs=["summary"],
+                    provider_name="openai", model=None, **OPTIONS,
+                )
+        async with Session() as session:
+            models = (await session.execute(select(Artifact.id, Artifact.model).order_by(Artifact.id))).all()
+        return ids, models
+
+    (ids, models), provider = _run(tmp_path, monkeypatch, steps)
+    assert ids[0] == ids[1]  # same default model: reused
+    assert ids[2] != ids[0]  # default model changed: generated again
+    assert [m for _, m in models] == ["model-a", "model-b"]
+    assert set(provider.models) == {"model-a", "model-b"}
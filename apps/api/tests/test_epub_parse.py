@@ -0,0 +1,62 @@
+import os
+import pytest
+from ebooklib import epub
+from app.services.ingest import epub as epub_ingest
+from app.services.ingest.images import ImageSink
+
+SAMPLES = [
+    b"   \n  <p>Leading whitespace</p>",
+    b"<section><p>One</p></section>\n  <section><p>Two</p></section>\n",
+    b"<table><tr><td>a</td>  <td>b</td></tr></table>\n<figure><img src='f.png'/></figure> \t<p>after</p>",
+    b"<p epub:type='chapter'>Namespaced <span epub:type='noteref'>attr</span></p>",
+    b"<p>Before<!-- comment -->after</p>",
+    b"<pre>  keep\n   this  </pre> <textarea>  \n </textarea><p>a&#160;b</p>",
+    b"<template><p>hidden</p><img src='t.png'/></template><p>x<ruby>kan<rt>kan</rt><rp>(</rp></ruby></p>",
+    b"<script>var x = 1;</script><style>p {}</style><p>Text</p>",
+    b"<svg:svg xmlns:svg='http://www.w3.org/2000/svg'><svg:title>Fig</svg:title></svg:svg><p xml:lang='en'>done</p>",
+    b"<p>&nbsp;entity needs the fallback</p>",
+    b"<p><![CDATA[raw <text>]]></p>",
+    b"",
+]
+
+
+@pytest.mark.parametrize("content", SAMPLES)
+def test_lxml_strings_match_soup(content):
+    assert epub_ingest._parse_lxml(content) == epub_ingest._parse_soup(content)
+
+
+def _build_epub(path, sections: int, image: bytes):
+    book = epub.EpubBook()
+    book.set_identifier("parity")
+    book.set_title("Parity")
+    book.add_item(epub.EpubItem(uid="img", file_name="images/fig.png", media_type="image/png", content=image))
+    spine = []
+    for i in range(sections):
+        doc = epub.EpubHtml(title=f"S{i}", file_name=f"text/s{i}.xhtml")
+        doc.content = (
+            f"<html><body>\n  <section epub:type='chapter'><h1>Section {i}</h1>\n"
+            f"<p>Body of section {i}.</p>\n  <figure><img src='../images/fig.png'/></figure>\n"
+            f"<table><tr><td>{i}</td></tr></table>\n   <p>Tail {i}</p></section>\n</body></html>"
+        )
+        book.add_item(doc)
+        spine.append(doc)
+    book.spine = spine
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    epub.write_epub(str(path), book)
+
+
+def test_extract_epub_parsers_agree(tmp_path, monkeypatch):
+    path = tmp_path / "book.epub"
+    _build_epub(path, 12, os.urandom(8 * 1024))
+
+    results = {}
+    for parser in ("lxml", "html.parser"):
+        monkeypatch.setattr(epub_ingest.settings, "epub_parser", parser)
+        sink = ImageSink(str(tmp_path / parser))
+        results[parser] = epub_ingest.extract_epub(str(path), sink, workers=1)
+
+    lxml_out, soup_out = results["lxml"], results["html.parser"]
+    assert lxml_out.text == soup_out.text
+    assert "Section 11" in lxml_out.text
+    assert lxml_out.images and lxml_out.images == soup_out.images
@@ -0,0 +1,70 @@
+import asyncio
+from sqlalchemy import func, select
+from app import db
+from app.models import Job
+from app.routers import books
+from app.workers import coalesce, events, job_state, queue
+
+
+def test_identical_upload_follows_the_in_flight_ingest(monkeypatch):
+    claims: dict[str, str] = {}
+    enqueued = []
+
+    async def claim(request_key, job_id, ttl_s):
+        if request_key not in claims:
+            claims[request_key] = job_id
+            return None
+        return claims[request_key]
+
+    async def release(request_key, job_id):
+        if claims.get(request_key) == job_id:
+            del claims[request_key]
+
+    async def save_upload(file, ext):
+        return f"/uploads/hash{ext}", "hash"
+
+    async def noop(*a, **kw):
+        return None
+
+    class StubQueue:
+        def enqueue(self, func, payload, **kw):
+            enqueued.append(payload)
+
+    monkeypatch.setattr(coalesce, "claim", claim)
+    monkeypatch.setattr(coalesce, "release", release)
+    monkeypatch.setattr(books, "_save_upload", save_upload)
+    monkeypatch.setattr(queue, "get_queue", StubQueue)
+    monkeypatch.setattr(events, "publish", noop)
+    monkeypatch.setattr(job_state, "create", noop)
+    monkeypatch.setattr(job_state, "load", noop)
+
+    class Upload:
+        filename = "book.epub"
+
+    async def upload(title):
+        async with db.SessionLocal() as session:
+            return await books.ingest(file=Upload(), title=title, author=None, force=False, db=session)
+
+    async def main():
+        async with db.engine.begin() as conn:
+            await conn.run_sync(db.Base.metadata.create_all)
+        try:
+            first = await upload("One")
+            second = await upload("Same file, other title")
+            # The first ingest fails; the next upload starts over.
+            await release(next(iter(claims)), first["job_id"])
+            third = await upload("One")
+            async with db.SessionLocal() as session:
+                rows = (await session.execute(select(func.count()).select_from(Job).where(Job.task=="app.workers.tasks.ingest_job"))).scalar_one()
+                await session.execute(Job.__table__.delete())
+                await session.commit()
+            return first, second, third, rows
+        finally:
+            await db.engine.dispose()
+
+    first, second, third, rows = asyncio.run(main())
+    assert first["deduplicated"] is False
+    assert second == {"job_id": first["job_id"], "book_id": None, "deduplicated": True}
+    assert third["deduplicated"] is False and third["job_id"] != first["job_id"]
+    assert rows == 2
+    assert [p["title"] for p in enqueued] == ["One", "One"]
@@ -0,0 +1,59 @@
+import asyncio
+from app import db
+from app.models import Job
+from app.workers import coalesce, events, job_state, tasks
+from app.workers.queue import CLAIM_TTL
+
+
+def _run(monkeypatch, payload, statuses):
+    calls = []
+
+    async def refresh(request_key, job_id, ttl_s):
+        calls.append(("refresh", request_key, ttl_s))
+        return True
+
+    async def release(request_key, job_id):
+        calls.append(("release", request_key))
+
+    async def publish(job_id, event):
+        pass
+
+    async def no_state(job_id, **_):
+        return None  # Redis down: every update writes the row
+
+    monkeypatch.setattr(coalesce, "refresh", refresh)
+    monkeypatch.setattr(coalesce, "release", release)
+    monkeypatch.setattr(events, "publish", publish)
+    monkeypatch.setattr(job_state, "update", no_state)
+
+    async def main():
+        async with db.engine.begin() as conn:
+            await conn.run_sync(db.Base.metadata.create_all)
+        try:
+            async with db.SessionLocal() as session:
+                session.add(Job(id="job-1", task="generate_job", status="queued", payload=payload))
+                await session.commit()
+            for status in statuses:
+                await tasks._update_job("job-1", status=status)
+            await tasks._update_job("job-1", progress=50)
+            async with db.SessionLocal() as session:
+                await session.delete(await session.get(Job, "job-1"))
+                await session.commit()
+        finally:
+            await db.engine.dispose()
+
+    asyncio.run(main())
+    return calls
+
+
+def test_status_changes_refresh_the_claim_until_release(monkeypatch):
+    calls = _run(monkeypatch, {"request_key": "k", "claim_ttl": 99}, ["started", "queued", "started", "finished"])
+    assert calls == [("refresh", "k", 99)] * 3 + [("release", "k")]
+
+
+def test_rows_without_a_stored_ttl_refresh_with_the_default(monkeypatch):
+    assert _run(monkeypatch, {"request_key": "k"}, ["started"]) == [("refresh", "k", CLAIM_TTL)]
+
+
+def test_uncoalesced_jobs_hold_no_claim(monkeypatch):
+    assert _run(monkeypatch, {}, ["started", "finished"]) == []
@@ -0,0 +1,51 @@
+import random
+import fitz
+from app.services.ingest import pdf as pdf_ingest
+from app.services.ingest.images import ImageSink
+
+PAGES = 24
+
+
+def _noise_png(seed: int) -> bytes:
+    # Incompressible pixels, so the image clears MIN_IMAGE_BYTES.
+    data = random.Random(seed).randbytes(120 * 120 * 3)
+    return fitz.Pixmap(fitz.csRGB, 120, 120, data, False).tobytes("png")
+
+
+def _build_pdf(path):
+    doc = fitz.open()
+    shared_xref = 0
+    for i in range(PAGES):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Chapter {i // 4 + 1}, page {i + 1}\nBody text on page {i + 1}.")
+        if i % 5 == 1:  # the same image on pages in different shards
+            rect = fitz.Rect(72, 120, 192, 240)
+            if shared_xref:
+                page.insert_image(rect, xref=shared_xref)
+            else:
+                shared_xref = page.insert_image(rect, stream=_noise_png(1))
+        if i == 13:
+            page.insert_image(fitz.Rect(72, 300, 192, 420), stream=_noise_png(2))
+    doc.set_toc([[1, f"Chapter {c + 1}", c * 4 + 1] for c in range(PAGES // 4)] + [[2, "Section 5.1", 18]])
+    doc.save(str(path))
+    doc.close()
+
+
+def test_parallel_extract_matches_serial(tmp_path, monkeypatch):
+    path = tmp_path / "book.pdf"
+    _build_pdf(path)
+    monkeypatch.setattr(pdf_ingest.settings, "pdf_parallel_min_pages", 1)
+
+    serial = pdf_ingest.extract_pdf(str(path), ImageSink(str(tmp_path / "serial")), workers=1)
+    parallel = pdf_ingest.extract_pdf(str(path), ImageSink(str(tmp_path / "parallel")), workers=3)
+
+    assert serial.text == parallel.text
+    assert serial.page_offsets == parallel.page_offsets
+    assert serial.toc == parallel.toc
+    assert serial.images == parallel.images
+
+    assert len(serial.page_offsets) == PAGES
+    assert len(serial.toc) == PAGES // 4 + 1
+    assert [img["page"] for img in serial.images] == [1, 13]
+    for page, offset in enumerate(serial.page_offsets):
+        assert serial.text[offset:].startswith(f"Chapter {page // 4 + 1}, page {page + 1}")
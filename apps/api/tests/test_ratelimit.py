@@ -0,0 +1,32 @@
+import asyncio
+from app.services.llm import ratelimit
+from app.settings import settings
+
+
+async def _noop(*args, **kwargs):
+    return None
+
+
+def test_limiter_stats_are_per_job(monkeypatch):
+    monkeypatch.setattr(settings, "llm_rate_limit_enabled", True)
+    monkeypatch.setattr(ratelimit, "_limiters", {})
+    limiter = ratelimit.get_limiter("openai", "m")
+    monkeypatch.setattr(limiter, "_acquire", _noop)
+    monkeypatch.setattr(limiter, "_release", _noop)
+
+    async def job(calls: int) -> dict:
+        with ratelimit.track_stats():
+            async def call():
+                async with ratelimit.permit("openai", "m", 10):
+                    await asyncio.sleep(0)
+            await asyncio.gather(*(call() for _ in range(calls)))
+            return ratelimit.limiter_stats()
+
+    async def main():
+        # Two jobs on one process and loop, as under the asyncio worker.
+        return await asyncio.gather(job(2), job(5))
+
+    first, second = asyncio.run(main())
+    assert first["openai:m"]["permits"] == 2
+    assert second["openai:m"]["permits"] == 5
+    assert ratelimit.limiter_stats() == {}
@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.db import Base
+from app.models import Artifact, Book, Chapter, Job
+from app.services.ingest import ingest
+from app.services.ingest.extract_cache import CachedExtract
+
+TEXT = "".join(f"Chapter {i}\n" + "Body text of the chapter. " * 200 + "\n" for i in range(1, 4))
+
+
+def _run(tmp_path, monkeypatch, steps, *, artifact: bool = False, job_status: str | None = None):
+    monkeypatch.setattr(ingest, "load_extract", lambda _: CachedExtract(source_type="txt", text=TEXT, text_is_clean=True))
+
+    async def main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/rechapterize.db")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+                book = Book(title="Book", source_type="txt", content_hash="hash")
+                session.add(book)
+                await session.flush()
+                chapter = Chapter(book_id=book.id, index=1, title="Old", start_offset=0, end_offset=len(TEXT))
+                session.add(chapter)
+                await session.flush()
+                if artifact:
+                    session.add(Artifact(chapter_id=chapter.id, type="summary", content_md="", content_json={},
+                                         provider="openai", model="m", params_hash="p"))
+                if job_status:
+                    session.add(Job(id="gen-1", task=ingest.GENERATION_TASKS[0], status=job_status,
+                                    payload={"book_id": book.id, "chapter_index": 1}))
+                await session.commit()
+                return await steps(session, book)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+async def _chapters(session, book_id):
+    return (await session.execute(select(func.count()).select_from(Chapter).where(Chapter.book_id==book_id))).scalar_one()
+
+
+def test_artifacts_block_rechapterize_without_discard(tmp_path, monkeypatch):
+    async def steps(session, book):
+        book_id = book.id
+        with pytest.raises(RuntimeError, match="1 generated artifacts"):
+            await ingest.rechapterize_book(session, book, min_chapter_chars=100)
+        await session.rollback()
+        return await _chapters(session, book_id)
+
+    assert _run(tmp_path, monkeypatch, steps, artifact=True) == 1
+
+
+def test_discard_artifacts_replaces_chapters(tmp_path, monkeypatch):
+    async def steps(session, book):
+        count = await ingest.rechapterize_book(session, book, min_chapter_chars=100, discard_artifacts=True)
+        artifacts = (await session.execute(select(func.count()).select_from(Artifact))).scalar_one()
+        return count, await _chapters(session, book.id), artifacts
+
+    count, chapters, artifacts = _run(tmp_path, monkeypatch, steps, artifact=True)
+    assert count == chapters == 3
+    assert artifacts == 0
+
+
+@pytest.mark.parametrize("status", ["queued", "started"])
+def test_generation_job_blocks_rechapterize(tmp_path, monkeypatch, status):
+    async def steps(session, book):
+        with pytest.raises(RuntimeError, match="gen-1"):
+            await ingest.rechapterize_book(session, book, min_chapter_chars=100, discard_artifacts=True)
+        return True
+
+    assert _run(tmp_path, monkeypatch, steps, job_status=status)
+
+
+def test_finished_generation_job_does_not_block(tmp_path, monkeypatch):
+    async def steps(session, book):
+        return await ingest.rechapterize_book(session, book, min_chapter_chars=100)
+
+    assert _run(tmp_path, monkeypatch, steps, job_status="finished") == 3
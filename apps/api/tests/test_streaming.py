@@ -0,0 +1,93 @@
+import asyncio
+import httpx
+import pytest
+from tenacity import wait_none
+from app.services.llm.base import StreamStats
+from app.services.llm import streaming
+from app.services.llm.streaming import collect_stream
+from app.services.llm.tokens import count_tokens
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    # Retries happen at once instead of after tenacity's real exponential sleep.
+    monkeypatch.setattr(streaming, "wait_exponential", lambda **_: wait_none())
+
+
+DELTAS = ["Hello", " there,", " this is", " a longer", " streamed", " answer."]
+
+
+class FakeProvider:
+    name = "fake"
+
+    def __init__(self, reported: int | None = None, failures: list[BaseException] | None = None, prose_first: bool = False):
+        self.reported = reported
+        self.failures = list(failures or [])
+        self.prose_first = prose_first
+        self.calls = 0
+        self.open = 0  # streams started and not yet closed (stands in for a permit lease)
+        self.open_at_call: list[int] = []
+
+    async def stream(self, *, system: str, user: str, params: dict, stats: StreamStats):
+        self.calls += 1
+        self.open_at_call.append(self.open)
+        if self.failures:
+            raise self.failures.pop(0)
+        self.open += 1
+        try:
+            if self.prose_first:
+                self.prose_first = False
+                for _ in range(20):
+                    yield "Sure, here is the answer you asked for. "
+            for delta in DELTAS:
+                stats.first_delta()
+                yield delta
+            if self.reported is not None:
+                stats.output_tokens = self.reported
+                stats.usage_reported = True
+        finally:
+            self.open -= 1
+
+
+def _collect(provider, progress_interval: float = 0, expect_json: bool = False):
+    seen: list[int] = []
+
+    async def on_delta(text: str, stats: StreamStats) -> None:
+        seen.append(stats.output_tokens)
+
+    text, stats = asyncio.run(collect_stream(
+        provider, system="s", user="u", params={}, on_delta=on_delta, progress_interval=progress_interval,
+        expect_json=expect_json,
+    ))
+    return text, stats, seen
+
+
+def test_output_tokens_recounted_from_full_text_without_usage(monkeypatch):
+    # Only the first delta falls on a progress tick, so the running estimate is partial.
+    ticks = iter(range(1000, 2000))
+    monkeypatch.setattr(streaming.time, "perf_counter", lambda: next(ticks) / 1000)
+    text, stats, seen = _collect(FakeProvider(), progress_interval=0.5)
+    assert text == "".join(DELTAS)
+    assert seen == [count_tokens(DELTAS[0])]
+    assert stats.output_tokens == count_tokens(text)
+
+
+def test_provider_usage_is_kept():
+    _, stats, _ = _collect(FakeProvider(reported=3))
+    assert stats.output_tokens == 3
+
+
+def test_transient_errors_are_retried():
+    provider = FakeProvider(failures=[httpx.ConnectError("reset")])
+    text, _, _ = _collect(provider)
+    assert text == "".join(DELTAS)
+    assert provider.calls == 2
+
+
+def test_aborted_stream_is_closed_before_the_retry():
+    provider = FakeProvider(prose_first=True)
+    text, _, _ = _collect(provider, expect_json=True)
+    assert text == "".join(DELTAS)
+    assert provider.calls == 2
+    assert provider.open_at_call == [0, 0]  # the aborted stream released its lease first
+    assert provider.open == 0
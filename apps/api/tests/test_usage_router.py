@@ -0,0 +1,37 @@
+import asyncio
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.db import Base
+from app.models import Job
+from app.routers.usage import usage_summary
+
+
+def _usage(calls: int) -> dict:
+    return {"calls": calls, "prompt_tokens": 10 * calls, "completion_tokens": calls, "by_phase": {"map": {"calls": calls}}}
+
+
+def test_usage_filters_jobs_by_book(tmp_path):
+    async def main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/usage.db")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+                db.add_all([
+                    Job(id="a", task="t", payload={"book_id": 1}, usage=_usage(2)),
+                    Job(id="b", task="t", payload={"book_id": 1}, usage=_usage(3)),
+                    Job(id="c", task="t", payload={"book_id": 2}, usage=_usage(7)),
+                    Job(id="d", task="t", payload={"path": "x.pdf"}, usage=_usage(1)),
+                    Job(id="e", task="t", payload={"book_id": 1}, usage=None),
+                ])
+                await db.commit()
+                return await usage_summary(book_id=1, db=db), await usage_summary(db=db)
+        finally:
+            await engine.dispose()
+
+    one, everything = asyncio.run(main())
+    assert one["jobs"] == 2
+    assert one["calls"] == 5
+    assert list(one["by_book"]) == ["1"]
+    assert everything["jobs"] == 4
+    assert everything["calls"] == 13
+    assert everything["by_book"]["2"]["calls"] == 7
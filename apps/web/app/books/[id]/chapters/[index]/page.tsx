@@ -9,6 +9,7 @@ import { ArtifactTabs } from "@/components/artifacts/ArtifactTabs";
 import { useChapters } from "@/lib/hooks/useChapters";
 import { useArtifacts } from "@/lib/hooks/useArtifacts";
 import { useJob } from "@/lib/hooks/useJob";
+import { resumeJob } from "@/lib/api";
 import { ImageGallery } from "@/components/book/ImageGallery";
 import { Separator } from "@/components/ui/separator";
 import { formatNumber } from "@/lib/format";
@@ -28,7 +29,14 @@ export default function ChapterPage() {
   const onJobComplete = useCallback(() => {
     refetchArtifacts();
   }, [refetchArtifacts]);
-  const { job } = useJob(jobId, onJobComplete);
+  const { job, reload } = useJob(jobId, onJobComplete);
+  const onResume = useCallback(async () => {
+    if (!jobId) return;
+    const res = await resumeJob(jobId);
+    // Same job continues from its checkpoint; a different id means an identical job was already running.
+    if (res.job_id === jobId) reload();
+    else setJobId(res.job_id);
+  }, [jobId, reload]);
 
   if (chaptersLoading) {
     return (
@@ -71,7 +79,7 @@ export default function ChapterPage() {
       {/* Job tracker */}
       {job && (
         <div className="mt-4">
-          <JobTracker job={job} />
+          <JobTracker job={job} onResume={onResume} />
         </div>
       )}
 
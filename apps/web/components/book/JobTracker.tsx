@@ -2,12 +2,16 @@
 
 import { motion } from "motion/react";
 import { AnimatedProgress } from "@/components/shared/AnimatedProgress";
-import { Check, Loader2, AlertCircle, Clock } from "lucide-react";
+import { useState } from "react";
+import { Check, Loader2, AlertCircle, Clock, RotateCw } from "lucide-react";
+import { Button } from "@/components/ui/button";
 import { cn } from "@/lib/utils";
 import type { Job } from "@/lib/types";
 
 interface JobTrackerProps {
   job: Job;
+  /** Shown as a Resume button while the job is failed. */
+  onResume?: () => Promise<void>;
 }
 
 const stages = [
@@ -25,9 +29,24 @@ function getActiveStage(job: Job): number {
   return 0;
 }
 
-export function JobTracker({ job }: JobTrackerProps) {
+export function JobTracker({ job, onResume }: JobTrackerProps) {
   const activeStage = getActiveStage(job);
   const isFailed = job.status === "failed";
+  const [resuming, setResuming] = useState(false);
+  const [resumeError, setResumeError] = useState<string | null>(null);
+
+  const handleResume = async () => {
+    if (!onResume) return;
+    setResuming(true);
+    setResumeError(null);
+    try {
+      await onResume();
+    } catch (e) {
+      setResumeError(e instanceof Error ? e.message : "Resume failed");
+    } finally {
+      setResuming(false);
+    }
+  };
 
   return (
     <motion.div
@@ -98,7 +117,16 @@ export function JobTracker({ job }: JobTrackerProps) {
             job.message || "Waiting..."
           )}
         </span>
-        <span className="text-xs text-text-tertiary font-mono">{job.progress}%</span>
+        <span className="flex items-center gap-3">
+          {resumeError && <span className="text-xs text-error">{resumeError}</span>}
+          {isFailed && onResume && (
+            <Button onClick={handleResume} disabled={resuming} size="xs" variant="outline" className="gap-1">
+              {resuming ? <Loader2 className="animate-spin" /> : <RotateCw />}
+              Resume
+            </Button>
+          )}
+          <span className="text-xs text-text-tertiary font-mono">{job.progress}%</span>
+        </span>
       </div>
     </motion.div>
   );
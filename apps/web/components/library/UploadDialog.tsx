@@ -1,6 +1,6 @@
 "use client";
 
-import { useState } from "react";
+import { useState, useCallback, useEffect } from "react";
 import {
   Dialog,
   DialogContent,
@@ -11,9 +11,11 @@ import {
 import { Button } from "@/components/ui/button";
 import { Input } from "@/components/ui/input";
 import { Label } from "@/components/ui/label";
+import { Checkbox } from "@/components/ui/checkbox";
 import { Plus, Loader2 } from "lucide-react";
 import { UploadDropzone } from "./UploadDropzone";
 import { ingestBook } from "@/lib/api";
+import { useJob } from "@/lib/hooks/useJob";
 
 interface UploadDialogProps {
   onSuccess: () => void;
@@ -24,16 +26,38 @@ export function UploadDialog({ onSuccess }: UploadDialogProps) {
   const [file, setFile] = useState<File | null>(null);
   const [title, setTitle] = useState("");
   const [author, setAuthor] = useState("");
+  const [force, setForce] = useState(false);
   const [busy, setBusy] = useState(false);
   const [error, setError] = useState<string | null>(null);
+  const [jobId, setJobId] = useState<string | null>(null);
 
   const reset = () => {
     setFile(null);
     setTitle("");
     setAuthor("");
+    setForce(false);
     setError(null);
+    setJobId(null);
   };
 
+  // Ingestion runs on the worker; wait for the job before refreshing the library.
+  const onJobComplete = useCallback(() => setBusy(false), []);
+  const { job, clear: clearJob } = useJob(jobId, onJobComplete);
+
+  useEffect(() => {
+    if (!job) return;
+    if (job.status === "finished") {
+      clearJob();
+      reset();
+      setOpen(false);
+      onSuccess();
+    } else if (job.status === "failed") {
+      clearJob();
+      setError(job.message || "Ingestion failed");
+      setJobId(null);
+    }
+  }, [job, clearJob, onSuccess]);
+
   const handleSubmit = async () => {
     if (!file) return;
     setBusy(true);
@@ -43,13 +67,19 @@ export function UploadDialog({ onSuccess }: UploadDialogProps) {
       form.append("file", file);
       if (title) form.append("title", title);
       if (author) form.append("author", author);
-      await ingestBook(form);
-      reset();
-      setOpen(false);
-      onSuccess();
+      if (force) form.append("force", "true");
+      const res = await ingestBook(form);
+      if (res.deduplicated || !res.job_id) {
+        // Same file was already ingested; the existing book is reused.
+        setBusy(false);
+        reset();
+        setOpen(false);
+        onSuccess();
+        return;
+      }
+      setJobId(res.job_id);
     } catch (e) {
       setError(e instanceof Error ? e.message : "Upload failed");
-    } finally {
       setBusy(false);
     }
   };
@@ -101,6 +131,20 @@ export function UploadDialog({ onSuccess }: UploadDialogProps) {
             />
           </div>
 
+          <div className="flex items-center gap-2">
+            <Checkbox
+              id="force"
+              checked={force}
+              onCheckedChange={(v) => setForce(!!v)}
+            />
+            <Label
+              htmlFor="force"
+              className="text-sm text-text-secondary cursor-pointer"
+            >
+              Re-ingest even if this file was uploaded before
+            </Label>
+          </div>
+
           {error && (
             <p className="text-sm text-error">{error}</p>
           )}
@@ -111,7 +155,7 @@ export function UploadDialog({ onSuccess }: UploadDialogProps) {
             className="w-full"
           >
             {busy && <Loader2 className="w-4 h-4 mr-2 animate-spin" />}
-            {busy ? "Ingesting..." : "Ingest Book"}
+            {busy ? (job?.message && job.status === "started" ? `${job.message}...` : "Ingesting...") : "Ingest Book"}
           </Button>
         </div>
       </DialogContent>
@@ -6,6 +6,7 @@ import type {
   Job,
   GenerateRequest,
   GenerateResponse,
+  IngestResponse,
   ProvidersResponse,
   FlashcardReviewState,
   DeckStats,
@@ -46,8 +47,8 @@ export function getBooks(signal?: AbortSignal): Promise<Book[]> {
   return request<Book[]>("/books", undefined, signal);
 }
 
-export function ingestBook(form: FormData, signal?: AbortSignal): Promise<Book> {
-  return request<Book>("/books/ingest", { method: "POST", body: form }, signal);
+export function ingestBook(form: FormData, signal?: AbortSignal): Promise<IngestResponse> {
+  return request<IngestResponse>("/books/ingest", { method: "POST", body: form }, signal);
 }
 
 // ─── Chapters ───
@@ -90,6 +91,16 @@ export function getJob(jobId: string, signal?: AbortSignal): Promise<Job> {
   return request<Job>(`/jobs/${jobId}`, undefined, signal);
 }
 
+/** Run a failed generation job again from its checkpoint. May return another (identical, running) job's id. */
+export function resumeJob(jobId: string): Promise<GenerateResponse> {
+  return request<GenerateResponse>(`/jobs/${jobId}/resume`, { method: "POST" });
+}
+
+/** Server-sent events for a job; each "job" event is a JobEvent. */
+export function jobEventsUrl(jobId: string): string {
+  return `${API_BASE}/jobs/${jobId}/events`;
+}
+
 // ─── Flashcards SRS ───
 
 function getUserTz(): string {
@@ -1,7 +1,23 @@
 "use client";
 import { useEffect, useState, useCallback, useRef } from "react";
-import type { Job } from "@/lib/types";
-import { getJob } from "@/lib/api";
+import type { Job, JobEvent } from "@/lib/types";
+import { getJob, jobEventsUrl } from "@/lib/api";
+
+function isDone(job: Job): boolean {
+  return job.status === "finished" || job.status === "failed";
+}
+
+function applyEvent(job: Job, event: JobEvent): Job {
+  return {
+    ...job,
+    status: event.status ?? job.status,
+    progress: event.progress ?? job.progress,
+    message: event.message ?? job.message,
+    payload: event.payload ? { ...job.payload, ...event.payload } : job.payload,
+    usage: event.usage ?? job.usage,
+    updated_at: event.ts ? new Date(event.ts * 1000).toISOString() : job.updated_at,
+  };
+}
 
 export function useJob(
   jobId: string | null,
@@ -9,6 +25,8 @@ export function useJob(
 ) {
   const [job, setJob] = useState<Job | null>(null);
   const [error, setError] = useState<string | null>(null);
+  // Bumped by reload() to follow the same job again, e.g. after it was resumed.
+  const [generation, setGeneration] = useState(0);
   const onCompleteRef = useRef(onComplete);
   onCompleteRef.current = onComplete;
 
@@ -17,20 +35,24 @@ export function useJob(
     setError(null);
   }, []);
 
+  const reload = useCallback(() => setGeneration((g) => g + 1), []);
+
   useEffect(() => {
     if (!jobId) return;
 
     setError(null);
     let timer: ReturnType<typeof setTimeout>;
+    let source: EventSource | null = null;
     let cancelled = false;
 
+    // Fallback when the event stream is unavailable.
     async function poll() {
       if (cancelled) return;
       try {
         const data = await getJob(jobId!);
         if (cancelled) return;
         setJob(data);
-        if (data.status === "finished" || data.status === "failed") {
+        if (isDone(data)) {
           onCompleteRef.current?.();
           return;
         }
@@ -41,12 +63,47 @@ export function useJob(
       }
     }
 
-    poll();
+    async function subscribe() {
+      let current: Job;
+      try {
+        current = await getJob(jobId!);
+      } catch {
+        if (!cancelled) timer = setTimeout(poll, 2000);
+        return;
+      }
+      if (cancelled) return;
+      setJob(current);
+      if (isDone(current)) {
+        onCompleteRef.current?.();
+        return;
+      }
+
+      // Events replay from the start, so applying them over the snapshot converges on the live state.
+      source = new EventSource(jobEventsUrl(jobId!));
+      source.addEventListener("job", (e) => {
+        if (cancelled) return;
+        current = applyEvent(current, JSON.parse((e as MessageEvent).data) as JobEvent);
+        setJob(current);
+        if (isDone(current)) {
+          source?.close();
+          onCompleteRef.current?.();
+        }
+      });
+      source.onerror = () => {
+        // EventSource retries by itself; it only gives up (CLOSED) on hard errors.
+        if (source?.readyState === EventSource.CLOSED && !cancelled && !isDone(current)) {
+          timer = setTimeout(poll, 1200);
+        }
+      };
+    }
+
+    subscribe();
     return () => {
       cancelled = true;
       clearTimeout(timer);
+      source?.close();
     };
-  }, [jobId]);
+  }, [jobId, generation]);
 
-  return { job, error, clear };
+  return { job, error, clear, reload };
 }
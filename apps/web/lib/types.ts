@@ -43,6 +43,7 @@ export interface Artifact {
   model: string;
   params_hash: string;
   version: number;
+  usage: Usage | null;
   created_at: string;
 }
 
@@ -149,8 +150,42 @@ export interface Job {
   progress: number;
   message: string | null;
   payload: Record<string, unknown>;
+  usage: Usage | null;
   created_at: string;
   updated_at: string;
+  started_at: string | null;
+  finished_at: string | null;
+}
+
+/** One update from /jobs/{id}/events; only the fields that changed are present. */
+export interface JobEvent {
+  status?: JobStatus;
+  progress?: number;
+  message?: string;
+  /** Merged into Job.payload. */
+  payload?: Record<string, unknown>;
+  usage?: Usage;
+  /** Unix seconds; absent on the one-off snapshot sent for jobs without stored events. */
+  ts?: number;
+}
+
+/** Provider calls (tokens, latency, retries, cost) behind a job or artifact. */
+export interface UsageTotals {
+  calls: number;
+  prompt_tokens: number;
+  completion_tokens: number;
+  total_tokens: number;
+  estimated_calls: number;
+  latency_ms: number;
+  avg_latency_ms: number;
+  retries: number;
+  cost_usd: number;
+}
+
+export interface Usage extends UsageTotals {
+  by_phase: Record<string, UsageTotals>;
+  /** Artifacts only: the chapter's map/merge calls, shared with sibling artifacts of the same run. */
+  shared?: UsageTotals;
 }
 
 // ─── API Request / Response ───
@@ -166,6 +201,8 @@ export interface GenerateRequest {
   provider?: string;
   model?: string;
   temperature?: number;
+  /** Sample again instead of reusing an identical existing artifact. */
+  fresh?: boolean;
 }
 
 export interface Provider {
@@ -180,6 +217,14 @@ export interface ProvidersResponse {
 
 export interface GenerateResponse {
   job_id: string;
+  /** True when an identical request was already queued or running; job_id is that job. */
+  deduplicated: boolean;
+}
+
+export interface IngestResponse {
+  job_id: string | null;
+  book_id: number | null;
+  deduplicated: boolean;
 }
 
 export interface ExportResponse {
@@ -1,4 +1,6 @@
+import json
 import os
+import time
 import typer
 import requests
 from rich import print
@@ -7,19 +9,83 @@ app = typer.Typer(help="CourseGen CLI")
 
 API_BASE = os.environ.get("COURSEGEN_API_BASE", "http://localhost:8000")
 
+def _follow_events(job_id: str) -> str | None:
+    """Print progress from the job's event stream until it ends; returns the last line printed."""
+    last = None
+    status = message = None
+    progress = 0
+    # Read timeout well above the server's 15s keep-alive.
+    with requests.get(f"{API_BASE}/jobs/{job_id}/events", stream=True, timeout=(10, 60)) as r:
+        if r.status_code >= 400:
+            return None
+        for raw in r.iter_lines(decode_unicode=True):
+            if not raw or not raw.startswith("data:"):
+                continue
+            event = json.loads(raw[5:])
+            status = event.get("status", status)
+            progress = event.get("progress", progress)
+            message = event.get("message", message)
+            line = f"[{progress:>3}%] {message or status}"
+            if line != last:
+                print(line)
+                last = line
+            if status in ("finished", "failed"):
+                break
+    return last
+
+def _wait_for_job(job_id: str, interval: float = 1.5) -> dict:
+    try:
+        last = _follow_events(job_id)
+    except requests.RequestException:
+        last = None  # fall back to polling
+    while True:
+        r = requests.get(f"{API_BASE}/jobs/{job_id}", timeout=60)
+        if r.status_code >= 400:
+            raise typer.Exit(r.text)
+        job = r.json()
+        line = f"[{job['progress']:>3}%] {job.get('message') or job['status']}"
+        if line != last:
+            print(line)
+            last = line
+        if job["status"] in ("finished", "failed"):
+            return job
+        time.sleep(interval)
+
 @app.command()
-def ingest(path: str, title: str = "", author: str = ""):
-    """Ingest a book file (PDF/EPUB/TXT/MD)."""
+def ingest(path: str, title: str = "", author: str = "", wait: bool = True, force: bool = False):
+    """Ingest a book file (PDF/EPUB/TXT/MD). Re-uploads of an already ingested file are reused unless --force."""
     if not os.path.exists(path):
         raise typer.BadParameter("File not found")
     files = {"file": open(path, "rb")}
     data = {}
     if title: data["title"] = title
     if author: data["author"] = author
+    if force: data["force"] = "true"
     r = requests.post(f"{API_BASE}/books/ingest", files=files, data=data, timeout=600)
     if r.status_code >= 400:
         raise typer.Exit(r.text)
-    print(r.json())
+    out = r.json()
+    print(out)
+    if wait and out.get("job_id"):
+        job = _wait_for_job(out["job_id"])
+        if job["status"] == "failed":
+            raise typer.Exit(1)
+        print({"book_id": job["payload"].get("book_id")})
+
+@app.command()
+def rechapterize(book_id: int, min_chapter_chars: int = 2000, strategy: str = "", discard_artifacts: bool = False, wait: bool = True):
+    """Re-detect chapters for a book from its cached extraction (no re-upload)."""
+    payload = {"min_chapter_chars": min_chapter_chars, "discard_artifacts": discard_artifacts}
+    if strategy: payload["strategy"] = strategy
+    r = requests.post(f"{API_BASE}/books/{book_id}/rechapterize", json=payload, timeout=60)
+    if r.status_code >= 400:
+        raise typer.Exit(r.text)
+    out = r.json()
+    print(out)
+    if wait:
+        job = _wait_for_job(out["job_id"])
+        if job["status"] == "failed":
+            raise typer.Exit(1)
 
 @app.command()
 def books():
@@ -36,8 +102,8 @@ def chapters(book_id: int):
 @app.command()
 def generate(book_id: int, chapter: int, summary: bool = True, quiz: bool = False, lab: bool = False, takeaways: bool = True,
              difficulty: str = "intermediate", tone: str = "tutor", length: str = "medium",
-             provider: str = "", model: str = "", temperature: float = 0.3):
-    """Enqueue generation job for a chapter."""
+             provider: str = "", model: str = "", temperature: float = 0.3, fresh: bool = False):
+    """Enqueue generation job for a chapter. Identical earlier artifacts are reused unless --fresh."""
     outputs = []
     if summary: outputs.append("summary")
     if quiz: outputs.append("quiz")
@@ -56,18 +122,78 @@ def generate(book_id: int, chapter: int, summary: bool = True, quiz: bool = Fals
     }
     if provider: payload["provider"] = provider
     if model: payload["model"] = model
+    if fresh: payload["fresh"] = True
 
     r = requests.post(f"{API_BASE}/generate", json=payload, timeout=60)
     if r.status_code >= 400:
         raise typer.Exit(r.text)
     print(r.json())
 
+@app.command("generate-book")
+def generate_book(book_id: int, chapters: str = "", summary: bool = True, quiz: bool = False, lab: bool = False, takeaways: bool = True,
+                  difficulty: str = "intermediate", tone: str = "tutor", length: str = "medium",
+                  provider: str = "", model: str = "", temperature: float = 0.3, fresh: bool = False, batch: bool = False, wait: bool = True):
+    """Enqueue one generation job for a whole book (or --chapters 1,2,5); --batch maps via the OpenAI Batch API."""
+    outputs = []
+    if summary: outputs.append("summary")
+    if quiz: outputs.append("quiz")
+    if lab: outputs.append("lab")
+    if takeaways: outputs.append("takeaways")
+
+    payload = {
+        "book_id": book_id,
+        "outputs": outputs,
+        "difficulty": difficulty,
+        "tone": tone,
+        "length": length,
+        "include_code": True,
+        "temperature": temperature,
+        "fresh": fresh,
+    }
+    if chapters: payload["chapter_indices"] = [int(c) for c in chapters.split(",") if c.strip()]
+    if provider: payload["provider"] = provider
+    if model: payload["model"] = model
+
+    r = requests.post(f"{API_BASE}/generate/{'batch' if batch else 'book'}", json=payload, timeout=60)
+    if r.status_code >= 400:
+        raise typer.Exit(r.text)
+    out = r.json()
+    print(out)
+    if wait:
+        # Batch jobs can take hours; there is nothing to watch closely until the batch completes.
+        job = _wait_for_job(out["job_id"], interval=30 if batch else 1.5)
+        for index, ch in sorted((job["payload"].get("chapters") or {}).items(), key=lambda kv: int(kv[0])):
+            print(f"chapter {index}: {ch['status']} {ch.get('artifact_ids') or ch.get('error') or ''}")
+        if job["status"] == "failed":
+            raise typer.Exit(1)
+
+@app.command()
+def resume(job_id: str, wait: bool = True):
+    """Resume a failed generation job from its checkpoint (finished calls are not repeated)."""
+    r = requests.post(f"{API_BASE}/jobs/{job_id}/resume", timeout=60)
+    if r.status_code >= 400:
+        raise typer.Exit(r.text)
+    out = r.json()
+    print(out)
+    if wait:
+        job = _wait_for_job(out["job_id"])
+        if job["status"] == "failed":
+            raise typer.Exit(1)
+
 @app.command()
 def artifacts(chapter_id: int):
     """List artifacts for a chapter."""
     r = requests.get(f"{API_BASE}/artifacts/by-chapter/{chapter_id}", timeout=60)
     print(r.json())
 
+@app.command()
+def usage(book_id: int = 0):
+    """Token, latency and cost totals (optionally for one book)."""
+    r = requests.get(f"{API_BASE}/usage", params={"book_id": book_id} if book_id else None, timeout=60)
+    if r.status_code >= 400:
+        raise typer.Exit(r.text)
+    print(r.json())
+
 @app.command()
 def export(artifact_id: int, fmt: str = "md"):
     """Export an artifact (md/json)."""